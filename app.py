@@ -1,44 +1,39 @@
 import streamlit as st
 import os
-import io
-import base64
-from PIL import Image
-import requests
-import json
-from dotenv import load_dotenv
 import time
-from openai import AzureOpenAI
+from dotenv import load_dotenv
 
-# Load environment variables
+# Load environment variables before the modules below read their settings
 load_dotenv()
 
-# Azure OpenAI for Image Generation
-IMAGEGEN_AOAI_RESOURCE = os.getenv("IMAGEGEN_AOAI_RESOURCE", "eduar-ma108754-westus3")
-IMAGEGEN_DEPLOYMENT = os.getenv("IMAGEGEN_DEPLOYMENT", "gpt-image-1")
-IMAGEGEN_AOAI_API_KEY = os.getenv("IMAGEGEN_AOAI_API_KEY", "")
+from generation import generate_variations
+from tiling import generate_tiled, needs_tiles
+from history import get_history_store, run_recorded
+from presets import get_preset_prompts
+from metrics import get_metrics, start_metrics_server
+from jobs import DONE, FAILED, QUEUED, QueueFullError, get_job_queue
+from result_cache import get_result_cache
+from coalesce import get_single_flight
+from transport import get_transport
+from deployments import get_deployment_pool
+from upload_cache import UploadCache
+from image_workers import ImageWorkersBusyError, get_image_executor
 
-# Azure OpenAI for LLM
-LLM_AOAI_RESOURCE = os.getenv("LLM_AOAI_RESOURCE", "ai-trainpoc7039ai740971184368")
-LLM_DEPLOYMENT = os.getenv("LLM_DEPLOYMENT", "gpt-4.1-mini")
-LLM_AOAI_API_KEY = os.getenv("LLM_AOAI_API_KEY", "")
+# Default for "Parallel variations": fan "Number of Results" out into parallel single-image requests
+FANOUT_DEFAULT = os.getenv("IMAGEGEN_FANOUT", "false").lower() in ("1", "true", "yes")
 
-# Initialize Azure OpenAI client
-aoai_client = AzureOpenAI(
-    azure_endpoint=f"https://{IMAGEGEN_AOAI_RESOURCE}.openai.azure.com/",
-    api_version="2025-04-01-preview",
-    api_key=IMAGEGEN_AOAI_API_KEY,
-)
+# Seconds between Results column refreshes while a job is in flight
+JOB_POLL_INTERVAL = float(os.getenv("IMAGEGEN_JOB_POLL_INTERVAL", "1"))
 
-# Set page configuration
-st.set_page_config(
-    page_title="Image Manipulation Studio",
-    page_icon="🎨",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# Entries per page of the History gallery
+HISTORY_PAGE_SIZE = 12
+HISTORY_COLUMNS = 4
+
+# Default for "Debug mode": show the last API response, with image data elided
+DEBUG_DEFAULT = os.getenv("IMAGEGEN_DEBUG", "false").lower() in ("1", "true", "yes")
 
 # Custom CSS
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main {
         padding: 1rem;
@@ -96,210 +91,127 @@ st.markdown("""
         }
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-def generate_image(prompt, image_path=None, mask_path=None, size="1024x1024", n=1, quality="high"):
-    """Generate or edit an image using Azure OpenAI's image generation service"""
-    try:
-        if image_path:
-            # Validate image format
-            img = Image.open(image_path)
-            if img.format != "PNG":
-                img = img.convert("RGB")
-                temp_path = f"temp_converted_{os.path.basename(image_path)}.png"
-                img.save(temp_path, "PNG")
-                image_path = temp_path
-            
-            # Prepare files and data for multipart/form-data
-            files = {
-                "image": (os.path.basename(image_path), open(image_path, "rb"), "image/png")
-            }
-            data = {
-                "prompt": prompt,
-                "model": "gpt-image-1",
-                "size": size,
-                "n": str(n),  # Convert to string for form-data
-                "quality": quality
-            }
-            
-            if mask_path:
-                # Validate mask format
-                mask_img = Image.open(mask_path)
-                if mask_img.format != "PNG":
-                    mask_img = mask_img.convert("RGB")
-                    temp_mask_path = f"temp_converted_{os.path.basename(mask_path)}.png"
-                    mask_img.save(temp_mask_path, "PNG")
-                    mask_path = temp_mask_path
-                
-                files["mask"] = (os.path.basename(mask_path), open(mask_path, "rb"), "image/png")
-            
-            # Image editing or inpainting
-            url = f"https://{IMAGEGEN_AOAI_RESOURCE}.openai.azure.com/openai/deployments/{IMAGEGEN_DEPLOYMENT}/images/edits?api-version=2025-04-01-preview"
-            headers = {"api-key": IMAGEGEN_AOAI_API_KEY}
-            response = requests.post(url, headers=headers, files=files, data=data)
-            
-            # Check for error and log details
-            if response.status_code != 200:
-                error_detail = response.json().get("error", {})
-                st.error(f"API Error: {response.status_code} - {error_detail.get('message', 'No details provided')}")
-                return None
-            
-            # Log the raw API response for debugging
-            response_json = response.json()
-            st.write("API Response:", response_json)
-            
-            # Check if 'data' exists and is not empty
-            if "data" not in response_json or not response_json["data"]:
-                st.error("No images returned by the API. 'data' field is empty or missing.")
-                return None
-            
-            images_data = response_json["data"]
-            image_list = []
-            
-            for idx, img in enumerate(images_data):
-                if "b64_json" in img:
-                    # Handle base64-encoded image data
-                    try:
-                        image_bytes = base64.b64decode(img["b64_json"])
-                        image_list.append(Image.open(io.BytesIO(image_bytes)))
-                    except Exception as e:
-                        st.error(f"Failed to decode base64 image data for item {idx}: {str(e)}")
-                        continue
-                elif "url" in img:
-                    # Handle URL-based image
-                    try:
-                        img_response = requests.get(img["url"], timeout=10)
-                        img_response.raise_for_status()
-                        image_list.append(Image.open(io.BytesIO(img_response.content)))
-                    except requests.exceptions.RequestException as e:
-                        st.error(f"Failed to download image from URL {img['url']}: {str(e)}")
-                        continue
-                else:
-                    st.error(f"No 'b64_json' or 'url' found in API response data item {idx}.")
-                    continue
-            
-            if not image_list:
-                st.error("No images were successfully processed.")
-                return None
-            
-            return image_list
-        else:
-            # Text-to-image generation using SDK
-            result = aoai_client.images.generate(
-                model=IMAGEGEN_DEPLOYMENT,
-                prompt=prompt,
-                n=n,
-                quality=quality,
-                size=size,
-                output_format="png",
-            )
-            
-            # Log the raw API response for debugging
-            result_json = result.model_dump()
-            st.write("API Response (Text-to-Image):", result_json)
-            
-            images_data = result_json["data"]
-            if not images_data:
-                st.error("No images returned by the API (Text-to-Image). 'data' field is empty.")
-                return None
-            
-            image_list = []
-            
-            for idx, img in enumerate(images_data):
-                if "b64_json" not in img:
-                    st.error(f"No base64 data found in API response data item {idx} (Text-to-Image).")
-                    continue
-                image_bytes = base64.b64decode(img["b64_json"])
-                image_list.append(Image.open(io.BytesIO(image_bytes)))
-            
-            if not image_list:
-                st.error("No images were successfully processed (Text-to-Image).")
-                return None
-            
-            return image_list
-            
-    except Exception as e:
-        st.error(f"Error generating image: {str(e)}")
-        return None
+def setup_page():
+    """Set the page configuration and inject the custom CSS; must run first in each script run"""
+    st.set_page_config(
+        page_title="Image Manipulation Studio",
+        page_icon="🎨",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
-def save_uploaded_file(uploaded_file):
-    """Save an uploaded file to disk and return the file path"""
-    try:
-        file_path = f"temp_{uploaded_file.name}"
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        return file_path
-    except Exception as e:
-        st.error(f"Error saving file: {str(e)}")
-        return None
+def show_diagnostics():
+    """Recent API request traces and metric summaries; the last response only in debug mode"""
+    metrics = get_metrics()
+    traces = metrics.recent_traces()
+    debug = st.checkbox("Debug mode", value=DEBUG_DEFAULT, help="Show the last API response with image data elided")
+    if traces:
+        st.markdown("**Recent requests**")
+        st.dataframe([{key: value for key, value in trace.items() if key != "response"} for trace in traces])
+    else:
+        st.caption("No API requests yet.")
+    if debug and traces and "response" in traces[0]:
+        st.markdown("**Last response**")
+        st.json(traces[0]["response"])
+    st.markdown("**Metrics**")
+    st.json(metrics.summary(), expanded=False)
 
-def validate_mask(mask_path, target_dimensions):
-    """Validate, binarize, resize, and make white areas transparent in the mask"""
+def get_upload_cache():
+    """This session's cache of prepared uploads; kept in session state so it goes away with the session"""
+    if "upload_cache" not in st.session_state:
+        st.session_state.upload_cache = UploadCache()
+    return st.session_state.upload_cache
+
+def validate_mask(mask_file, image):
+    """Validate, binarize, resize, and make white areas transparent in the mask, once per upload.
+
+    Returns a PreparedMask with the processed ImageInput, or None after
+    showing the reason it was rejected.
+    """
     try:
-        mask = Image.open(mask_path).convert("L")  # Convert to grayscale
-        # Binarize the mask: pixels < 128 become 0 (black), >= 128 become 255 (white)
-        mask = mask.point(lambda p: 255 if p >= 128 else 0, mode="1")
-        
-        # Resize mask to match target dimensions
-        if mask.size != target_dimensions:
-            mask = mask.resize(target_dimensions, Image.Resampling.NEAREST)  # Use NEAREST to preserve binary values
-        
-        # Convert white areas to transparent (alpha=0)
-        mask_rgba = Image.new("RGBA", mask.size, (0, 0, 0, 255))  # Start with fully opaque black
-        mask_data = mask.getdata()
-        new_data = [(0, 0, 0, 0) if p == 255 else (0, 0, 0, 255) for p in mask_data]  # White -> transparent, Black -> opaque
-        mask_rgba.putdata(new_data)
-        
-        # Save the processed mask
-        binarized_path = f"temp_binarized_{os.path.basename(mask_path)}"
-        mask_rgba.save(binarized_path, "PNG")
-        return binarized_path
-    except Exception as e:
-        st.error(f"Error processing mask: {str(e)}")
+        prepared = get_upload_cache().mask(mask_file.file_id, mask_file.getbuffer(), image)
+    except ImageWorkersBusyError as e:
+        st.error(str(e))
         return None
+    if prepared.error:
+        st.error(prepared.error)
+        return None
+    return prepared
 
-def get_preset_prompts():
-    """Return a list of preset prompts for common image manipulations"""
-    return {
-        "Inpainting Changes": [
-            {"name": "Replace with Tree", "prompt": "Replace the masked region with a detailed tree, blending naturally with the scene"},
-            {"name": "Change to Blue Shirt", "prompt": "Change the masked region to a blue shirt, matching the lighting and style"},
-            {"name": "Add Flower", "prompt": "Add a vibrant flower in the masked region, blending with the surroundings"},
-            {"name": "Replace with Sky", "prompt": "Replace the masked region with a clear blue sky with fluffy clouds"},
-            {"name": "Remove Object", "prompt": "Remove the masked region and fill it with a seamless background matching the surroundings"}
-        ],
-        "Style Transfers": [
-            {"name": "Oil Painting", "prompt": "Transform the image into an oil painting style with rich textures and vibrant colors"},
-            {"name": "Watercolor", "prompt": "Convert the image to a delicate watercolor painting with soft edges and translucent hues"},
-            {"name": "Anime Style", "prompt": "Redraw the image in a Japanese anime style with bold outlines and expressive colors"},
-            {"name": "Cyberpunk", "prompt": "Apply a cyberpunk aesthetic with neon colors and futuristic elements"},
-            {"name": "Vintage Photo", "prompt": "Make the image look like a vintage photograph with sepia tones and grainy texture"}
-        ],
-        "Lighting Changes": [
-            {"name": "Sunset Glow", "prompt": "Apply warm sunset lighting with golden hues and soft shadows"},
-            {"name": "Moonlit Night", "prompt": "Change the lighting to a cool, moonlit night with blue tones and subtle glow"},
-            {"name": "Studio Lighting", "prompt": "Use professional studio lighting with even illumination and minimal shadows"},
-            {"name": "Dramatic Spotlight", "prompt": "Add a dramatic spotlight effect focusing on the main subject"},
-            {"name": "Foggy Morning", "prompt": "Apply soft, diffused lighting like a foggy morning with muted colors"}
-        ],
-        "Composition Changes": [
-            {"name": "Add Beach Ball", "prompt": "Add a colorful beach ball in the center of the image, blending naturally with the scene"},
-            {"name": "Expand Background", "prompt": "Extend the background to include a wider landscape, matching the original style"},
-            {"name": "Add People", "prompt": "Include a group of people in the background, interacting naturally with the environment"},
-            {"name": "Remove Objects", "prompt": "Remove any distracting objects from the background, keeping the main subject intact"},
-            {"name": "Change Setting", "prompt": "Place the main subject in a new setting, such as a bustling city street"}
-        ],
-        "Background Changes": [
-            {"name": "White Background", "prompt": "Place the main subject on a clean white background"},
-            {"name": "Nature Scene", "prompt": "Replace the background with a lush forest scene and soft natural light"},
-            {"name": "Urban Skyline", "prompt": "Set the background to a modern city skyline at dusk"},
-            {"name": "Abstract Gradient", "prompt": "Use a smooth blue-to-purple gradient background"},
-            {"name": "Transparent", "prompt": "Isolate the main subject on a transparent background"}
-        ]
-    }
+@st.fragment
+def show_history():
+    """Page through past generations by thumbnail; only the entry opened loads its full images"""
+    store = get_history_store()
+    if store is None:
+        st.caption("History is turned off (IMAGEGEN_HISTORY_DIR is empty).")
+        return
+    filter_col, search_col = st.columns(2)
+    mode = filter_col.selectbox("Mode", ["All", "Image Editing", "Inpainting (Mask)", "Text to Image"], key="history_mode")
+    search = search_col.text_input("Search prompts", key="history_search")
+    mode = None if mode == "All" else mode
+    total = store.count(mode, search)
+    if not total:
+        st.caption("No generations yet.")
+        return
+    pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    page = min(st.session_state.get("history_page", 0), pages - 1)
+    prev_col, label_col, next_col = st.columns([1, 3, 1])
+    if prev_col.button("Newer", disabled=page == 0, key="history_newer"):
+        page -= 1
+    if next_col.button("Older", disabled=page >= pages - 1, key="history_older"):
+        page += 1
+    st.session_state.history_page = page
+    label_col.caption(f"Page {page + 1} of {pages} ({total} generations)")
+    
+    # Thumbnails are small JPEGs made when the result was recorded
+    cols = st.columns(HISTORY_COLUMNS)
+    for i, entry in enumerate(store.page(page * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE, mode, search)):
+        with cols[i % HISTORY_COLUMNS]:
+            if entry["outputs"]:
+                st.image(store.thumbnail(entry["outputs"][0]["digest"]), use_container_width=True)
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["created"]))
+            st.caption(f"{created} · {entry['mode']} · {entry['prompt'][:60]}")
+            if st.button("Open", key=f"history_open_{entry['id']}"):
+                st.session_state.history_open = entry["id"]
+    
+    entry = store.get(st.session_state.get("history_open"))
+    if entry is not None:
+        st.markdown(f"**{entry['prompt']}**")
+        st.caption(f"{entry['mode']}, {entry['size']}, {entry['quality']} quality, {entry['latency_seconds']}s")
+        for output in entry["outputs"]:
+            data = store.image(output["digest"])
+            st.image(data, caption=f"{output['width']}x{output['height']}", use_container_width=True)
+            st.download_button("Download Image", data=data, file_name=f"generation_{entry['id']}_{output['position'] + 1}.png",
+                               mime="image/png", key=f"history_download_{output['digest']}")
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_job_progress(job_id):
+    """Poll a background job without blocking the script; rerun the app when it finishes"""
+    job = get_job_queue().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    if job.status == QUEUED:
+        st.info("Waiting for a free worker...")
+    else:
+        st.info(f"Generating images... ({job.elapsed:.0f}s)")
+    
+    # Fanned-out jobs publish each variation as soon as it arrives
+    partial = list(job.partial)
+    if partial:
+        tabs = st.tabs([f"Result {i+1}" for i in range(len(partial))])
+        for i, (tab, img) in enumerate(zip(tabs, partial)):
+            with tab:
+                st.image(img.preview(), caption=f"Generated Result {i+1}", use_container_width=True)
 
 def main():
     """Main Streamlit app function"""
+    rerun_start = time.perf_counter()
+    setup_page()
+    start_metrics_server()
+    
     # Header section
     st.title("🎨 Image Manipulation Example for gpt-image-1")
     st.markdown("Transform your images using gpt-image-1 model for editing, inpainting, and generation")
@@ -322,9 +234,42 @@ def main():
         
         num_variations = st.slider("Number of Results", 1, 4, 1)
         
+        fan_out = st.checkbox(
+            "Parallel variations",
+            value=FANOUT_DEFAULT,
+            help="Request each result separately and in parallel, showing each one as soon as it is ready"
+        )
+        
         st.markdown("---")
         st.subheader("Advanced Options")
         
+        bypass_cache = st.checkbox(
+            "Bypass result cache",
+            help="Always call the API, even if an identical request was answered before"
+        )
+        
+        high_res = st.checkbox(
+            "Keep full resolution (tiles)",
+            help="Edit large images in Image Size tiles at their original resolution and blend them back together. "
+                 "In inpainting, only the tiles around the mask are sent. Images that fit in one tile are edited normally."
+        )
+        
+        with st.expander("Connection Stats"):
+            st.json(get_transport().stats())
+            st.json(get_deployment_pool().stats())
+        
+        with st.expander("Cache Stats"):
+            st.json(get_result_cache().stats())
+            st.json(get_upload_cache().stats())
+            st.json(get_single_flight().stats())
+        
+        with st.expander("Job Queue"):
+            st.json(get_job_queue().stats())
+            st.json(get_image_executor().stats())
+        
+        with st.expander("Diagnostics"):
+            show_diagnostics()
+        
         st.markdown("---")
         with st.expander("About This App"):
             st.markdown("""
@@ -351,9 +296,10 @@ def main():
             horizontal=True
         )
         
-        # File uploaders based on mode
-        image_path = None
-        mask_path = None
+        # File uploaders based on mode; uploads are decoded and prepared once per session, not on every rerun
+        image_input = None
+        mask_input = None
+        upload_cache = get_upload_cache()
         
         if mode in ["Image Editing", "Inpainting (Mask)"]:
             uploaded_file = st.file_uploader(
@@ -363,9 +309,13 @@ def main():
             )
             
             if uploaded_file is not None:
-                image = Image.open(uploaded_file)
-                st.image(image, caption=f"Uploaded Image ({image.size[0]}x{image.size[1]})", use_container_width=True)
-                image_path = save_uploaded_file(uploaded_file)
+                try:
+                    image_input = upload_cache.image(uploaded_file.file_id, uploaded_file.getbuffer(), uploaded_file.name)
+                except ImageWorkersBusyError as e:
+                    st.error(str(e))
+                else:
+                    width, height = image_input.size
+                    st.image(image_input.preview, caption=f"Uploaded Image ({width}x{height})", use_container_width=True)
             
             if mode == "Inpainting (Mask)":
                 uploaded_mask = st.file_uploader(
@@ -374,20 +324,18 @@ def main():
                     help="Upload a PNG image where areas to modify should be transparent or white (converted to transparent automatically), and areas to preserve should be black. Must match the base image dimensions (e.g., 1024x683 for the current image). The mask will be resized if dimensions differ."
                 )
                 
-                if uploaded_mask is not None and image_path:
-                    mask_path = save_uploaded_file(uploaded_mask)
-                    validated_mask_path = validate_mask(mask_path, target_dimensions=image.size)
-                    if validated_mask_path:
-                        mask_path = validated_mask_path
-                        mask_img = Image.open(mask_path)
-                        st.image(mask_img, caption=f"Processed Mask (Resized to {mask_img.size[0]}x{mask_img.size[1]})", use_container_width=True)
+                if uploaded_mask is not None and image_input:
+                    processed_mask = validate_mask(uploaded_mask, image_input)
+                    if processed_mask:
+                        mask_width, mask_height = processed_mask.size
+                        st.image(processed_mask.preview, caption=f"Processed Mask (Resized to {mask_width}x{mask_height})", use_container_width=True)
                         # Validate dimensions after resizing
-                        if image.size != mask_img.size:
-                            st.error(f"Dimension mismatch: Image is {image.size}, but mask is {mask_img.size}. Please ensure the mask matches the image dimensions.")
-                            mask_path = None
+                        if image_input.size != processed_mask.size:
+                            st.error(f"Dimension mismatch: Image is {image_input.size}, but mask is {processed_mask.size}. Please ensure the mask matches the image dimensions.")
+                        else:
+                            mask_input = processed_mask
                     else:
                         st.error("Invalid mask: Could not process the mask. Ensure it's a PNG with transparent or white areas for editing (pure white #FFFFFF will be converted to transparent) and pure black #000000 for preserved areas.")
-                        mask_path = None
         
         st.markdown('<div class="control-section">', unsafe_allow_html=True)
         st.subheader("Edit Instructions")
@@ -429,6 +377,7 @@ def main():
                 if st.button(preset["name"], key=f"preset_{preset_category}_{i}"):
                     # Set the text area value to the preset prompt
                     st.session_state.custom_prompt = preset["prompt"]
+                    st.session_state.preset_name = preset["name"]
                     st.rerun()
         
         # Update text area if preset was selected
@@ -453,45 +402,65 @@ def main():
         
         if generate_button:
             # Validate inputs based on mode
-            if mode == "Image Editing" and not image_path:
+            if mode == "Image Editing" and not image_input:
                 st.error("Please upload an image first.")
-            elif mode == "Inpainting (Mask)" and (not image_path or not mask_path):
+            elif mode == "Inpainting (Mask)" and (not image_input or not mask_input):
                 st.error("Please upload both an image and a valid mask.")
             elif not custom_prompt and mode != "Text to Image":
                 st.error("Please enter editing instructions.")
             else:
-                # Generate image based on mode
-                with st.spinner("Generating images..."):
+                # Queue the job; the Results column picks it up on this and later reruns
+                job_fn = generate_variations
+                job_args = {
+                    "prompt": custom_prompt,
+                    "size": image_size,
+                    "n": num_variations,
+                    "quality": quality,
+                    "use_cache": not bypass_cache,
+                    "fan_out": fan_out,
+                }
+                try:
                     if mode == "Text to Image":
-                        prompt = custom_prompt if custom_prompt else "A beautiful landscape with mountains and a lake"
-                        images = generate_image(
-                            prompt=prompt,
-                            size=image_size,
-                            n=num_variations,
-                            quality=quality
-                        )
+                        job_args["prompt"] = custom_prompt if custom_prompt else "A beautiful landscape with mountains and a lake"
+                    elif high_res and needs_tiles(image_input.image.size, image_size):
+                        # Tiles are cut from the full-resolution upload, not the payload fitted to Image Size;
+                        # an upload that fits in one tile takes the normal path below
+                        job_fn = generate_tiled
+                        del job_args["fan_out"]
+                        job_args["image"] = image_input.image
+                        job_args["mask"] = mask_input.mask if mode == "Inpainting (Mask)" else None
                     elif mode == "Inpainting (Mask)":
-                        images = generate_image(
-                            prompt=custom_prompt,
-                            image_path=image_path,
-                            mask_path=mask_path,
-                            size=image_size,
-                            n=num_variations,
-                            quality=quality
-                        )
+                        job_args["image"], job_args["mask"] = upload_cache.payload(image_input, mask_input, image_size)
                     else:  # Image Editing
-                        images = generate_image(
-                            prompt=custom_prompt,
-                            image_path=image_path,
-                            size=image_size,
-                            n=num_variations,
-                            quality=quality
-                        )
-                    
-                    if images:
-                        # Store results in session state
-                        st.session_state.result_images = images
-                        st.session_state.processing_complete = True
+                        job_args["image"], _ = upload_cache.payload(image_input, None, image_size)
+                    # Recorded in the history by the worker, so a result survives a refresh
+                    preset = st.session_state.get("preset_name") if custom_prompt == st.session_state.get("custom_prompt") else None
+                    job = get_job_queue().submit(
+                        run_recorded, job_fn, mode, preset, kind=mode, pass_job=job_fn is generate_variations, **job_args
+                    )
+                    st.session_state.job_id = job.id
+                except (QueueFullError, ImageWorkersBusyError) as e:
+                    st.error(str(e))
+        
+        # Poll the active job, or collect its result once it has finished
+        job = get_job_queue().get(st.session_state.get("job_id"))
+        if job is None and "job_id" in st.session_state:
+            # The job was pruned before this session collected it
+            st.warning("The previous request expired before its result was collected.")
+            del st.session_state.job_id
+        elif job is not None:
+            if job.status == DONE:
+                st.session_state.result_images = job.result.images
+                st.session_state.result_errors = job.result.item_errors
+                st.session_state.processing_complete = True
+                get_job_queue().discard(job.id)
+                del st.session_state.job_id
+            elif job.status == FAILED:
+                st.error(f"Error generating image: {job.error}")
+                get_job_queue().discard(job.id)
+                del st.session_state.job_id
+            else:
+                show_job_progress(job.id)
         
         # Display results if available
         if 'processing_complete' in st.session_state and st.session_state.processing_complete:
@@ -501,43 +470,45 @@ def main():
                 
                 for i, (tab, img) in enumerate(zip(tabs, st.session_state.result_images)):
                     with tab:
-                        st.image(img, caption=f"Generated Result {i+1}", use_container_width=True)
-                        
-                        # Save image to buffer for download
-                        buf = io.BytesIO()
-                        img.save(buf, format="PNG")
-                        byte_im = buf.getvalue()
+                        st.image(img.preview(), caption=f"Generated Result {i+1}", use_container_width=True)
                         
+                        # Serve the original PNG bytes; nothing is re-encoded on rerun
                         st.download_button(
                             label="Download Image",
-                            data=byte_im,
+                            data=img.data,
                             file_name=f"generated_image_{i+1}.png",
                             mime="image/png"
                         )
             else:
                 # Single image display
-                st.image(st.session_state.result_images[0], caption="Generated Result", use_container_width=True)
-                
-                # Save image to buffer for download
-                buf = io.BytesIO()
-                st.session_state.result_images[0].save(buf, format="PNG")
-                byte_im = buf.getvalue()
+                img = st.session_state.result_images[0]
+                st.image(img.preview(), caption="Generated Result", use_container_width=True)
                 
                 st.download_button(
                     label="Download Image",
-                    data=byte_im,
+                    data=img.data,
                     file_name="generated_image.png",
                     mime="image/png"
                 )
-        else:
+            
+            # Items the API failed to return, while the others succeeded
+            for message in st.session_state.get("result_errors", []):
+                st.error(message)
+        elif 'job_id' not in st.session_state:
             st.info("Your transformed images will appear here")
             
         st.markdown('</div>', unsafe_allow_html=True)
     
+    with st.expander("History"):
+        show_history()
+    
     # Footer
     st.markdown('<div class="footer">', unsafe_allow_html=True)
     st.markdown("Developed by Eduardo Arana - info@arananet.net")
     st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Script time of this rerun, shown under "Metrics" on the next one
+    get_metrics().observe("rerun_seconds", time.perf_counter() - rerun_start)
 
 if __name__ == "__main__":
     main()
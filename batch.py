@@ -0,0 +1,252 @@
+"""Apply a prompt to many images without the Streamlit UI.
+
+Reads a directory of images or a JSONL manifest and runs every row through
+the same generation core as the app, a few rows at a time. Each output is
+written next to a results manifest (results.jsonl) that records one line
+per finished row, so an interrupted run picks up where it stopped: rows
+already marked done are skipped, failed rows are tried again.
+
+Manifest rows are JSON objects with "image", "mask", "prompt", "size",
+"quality" and an optional "id"; paths are relative to the manifest. Fields
+a row leaves out fall back to the command-line options. A row without an
+image is a text-to-image request.
+
+    python batch.py photos/ --preset "White Background" --output-dir out/
+    python batch.py rows.jsonl --output-dir out/ --concurrency 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+# Load environment variables before the modules below read their settings
+load_dotenv()
+
+from generation import generate_image, load_mask
+from image_input import ImageInput
+from metrics import _percentile, get_metrics, start_metrics_server
+from presets import find_preset
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+RESULTS_NAME = "results.jsonl"
+DONE = "done"
+FAILED = "failed"
+
+
+def load_rows(source, prompt=None, size="1024x1024", quality="high"):
+    """Yield row dicts (id, image, mask, prompt, size, quality) from a directory or JSONL manifest"""
+    defaults = {"prompt": prompt, "size": size, "quality": quality, "image": None, "mask": None}
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                    path = os.path.join(root, name)
+                    yield dict(defaults, id=os.path.relpath(path, source), image=path)
+        return
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            row = dict(defaults, **{key: value for key, value in entry.items() if value is not None})
+            for key in ("image", "mask"):
+                if row[key]:
+                    row[key] = os.path.join(base, row[key])
+            row.setdefault("id", entry.get("image") or f"row-{line_number}")
+            yield row
+
+
+def completed_ids(results_path):
+    """Ids of rows the results manifest already records as done"""
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; that row runs again
+                continue
+            if record.get("status") == DONE:
+                done.add(record["id"])
+            else:
+                done.discard(record["id"])
+    return done
+
+
+def output_names(row_id, count):
+    """PNG file names for a row's outputs, unique per row id.
+
+    The id keeps its extension, so x.jpg and x.png get different files. An
+    id with characters that cannot go in a file name, such as a directory
+    separator, has them replaced and gets a short hash of the id, so a/b.jpg
+    and a_b.jpg stay apart.
+    """
+    stem = re.sub(r"[^\w.-]", "_", row_id)
+    if stem != row_id:
+        stem = f"{stem}-{hashlib.sha256(row_id.encode()).hexdigest()[:8]}"
+    if count == 1:
+        return [f"{stem}.png"]
+    return [f"{stem}-{index + 1}.png" for index in range(count)]
+
+
+def _drop_partial_line(path):
+    """Cut a results manifest back to its last complete line, so new records never join a torn one"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        # Scan back for the newline ending the last complete record
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                f.truncate(start + newline + 1)
+                return
+            end = start
+        f.truncate(0)
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def process_row(row, output_dir, n=1, use_cache=True):
+    """Generate one row and write its outputs; returns the results manifest record"""
+    start = time.perf_counter()
+    record = {"id": row["id"], "prompt": row["prompt"], "size": row["size"], "quality": row["quality"]}
+    try:
+        if not row["prompt"]:
+            raise ValueError("Row has no prompt")
+        image = mask = None
+        if row["image"]:
+            with open(row["image"], "rb") as f:
+                image = ImageInput(f.read(), os.path.basename(row["image"]))
+        if row["mask"]:
+            if image is None:
+                raise ValueError("A mask needs an image")
+            with open(row["mask"], "rb") as f:
+                mask = load_mask(f, image.size)
+        result = generate_image(row["prompt"], image, mask, row["size"], n, row["quality"], use_cache)
+        names = output_names(row["id"], len(result.images))
+        for name, generated in zip(names, result.images):
+            _write_atomic(os.path.join(output_dir, name), generated.data)
+        record.update(status=DONE, outputs=names, cached=result.cached)
+        if result.item_errors:
+            record["item_errors"] = result.item_errors
+    except Exception as e:
+        record.update(status=FAILED, error=str(e))
+    record["latency_seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_batch(rows, output_dir, concurrency=4, n=1, use_cache=True, log=None):
+    """Process rows with at most concurrency in flight and return a summary of the run.
+
+    Rows already marked done in the output directory's results manifest are
+    skipped. Only a small window of rows is read ahead, so memory stays flat
+    however long the input is.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results_path = os.path.join(output_dir, RESULTS_NAME)
+    # A crash can leave a half-written last record; that row runs again
+    _drop_partial_line(results_path)
+    already_done = completed_ids(results_path)
+    metrics = get_metrics()
+    write_lock = threading.Lock()
+    latencies = []
+    counts = {DONE: 0, FAILED: 0, "skipped": 0, "images": 0}
+
+    def finish(record):
+        with write_lock:
+            results.write(json.dumps(record) + "\n")
+            results.flush()
+            counts[record["status"]] += 1
+            counts["images"] += len(record.get("outputs", []))
+            latencies.append(record["latency_seconds"])
+        metrics.observe("batch_row_seconds", record["latency_seconds"], status=record["status"])
+        if log:
+            log(f"[{record['status']}] {record['id']} {record['latency_seconds']:.2f}s {record.get('error', '')}".rstrip())
+
+    start = time.perf_counter()
+    with open(results_path, "a") as results, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="imagegen-batch") as pool:
+        pending = set()
+        for row in rows:
+            if row["id"] in already_done:
+                counts["skipped"] += 1
+                continue
+            if len(pending) >= concurrency * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(future.result())
+            pending.add(pool.submit(process_row, row, output_dir, n, use_cache))
+        for future in wait(pending).done:
+            finish(future.result())
+    elapsed = time.perf_counter() - start
+
+    processed = counts[DONE] + counts[FAILED]
+    ordered = sorted(latencies)
+    return {
+        "rows": processed + counts["skipped"],
+        "done": counts[DONE],
+        "failed": counts[FAILED],
+        "skipped": counts["skipped"],
+        "images": counts["images"],
+        "wall_seconds": round(elapsed, 3),
+        "images_per_minute": round(counts["images"] / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "error_rate": round(counts[FAILED] / processed, 4) if processed else 0.0,
+        "latency_p50": _percentile(ordered, 50) if ordered else None,
+        "latency_p90": _percentile(ordered, 90) if ordered else None,
+        "latency_max": ordered[-1] if ordered else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="directory of images or JSONL manifest")
+    parser.add_argument("--output-dir", required=True, help="where outputs and results.jsonl are written")
+    prompt = parser.add_mutually_exclusive_group()
+    prompt.add_argument("--prompt", help="prompt for rows that do not set one")
+    prompt.add_argument("--preset", help="name of a preset prompt, e.g. \"White Background\"")
+    parser.add_argument("--size", default="1024x1024", choices=["1024x1024", "1024x1536", "1536x1024"])
+    parser.add_argument("--quality", default="high", choices=["high", "medium", "low"])
+    parser.add_argument("--n", type=int, default=1, help="results per row")
+    parser.add_argument("--concurrency", type=int, default=4, help="rows in flight at once")
+    parser.add_argument("--no-cache", action="store_true", help="always call the API")
+    args = parser.parse_args(argv)
+
+    start_metrics_server()
+    text = find_preset(args.preset) if args.preset else args.prompt
+    rows = load_rows(args.source, text, args.size, args.quality)
+    summary = run_batch(
+        rows, args.output_dir, args.concurrency, args.n, not args.no_cache,
+        log=lambda message: print(message, file=sys.stderr, flush=True)
+    )
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
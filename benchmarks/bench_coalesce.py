@@ -0,0 +1,107 @@
+"""Benchmark: upstream calls saved by request coalescing when a workshop clicks the same presets at once.
+
+Simulates a burst of users who each apply one of a few presets to the
+in-painting-example image within a short window, against mock_server.py
+in its own process. Runs the burst with coalescing off and on, starting
+from an empty in-memory result cache each time, and reports the upstream
+calls made, how many requests were coalesced and their latency. Usage:
+
+    python benchmarks/bench_coalesce.py [--users 40] [--window 2] [--presets 3] [--latency uniform:3:5]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The burst must start from an empty cache with no disk tier left over from other runs
+os.environ["IMAGEGEN_CACHE_DIR"] = ""
+
+import coalesce
+import generation
+import metrics
+import result_cache
+from generation import generate_image
+from load_test import load_example, start_mock
+from metrics import _percentile
+from preflight import preflight
+from presets import find_preset
+
+PRESETS = ["Oil Painting", "Watercolor", "Anime Style", "Cyberpunk", "Vintage Photo"]
+
+
+def burst(users, window, presets, image, seed):
+    """Start users one by one over window seconds; returns their latencies and failures"""
+    rng = random.Random(seed)
+    prompts = [find_preset(name) for name in PRESETS[:presets]]
+    latencies, failures = [], []
+    lock = threading.Lock()
+
+    def user(prompt, delay):
+        time.sleep(delay)
+        start = time.perf_counter()
+        try:
+            generate_image(prompt, image, size="1024x1024", quality="low")
+        except Exception as e:
+            with lock:
+                failures.append(str(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    threads = [
+        threading.Thread(target=user, args=(rng.choice(prompts), rng.uniform(0, window)))
+        for _ in range(users)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--window", type=float, default=2.0, help="seconds over which the users click")
+    parser.add_argument("--presets", type=int, default=3, choices=range(1, len(PRESETS) + 1))
+    parser.add_argument("--latency", default="uniform:3:5")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    args.error_rate = args.throttle_rate = 0.0
+    args.response_format = "b64_json"
+    args.detail = "noise"
+
+    mock, endpoint = start_mock(args)
+    os.environ["IMAGEGEN_AOAI_ENDPOINT"] = endpoint
+    os.environ.setdefault("IMAGEGEN_AOAI_API_KEY", "mock")
+    # Every user uploads the same example; each session's upload cache fits it once
+    image, _ = preflight(load_example()[0], None, "1024x1024")
+
+    print(f"{args.users} users, {args.presets} presets, clicks spread over {args.window:g}s, latency {args.latency}")
+    print(f"{'coalescing':>10} {'upstream':>9} {'coalesced':>10} {'p50 s':>7} {'max s':>7} {'wall s':>7} {'failed':>7}")
+    try:
+        for enabled in (False, True):
+            generation.COALESCE_ENABLED = enabled
+            coalesce._flights = coalesce.SingleFlight()
+            metrics._metrics = metrics.Metrics()
+            result_cache._cache = result_cache.ResultCache(directory="")
+            latencies, failures, wall = burst(args.users, args.window, args.presets, image, args.seed)
+            counters = metrics.get_metrics().summary()["counters"]
+            upstream = sum(value for key, value in counters.items() if key.startswith("api_responses_total"))
+            ordered = sorted(latencies) or [0.0]
+            print(
+                f"{'on' if enabled else 'off':>10} {upstream:>9} {coalesce.get_single_flight().stats()['coalesced']:>10} "
+                f"{_percentile(ordered, 50):>7.2f} {ordered[-1]:>7.2f} {wall:>7.2f} {len(failures):>7}"
+            )
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
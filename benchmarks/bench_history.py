@@ -0,0 +1,121 @@
+"""Benchmark: session memory as generations pile up, and gallery page time as the history grows.
+
+Memory: one process keeps every result in a session list, as a gallery
+held in session state would, while another records each result in a
+HistoryStore and keeps only its id. Both report resident memory
+every few generations. Paging: fills a store with many small entries and
+times loading one gallery page (metadata and thumbnails) at the start,
+middle and end. Usage:
+
+    python benchmarks/bench_history.py [--generations 200] [--entries 5000]
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, PngImagePlugin
+
+from bench_response_decode import _status_kb
+from history import HistoryStore
+from responses import GeneratedImage
+
+PAGE_SIZE = 12
+
+
+def result_png(index, side=1024):
+    """A photo-sized PNG (about 1 MB) that differs per index, so every result gets its own blob"""
+    noise = Image.frombytes("L", (side, side), os.urandom(side * side))
+    info = PngImagePlugin.PngInfo()
+    info.add_text("index", str(index))
+    buf = io.BytesIO()
+    noise.save(buf, format="PNG", compress_level=0, pnginfo=info)
+    return buf.getvalue()
+
+
+def _session(strategy, generations, every, queue):
+    directory = tempfile.mkdtemp(prefix="bench-history-")
+    store = HistoryStore(directory) if strategy == "history" else None
+    kept = []
+    samples = []
+    for index in range(1, generations + 1):
+        data = result_png(index)
+        if store is None:
+            result = GeneratedImage(data)
+            # The Results column decodes a preview of every kept result
+            result.preview()
+            kept.append(result)
+        else:
+            kept.append(store.record(f"generation {index}", [data], "Text to Image"))
+        del data
+        if index % every == 0:
+            samples.append((index, _status_kb("VmRSS") / 1024))
+    shutil.rmtree(directory)
+    queue.put(samples)
+
+
+def memory_growth(strategy, generations, every):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_session, args=(strategy, generations, every, queue))
+    proc.start()
+    samples = queue.get()
+    proc.join()
+    return samples
+
+
+def page_times(entries):
+    with tempfile.TemporaryDirectory(prefix="bench-history-") as directory:
+        store = HistoryStore(directory)
+        thumb_source = Image.linear_gradient("L").resize((1024, 1024))
+        start = time.perf_counter()
+        for index in range(entries):
+            buf = io.BytesIO()
+            thumb_source.point(lambda value, shift=index % 256: (value + shift) % 256).save(buf, format="PNG", compress_level=1)
+            store.record(f"prompt {index}", [buf.getvalue()], ("Text to Image", "Image Editing")[index % 2])
+        record_ms = (time.perf_counter() - start) / entries * 1000
+        pages = (store.count() + PAGE_SIZE - 1) // PAGE_SIZE
+        results = []
+        for label, page in (("first", 0), ("middle", pages // 2), ("last", pages - 1)):
+            timings = []
+            for _ in range(20):
+                start = time.perf_counter()
+                for entry in store.page(page * PAGE_SIZE, PAGE_SIZE):
+                    store.thumbnail(entry["outputs"][0]["digest"])
+                timings.append(time.perf_counter() - start)
+            results.append((label, page + 1, statistics.median(timings) * 1000))
+        start = time.perf_counter()
+        store.count(mode="Image Editing", search="prompt 4")
+        search_ms = (time.perf_counter() - start) * 1000
+        return record_ms, pages, results, search_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--generations", type=int, default=200)
+    parser.add_argument("--every", type=int, default=50)
+    parser.add_argument("--entries", type=int, default=5000)
+    args = parser.parse_args()
+
+    session_list = memory_growth("session", args.generations, args.every)
+    recorded = memory_growth("history", args.generations, args.every)
+    print(f"{'generations':>12} {'session list MB':>16} {'history MB':>11}")
+    for (count, kept_mb), (_, history_mb) in zip(session_list, recorded):
+        print(f"{count:>12} {kept_mb:>16.0f} {history_mb:>11.0f}")
+
+    record_ms, pages, results, search_ms = page_times(args.entries)
+    print(f"\n{args.entries} entries, {pages} pages of {PAGE_SIZE}; record {record_ms:.1f} ms per generation")
+    for label, page, ms in results:
+        print(f"  {label:>6} page ({page:>4}): {ms:.2f} ms with thumbnails")
+    print(f"  filtered search count: {search_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
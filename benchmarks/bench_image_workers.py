@@ -0,0 +1,106 @@
+"""Benchmark: UI rerun latency and image-stage throughput as sessions grow, for each image executor.
+
+Each session thread keeps uploading a photo-sized JPEG: it builds the
+upload preview and fits the upload to the image size, the two image
+stages the app runs for a new upload. Meanwhile a probe thread repeats a
+short pure-Python rerun (dicts, strings and JSON, as a script rerun
+builds) and records how long each one takes. With the inline and thread
+executors the sessions' image work shares this process's GIL with the
+probe; the process executor runs it in worker processes. Usage:
+
+    python benchmarks/bench_image_workers.py [--sessions 1 5 10 20] [--seconds 5] [--workers 4] [--megapixels 12]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_workers
+from bench_preflight import synthetic_photo
+from image_input import ImageInput
+from image_workers import EXECUTOR_KINDS, ImageExecutor
+from metrics import _percentile
+from preflight import preflight
+from responses import encode_preview
+
+
+def rerun():
+    """A stand-in for a script rerun's own Python work, about a millisecond of it"""
+    state = {f"widget_{index}": {"value": index, "label": f"Widget {index}", "options": list(range(8))} for index in range(200)}
+    return len(json.dumps(state))
+
+
+def upload(data, size):
+    """The image stages of a new upload: its preview, then the payload fitted to size"""
+    image = ImageInput(data, "photo.jpg")
+    image_workers.get_image_executor().run(encode_preview, image.data)
+    preflight(image, None, size)
+
+
+def measure(sessions, seconds, data, size):
+    """Returns (sorted probe rerun seconds, uploads per second)"""
+    stop = threading.Event()
+    done = []
+
+    def session():
+        while not stop.is_set():
+            upload(data, size)
+            done.append(1)
+
+    threads = [threading.Thread(target=session, daemon=True) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    latencies = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        begin = time.perf_counter()
+        rerun()
+        latencies.append(time.perf_counter() - begin)
+        # Reruns come from user clicks, not a busy loop
+        time.sleep(0.01)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    # Uploads still running at the stop are finished and counted, so large session counts are not undercounted
+    return sorted(latencies), len(done) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=image_workers.IMAGE_WORKERS)
+    parser.add_argument("--megapixels", type=float, default=12.0)
+    parser.add_argument("--size", default="1536x1024")
+    parser.add_argument("--executors", nargs="+", default=list(EXECUTOR_KINDS), choices=EXECUTOR_KINDS)
+    args = parser.parse_args()
+
+    width = int((args.megapixels * 1e6 * 4 / 3) ** 0.5)
+    buf = io.BytesIO()
+    synthetic_photo((width, width * 3 // 4)).save(buf, format="JPEG", quality=90)
+    data = buf.getvalue()
+
+    idle, _ = measure(0, min(args.seconds, 2.0), data, args.size)
+    print(f"{os.cpu_count()} CPUs, {args.workers} workers, {len(data) / 1e6:.1f} MB JPEG "
+          f"({width}x{width * 3 // 4}) fitted to {args.size}")
+    print(f"idle rerun: p50 {_percentile(idle, 50) * 1000:.2f} ms, p99 {_percentile(idle, 99) * 1000:.2f} ms\n")
+    print(f"{'executor':>9} {'sessions':>9} {'rerun p50 ms':>13} {'rerun p99 ms':>13} {'rerun max ms':>13} {'uploads/s':>10}")
+    for kind in args.executors:
+        executor = ImageExecutor(kind, workers=args.workers, queue_depth=max(args.sessions))
+        image_workers._executor = executor
+        # Start the pool (and, for processes, its interpreters) before timing
+        upload(data, args.size)
+        for sessions in args.sessions:
+            latencies, throughput = measure(sessions, args.seconds, data, args.size)
+            print(f"{kind:>9} {sessions:>9} {_percentile(latencies, 50) * 1000:>13.2f} "
+                  f"{_percentile(latencies, 99) * 1000:>13.2f} {latencies[-1] * 1000:>13.2f} {throughput:>10.2f}")
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
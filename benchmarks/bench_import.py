@@ -0,0 +1,49 @@
+"""Benchmark: cold import time of the generation core and its entry points.
+
+Each module is imported in a fresh interpreter, so nothing is shared
+between runs. Also lists which heavy dependencies the import pulled in;
+the core should load neither Streamlit nor the HTTP stack. Usage:
+
+    python benchmarks/bench_import.py [--runs 5] [--modules generation batch app]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ("streamlit", "requests", "urllib3", "PIL.Image")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def import_once(module):
+    code = PROBE.format(module=module, heavy=HEAVY)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=["generation", "batch", "app"])
+    args = parser.parse_args()
+
+    for module in args.modules:
+        samples = [import_once(module) for _ in range(args.runs)]
+        median = statistics.median(sample["seconds"] for sample in samples)
+        loaded = ", ".join(samples[0]["loaded"]) or "none"
+        print(f"{module:>12}: {median * 1000:7.1f} ms median import, heavy modules loaded: {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Micro-benchmark: legacy per-pixel validate_mask vs. whole-image mask preparation.
+
+Each measurement runs in a fresh subprocess so peak RSS is not polluted by
+earlier runs. Usage: python benchmarks/bench_mask.py [--repeat N]
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from mask_processing import prepare_mask
+
+SIZES = [(1024, 1024), (1024, 1536), (1536, 1024), (3000, 2000)]
+
+
+def legacy_validate_mask(mask_path, target_dimensions):
+    """The pre-vectorization implementation, kept verbatim for comparison"""
+    mask = Image.open(mask_path).convert("L")
+    mask = mask.point(lambda p: 255 if p >= 128 else 0, mode="1")
+    if mask.size != target_dimensions:
+        mask = mask.resize(target_dimensions, Image.Resampling.NEAREST)
+    mask_rgba = Image.new("RGBA", mask.size, (0, 0, 0, 255))
+    mask_data = mask.getdata()
+    new_data = [(0, 0, 0, 0) if p == 255 else (0, 0, 0, 255) for p in mask_data]
+    mask_rgba.putdata(new_data)
+    binarized_path = f"temp_binarized_{os.path.basename(mask_path)}"
+    mask_rgba.save(binarized_path, "PNG")
+    return binarized_path
+
+
+def make_mask_png(size):
+    """Synthetic black mask with a white ellipse in the middle"""
+    mask = Image.new("L", size, 0)
+    w, h = size
+    ImageDraw.Draw(mask).ellipse((w // 4, h // 4, 3 * w // 4, 3 * h // 4), fill=255)
+    buf = io.BytesIO()
+    mask.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_one(impl, size, repeat, queue):
+    png = make_mask_png(size)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        mask_path = os.path.join(workdir, "mask.png")
+        with open(mask_path, "wb") as f:
+            f.write(png)
+
+        if impl == "legacy":
+            run = lambda: legacy_validate_mask(mask_path, size)
+        else:
+            run = lambda: prepare_mask(png, size)
+
+        # Warm up codecs on a tiny mask so the RSS baseline excludes one-off setup
+        tiny = make_mask_png((8, 8))
+        prepare_mask(tiny, (8, 8))
+        rss_before = _max_rss_kb()
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        elapsed = (time.perf_counter() - start) / repeat
+        _, py_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_growth = _max_rss_kb() - rss_before
+    queue.put((elapsed, py_peak, rss_growth))
+
+
+def measure(impl, size, repeat):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_one, args=(impl, size, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'size':>11} {'impl':>7} {'ms/MP':>9} {'py peak MB':>11} {'rss +MB':>8}")
+    for size in SIZES:
+        megapixels = size[0] * size[1] / 1e6
+        for impl in ("legacy", "new"):
+            elapsed, py_peak, rss_growth = measure(impl, size, args.repeat)
+            print(
+                f"{size[0]:>5}x{size[1]:<5} {impl:>7} {elapsed * 1000 / megapixels:>9.1f} "
+                f"{py_peak / 2**20:>11.1f} {rss_growth / 1024:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
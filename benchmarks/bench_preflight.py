@@ -0,0 +1,136 @@
+"""Benchmark: bytes on the wire and upload latency with and without pre-flight normalization.
+
+For each input and image size, compares the old upload (original pixels
+re-encoded as PNG, RGBA mask) with the pre-flight one (fitted to the size,
+LA mask). Uploads go to a local stub that reads the body at a throttled
+rate, to stand in for the client's uplink. Inputs are the
+in-painting-example assets plus a synthetic 24 MP JPEG and 12 MP PNG. Usage:
+
+    python benchmarks/bench_preflight.py [--mbps 20] [--sizes 1024x1024 1536x1024]
+"""
+import argparse
+import io
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from generation import load_mask
+from image_input import ImageInput, MultipartBody
+from preflight import preflight
+from transport import Transport
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "in-painting-example")
+SIZES = ["1024x1024", "1024x1536", "1536x1024"]
+READ_CHUNK = 64 * 1024
+
+
+def throttled_stub(bytes_per_second):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_POST(self):
+            remaining = int(self.headers["Content-Length"])
+            start = time.perf_counter()
+            received = 0
+            while remaining:
+                chunk = self.rfile.read(min(READ_CHUNK, remaining))
+                remaining -= len(chunk)
+                received += len(chunk)
+                # Hold the read back to the simulated uplink speed
+                delay = received / bytes_per_second - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/images/edits"
+
+
+def encoded(image, format):
+    buf = io.BytesIO()
+    image.save(buf, format=format, quality=92)
+    return buf.getvalue()
+
+
+def synthetic_photo(size, seed=0):
+    """Noisy gradients: compresses about as badly as a real photo, and is the same on every run"""
+    gradient = Image.linear_gradient("L").resize(size)
+    # Uniform noise of the same spread as effect_noise(size, 24), which cannot be seeded
+    noise = Image.frombytes("L", size, random.Random(seed).randbytes(size[0] * size[1])).point(lambda value: 86 + value * 84 // 255)
+    return Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+
+def synthetic_mask(size):
+    mask = Image.new("L", size, 0)
+    width, height = size
+    ImageDraw.Draw(mask).ellipse((width // 4, height // 4, 3 * width // 4, 3 * height // 4), fill=255)
+    return encoded(mask, "PNG")
+
+
+def load_inputs():
+    with open(os.path.join(EXAMPLE_DIR, "image1.jpg"), "rb") as f:
+        example = f.read()
+    with open(os.path.join(EXAMPLE_DIR, "mask.png"), "rb") as f:
+        example_mask = f.read()
+    return [
+        ("in-painting-example", ImageInput(example, "image1.jpg"), example_mask),
+        ("24MP JPEG", ImageInput(encoded(synthetic_photo((6000, 4000)), "JPEG"), "photo.jpg"), synthetic_mask((6000, 4000))),
+        ("12MP PNG", ImageInput(encoded(synthetic_photo((4000, 3000)), "PNG"), "photo.png"), synthetic_mask((4000, 3000))),
+    ]
+
+
+def prepare(name, image_bytes, mask_bytes, size, fit):
+    """Build the multipart body the app would send; returns (body, seconds spent preparing)"""
+    start = time.perf_counter()
+    image = ImageInput(image_bytes, name)
+    mask = load_mask(mask_bytes, image.size)
+    image, mask = preflight(image, mask, size, fit=fit)
+    body = MultipartBody({"prompt": "x", "size": size}, {"image": image.multipart_file(), "mask": mask.multipart_file()})
+    len(body)
+    return body, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mbps", type=float, default=20, help="simulated uplink in megabits per second")
+    parser.add_argument("--sizes", nargs="+", default=SIZES)
+    args = parser.parse_args()
+
+    server, url = throttled_stub(args.mbps * 1_000_000 / 8)
+    transport = Transport(pool_size=2)
+    print(f"uplink: {args.mbps:g} Mbit/s")
+    print(f"{'input':>20} {'size':>10} {'mode':>9} {'upload':>10} {'prepare ms':>11} {'upload ms':>10} {'total ms':>9}")
+    for label, image, mask_bytes in load_inputs():
+        for size in args.sizes:
+            for mode, fit in (("original", "off"), ("preflight", "contain")):
+                body, prepare_seconds = prepare(image.name, image.data, mask_bytes, size, fit)
+                start = time.perf_counter()
+                transport.post(url, data=body, headers={"Content-Type": body.content_type}).raise_for_status()
+                upload_seconds = time.perf_counter() - start
+                print(
+                    f"{label:>20} {size:>10} {mode:>9} {len(body) / 1e6:>8.2f}MB {prepare_seconds * 1000:>11.0f} "
+                    f"{upload_seconds * 1000:>10.0f} {(prepare_seconds + upload_seconds) * 1000:>9.0f}"
+                )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark: peak RSS and time of whole-body vs. streaming response decoding.
+
+Records synthetic gpt-image-1 responses (n images of incompressible noise at
+the given size, so the PNGs are as large as real photos) to fixture files,
+then decodes each fixture in a fresh subprocess with both strategies:
+
+- legacy: json.loads of the body, b64decode, PIL decode of every image
+- streaming: 64 KB chunks through StreamingResponseParser, kept as PNG bytes
+
+Usage: python benchmarks/bench_response_decode.py [--size 1536x1024] [--n 4]
+"""
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from responses import GeneratedImage, parse_stream
+
+CHUNK_SIZE = 64 * 1024
+
+
+def record_fixture(path, size, n):
+    width, height = size
+    buf = io.BytesIO()
+    Image.frombytes("RGB", size, os.urandom(width * height * 3)).save(buf, format="PNG")
+    encoded = base64.b64encode(buf.getvalue()).decode()
+    with open(path, "w") as f:
+        json.dump({"created": int(time.time()), "data": [{"b64_json": encoded} for _ in range(n)]}, f)
+
+
+def decode_legacy(path):
+    with open(path, "rb") as f:
+        response_json = json.loads(f.read())
+    images = []
+    for item in response_json["data"]:
+        image = Image.open(io.BytesIO(base64.b64decode(item["b64_json"])))
+        image.load()
+        images.append(image)
+    return images
+
+
+def decode_streaming(path):
+    with open(path, "rb") as f:
+        chunks = iter(lambda: f.read(CHUNK_SIZE), b"")
+        response_json = parse_stream(chunks)
+    return [GeneratedImage(item["b64_json"]) for item in response_json["data"]]
+
+
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return None
+
+
+def _reset_peak_rss():
+    """Reset VmHWM where Linux allows it; ru_maxrss would carry the parent's peak over exec"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb():
+    try:
+        return _status_kb("VmHWM")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_one(strategy, path, queue):
+    decode = decode_legacy if strategy == "legacy" else decode_streaming
+    _reset_peak_rss()
+    rss_before = _peak_rss_kb()
+    start = time.perf_counter()
+    results = decode(path)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, _peak_rss_kb() - rss_before, len(results)))
+
+
+def measure(strategy, path):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_one, args=(strategy, path, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1536x1024")
+    parser.add_argument("--n", type=int, default=4)
+    args = parser.parse_args()
+    size = tuple(int(part) for part in args.size.split("x"))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "response.json")
+        record_fixture(path, size, args.n)
+        print(f"fixture: {args.size} n={args.n}, {os.path.getsize(path) / 2**20:.1f} MB body")
+        print(f"{'strategy':>10} {'ms':>8} {'peak rss +MB':>13}")
+        for strategy in ("legacy", "streaming"):
+            elapsed, rss_growth, _ = measure(strategy, path)
+            print(f"{strategy:>10} {elapsed * 1000:>8.1f} {rss_growth / 1024:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark: per-rerun cost of preparing the Results column for display and download.
+
+Compares the old path (re-encode every PIL result to PNG on each rerun) with
+the new one (serve original bytes, reuse a cached preview). Usage:
+
+    python benchmarks/bench_results_rerun.py [--n 4] [--reruns 10]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from responses import GeneratedImage
+
+
+def make_result_png(size=(1536, 1024)):
+    """A gradient with shapes, closer to a real photo's PNG cost than a flat colour"""
+    gradient = Image.linear_gradient("L").resize(size)
+    img = Image.merge("RGB", (gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), gradient.rotate(90, expand=False)))
+    draw = ImageDraw.Draw(img)
+    for i in range(0, size[0], 97):
+        draw.ellipse((i, i % size[1], i + 200, (i % size[1]) + 150), outline=(i % 255, 80, 160), width=5)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def rerun_legacy(images):
+    payloads = []
+    for img in images:
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        payloads.append((img, buf.getvalue()))
+    return payloads
+
+
+def rerun_new(results):
+    return [(result.preview(), result.data) for result in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=4)
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    png = make_result_png()
+    legacy_images = [Image.open(io.BytesIO(png)) for _ in range(args.n)]
+    new_results = [GeneratedImage(png) for _ in range(args.n)]
+
+    for name, run, inputs in (("legacy", rerun_legacy, legacy_images), ("new", rerun_new, new_results)):
+        timings = []
+        for _ in range(args.reruns):
+            start = time.perf_counter()
+            run(inputs)
+            timings.append(time.perf_counter() - start)
+        print(f"{name:>7}: first rerun {timings[0] * 1000:7.1f} ms, "
+              f"later reruns {sum(timings[1:]) / max(1, len(timings) - 1) * 1000:7.2f} ms avg")
+
+
+if __name__ == "__main__":
+    main()
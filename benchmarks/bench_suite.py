@@ -0,0 +1,370 @@
+"""Benchmark suite: every stage of the edit/inpaint pipeline, timed on its own and end to end, as JSON.
+
+Stages:
+  upload      read an upload's header and build its preview, as the upload cache does
+  mask        binarize and resize the mask to the upload with load_mask
+  preflight   fit the upload and its mask to the image size
+  decode      parse a recorded API response, decoding its base64 image
+  preview     encode the Results preview of a generated image
+  end_to_end  the app's in-painting Transform: prepared upload and mask,
+              the request to mock_server.py in its own process, the
+              history record and the result's preview
+
+Stages that depend on the image size run at each size the app offers;
+those that read uploads run on the in-painting-example and on synthetic
+12 MP photos, which are the same on every run. Every case runs in a
+fresh interpreter and reports the median, min and max wall time of its
+repeats, its peak RSS, the bytes it wrote to disk per repeat and the
+bytes it produced. --compare checks the results against a stored
+baseline and exits with status 1 if a case regressed by more than
+--threshold percent in its fastest repeat, peak RSS or disk writes. Usage:
+
+    python benchmarks/bench_suite.py [--output results.json] [--repeat 5] [--stages preflight decode] [--inputs example]
+    python benchmarks/bench_suite.py --compare benchmarks/baseline.json [--current results.json] [--threshold 20]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_preflight import EXAMPLE_DIR, SIZES, encoded, synthetic_mask, synthetic_photo
+from bench_response_decode import _status_kb
+
+STAGES = ["upload", "mask", "preflight", "decode", "preview", "end_to_end"]
+# Which of input and image size each stage depends on
+STAGE_AXES = {
+    "upload": ("input",),
+    "mask": ("input",),
+    "preflight": ("input", "size"),
+    "decode": ("size",),
+    "preview": ("size",),
+    "end_to_end": ("input", "size"),
+}
+INPUTS = ["example", "photo-12mp-jpeg", "photo-12mp-png"]
+PROMPT = "Oil Painting"
+# Differences smaller than these are noise, whatever their percentage
+MIN_WALL_DELTA_SECONDS = 0.002
+MIN_RSS_DELTA_MB = 2.0
+MIN_DISK_DELTA_BYTES = 64 * 1024
+
+
+def write_inputs(directory, names):
+    """Write each input's image and mask to directory; returns {name: (image path, mask path)}"""
+    paths = {}
+    for name in names:
+        if name == "example":
+            paths[name] = (os.path.join(EXAMPLE_DIR, "image1.jpg"), os.path.join(EXAMPLE_DIR, "mask.png"))
+            continue
+        _, _, format = name.split("-")
+        size = (4000, 3000)
+        image_path = os.path.join(directory, f"{name}.{format}")
+        mask_path = os.path.join(directory, f"{name}-mask.png")
+        with open(image_path, "wb") as f:
+            f.write(encoded(synthetic_photo(size), format.upper()))
+        with open(mask_path, "wb") as f:
+            f.write(synthetic_mask(size))
+        paths[name] = (image_path, mask_path)
+    return paths
+
+
+def recorded_response(size):
+    """The body of an images API answer for size, as mock_server.py sends it"""
+    import base64
+    from mock_server import render_png
+    from preflight import parse_size
+
+    width, height = parse_size(size)
+    data = render_png("0" * 16, width, height, "noise")
+    return json.dumps({"created": 0, "data": [{"b64_json": base64.b64encode(data).decode()}]}).encode()
+
+
+def _disk_write_bytes():
+    """Bytes this process has sent to the storage layer so far, or None where the kernel does not say"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split(":")[1])
+    except OSError:
+        return None
+    return None
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this interpreter in MB"""
+    if os.path.exists("/proc/self/status"):
+        # ru_maxrss would count the parent's memory from before exec
+        return _status_kb("VmHWM") / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other systems kilobytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def stage_runner(stage, image_path, mask_path, size, scratch):
+    """Return prepare() for a stage; each call sets up one repeat, untimed, and returns (run, measure).
+
+    run() is the timed work; measure(its result) gives the bytes it produced.
+    """
+    from image_input import ImageInput
+    from generation import load_mask
+
+    image_bytes = mask_bytes = None
+    if image_path:
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+        with open(mask_path, "rb") as f:
+            mask_bytes = f.read()
+    name = os.path.basename(image_path) if image_path else None
+
+    if stage == "upload":
+        from upload_cache import UploadCache
+
+        def prepare():
+            cache = UploadCache()
+            return lambda: cache.image("upload", image_bytes, name), lambda upload: len(upload.preview)
+        return prepare
+
+    if stage == "mask":
+        image_size = ImageInput(image_bytes, name).size
+        return lambda: (lambda: load_mask(mask_bytes, image_size), lambda mask: len(mask.data))
+
+    if stage == "preflight":
+        from preflight import preflight
+
+        def prepare():
+            image = ImageInput(image_bytes, name)
+            mask = load_mask(mask_bytes, image.size)
+            return lambda: preflight(image, mask, size), lambda fitted: sum(len(item.data) for item in fitted)
+        return prepare
+
+    if stage == "decode":
+        from generation import RESPONSE_CHUNK_SIZE
+        from responses import parse_stream
+
+        body = recorded_response(size)
+        chunks = [body[start:start + RESPONSE_CHUNK_SIZE] for start in range(0, len(body), RESPONSE_CHUNK_SIZE)]
+        return lambda: (lambda: parse_stream(iter(chunks)), lambda document: len(document["data"][0]["b64_json"]))
+
+    if stage == "preview":
+        from mock_server import render_png
+        from preflight import parse_size
+        from responses import GeneratedImage
+
+        data = render_png("0" * 16, *parse_size(size), "noise")
+        return lambda: (GeneratedImage(data).preview, len)
+
+    if stage == "end_to_end":
+        import history
+        import result_cache
+        from generation import generate_variations
+        from history import HistoryStore, run_recorded
+        from upload_cache import UploadCache
+
+        def prepare():
+            # A new session with empty stores, so every repeat is a first generation
+            directory = tempfile.mkdtemp(dir=scratch)
+            history._store = HistoryStore(os.path.join(directory, "history"))
+            result_cache._cache = result_cache.ResultCache(directory=os.path.join(directory, "cache"))
+            cache = UploadCache()
+
+            def run():
+                image = cache.image("upload", image_bytes, name)
+                mask = cache.mask("mask", mask_bytes, image)
+                payload, payload_mask = cache.payload(image, mask, size)
+                result = run_recorded(generate_variations, "Inpainting (Mask)", PROMPT,
+                                      prompt=PROMPT, image=payload, mask=payload_mask, size=size, n=1, quality="high")
+                for generated in result.images:
+                    generated.preview()
+                return result
+            return run, lambda result: sum(len(generated.data) for generated in result.images)
+        return prepare
+
+    raise ValueError(f"Unknown stage {stage!r}")
+
+
+def run_case(spec):
+    """Run one case in this process and return its result record"""
+    prepare = stage_runner(spec["stage"], spec.get("image"), spec.get("mask"), spec.get("size"), spec["scratch"])
+    timings, disk, output_bytes = [], 0, None
+    for _ in range(spec["repeat"]):
+        run, measure = prepare()
+        written = _disk_write_bytes()
+        start = time.perf_counter()
+        output = run()
+        timings.append(time.perf_counter() - start)
+        after = _disk_write_bytes()
+        disk = None if written is None or after is None else disk + after - written
+        output_bytes = measure(output)
+    return {
+        "case": spec["case"],
+        "stage": spec["stage"],
+        "input": spec.get("input"),
+        "size": spec.get("size"),
+        "repeat": spec["repeat"],
+        "wall_seconds": {"median": statistics.median(timings), "min": min(timings), "max": max(timings)},
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "disk_write_bytes": None if disk is None else disk // spec["repeat"],
+        "output_bytes": output_bytes,
+    }
+
+
+def plan_cases(stages, inputs, sizes):
+    cases = []
+    for stage in stages:
+        axes = STAGE_AXES[stage]
+        for input_name in (inputs if "input" in axes else [None]):
+            for size in (sizes if "size" in axes else [None]):
+                case = "/".join([stage, input_name or "-", size or "-"])
+                cases.append({"case": case, "stage": stage, "input": input_name, "size": size})
+    return cases
+
+
+def environment():
+    from PIL import __version__ as pillow_version
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "python": platform.python_version(),
+        "pillow": pillow_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit or None,
+        "image_executor": os.getenv("IMAGEGEN_IMAGE_EXECUTOR", "thread"),
+    }
+
+
+def run_suite(args):
+    """Run every planned case in its own interpreter; returns the results document"""
+    from load_test import start_mock
+
+    cases = plan_cases(args.stages, args.inputs, args.sizes)
+    scratch = tempfile.mkdtemp(prefix="bench-suite-")
+    mock = None
+    try:
+        paths = write_inputs(scratch, sorted({case["input"] for case in cases if case["input"]}))
+        env = dict(os.environ, IMAGEGEN_CACHE_DIR=os.path.join(scratch, "cache"), IMAGEGEN_HISTORY_DIR="")
+        if any(case["stage"] == "end_to_end" for case in cases):
+            mock, endpoint = start_mock(argparse.Namespace(
+                latency="0", error_rate=0.0, throttle_rate=0.0, response_format="b64_json", detail="noise"
+            ))
+            env.update(IMAGEGEN_AOAI_ENDPOINT=endpoint, IMAGEGEN_AOAI_API_KEY="mock")
+        results = []
+        for case in cases:
+            spec = dict(case, repeat=args.repeat, scratch=scratch)
+            if case["input"]:
+                spec["image"], spec["mask"] = paths[case["input"]]
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--case", json.dumps(spec)],
+                env=env, capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                raise RuntimeError(f"Case {case['case']} failed:\n{completed.stderr}")
+            result = json.loads(completed.stdout.splitlines()[-1])
+            results.append(result)
+            if args.output != "-":
+                print(format_result(result), flush=True)
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+        shutil.rmtree(scratch, ignore_errors=True)
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "environment": environment(), "results": results}
+
+
+def format_result(result):
+    disk = result["disk_write_bytes"]
+    return (f"{result['case']:<40} {result['wall_seconds']['median'] * 1000:>9.1f} ms "
+            f"{result['peak_rss_mb']:>7.1f} MB rss {'-' if disk is None else f'{disk / 1024:.0f}':>7} KB disk "
+            f"{result['output_bytes'] / 1024:>8.0f} KB out")
+
+
+def _change(before, after, minimum):
+    """Relative change from before to after, or 0 when the absolute difference is within noise"""
+    if before is None or after is None or abs(after - before) < minimum:
+        return 0.0
+    return (after - before) / before if before else float("inf")
+
+
+def compare(baseline, current, threshold):
+    """Print each case's change against the baseline; returns the ids of cases that regressed"""
+    for key in ("python", "pillow", "cpus", "image_executor"):
+        if baseline["environment"].get(key) != current["environment"].get(key):
+            print(f"note: {key} differs: baseline {baseline['environment'].get(key)}, now {current['environment'].get(key)}")
+    before = {result["case"]: result for result in baseline["results"]}
+    regressions = []
+    print(f"{'case':<40} {'best ms':>20} {'change':>8} {'peak MB':>14} {'disk KB':>14}")
+    for result in current["results"]:
+        old = before.pop(result["case"], None)
+        if old is None:
+            print(f"{result['case']:<40} (not in baseline)")
+            continue
+        # The fastest repeat is the least disturbed by other load on the machine
+        wall = _change(old["wall_seconds"]["min"], result["wall_seconds"]["min"], MIN_WALL_DELTA_SECONDS)
+        rss = _change(old["peak_rss_mb"], result["peak_rss_mb"], MIN_RSS_DELTA_MB)
+        disk = _change(old["disk_write_bytes"], result["disk_write_bytes"], MIN_DISK_DELTA_BYTES)
+        worse = [name for name, change in (("wall", wall), ("rss", rss), ("disk", disk)) if change > threshold / 100]
+        if worse:
+            regressions.append(result["case"])
+        old_disk, new_disk = (value // 1024 if value is not None else "-" for value in (old["disk_write_bytes"], result["disk_write_bytes"]))
+        print(
+            f"{result['case']:<40} {old['wall_seconds']['min'] * 1000:>9.1f} -> {result['wall_seconds']['min'] * 1000:>7.1f} "
+            f"{wall * 100:>+7.0f}% {old['peak_rss_mb']:>6.0f} -> {result['peak_rss_mb']:>4.0f} {old_disk:>6} -> {new_disk:>4}"
+            + (f"  REGRESSION ({', '.join(worse)})" if worse else "")
+        )
+    if before:
+        print(f"{len(before)} baseline case(s) were not run")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--inputs", nargs="+", default=INPUTS, choices=INPUTS)
+    parser.add_argument("--sizes", nargs="+", default=SIZES, choices=SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results as JSON to this file, or - for stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a stored results file")
+    parser.add_argument("--current", metavar="RESULTS", help="with --compare, a results file to check instead of running the suite")
+    parser.add_argument("--threshold", type=float, default=20.0, help="percent change counted as a regression")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args)
+    if args.output == "-":
+        print(json.dumps(current, indent=2))
+    elif args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold:g}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
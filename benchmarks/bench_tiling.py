@@ -0,0 +1,98 @@
+"""Benchmark: bytes uploaded, API time and output resolution of tiled edits against whole-image edits.
+
+Runs each input through the usual edit path (fitted down to Image Size)
+and through tiling.generate_tiled, against mock_server.py in its own
+process. Inputs are the in-painting-example assets and a synthetic 24 MP
+JPEG, once with a small mask and once edited whole. API time adds up the
+network and server time of every request. Usage:
+
+    python benchmarks/bench_tiling.py [--size 1024x1024] [--latency uniform:0.8:1.2]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Results must come from the mock, not the cache, and every tile's trace must be kept
+os.environ["IMAGEGEN_CACHE_DIR"] = ""
+os.environ["IMAGEGEN_TRACE_HISTORY"] = "1000"
+
+from PIL import Image, ImageDraw
+
+import metrics
+from bench_preflight import EXAMPLE_DIR, synthetic_photo
+from generation import generate_image, load_mask
+from image_input import ImageInput
+from load_test import start_mock
+from tiling import generate_tiled
+
+
+def load_inputs():
+    with open(os.path.join(EXAMPLE_DIR, "image1.jpg"), "rb") as f:
+        example = ImageInput(f.read(), "image1.jpg")
+    with open(os.path.join(EXAMPLE_DIR, "mask.png"), "rb") as f:
+        example_mask = load_mask(f, example.size)
+
+    buf = io.BytesIO()
+    synthetic_photo((6000, 4000)).save(buf, format="JPEG", quality=92)
+    photo = ImageInput(buf.getvalue(), "photo.jpg")
+    region = Image.new("L", photo.size, 0)
+    ImageDraw.Draw(region).ellipse((4200, 2600, 5000, 3200), fill=255)
+    buf = io.BytesIO()
+    region.save(buf, format="PNG")
+    return [
+        ("in-painting-example", example, example_mask),
+        ("24MP JPEG, small mask", photo, load_mask(buf.getvalue(), photo.size)),
+        ("24MP JPEG, whole", photo, None),
+    ]
+
+
+def measure(run):
+    """Run one edit on fresh metrics; returns (result, upload bytes, requests, API seconds, wall seconds)"""
+    metrics._metrics = metrics.Metrics()
+    start = time.perf_counter()
+    result = run()
+    wall = time.perf_counter() - start
+    traces = metrics.get_metrics().recent_traces()
+    uploaded = sum(trace.get("request_bytes", 0) for trace in traces)
+    api_seconds = sum(trace.get("network_s", 0) + trace.get("server_s", 0) for trace in traces)
+    return result, uploaded, len(traces), api_seconds, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1024x1024")
+    parser.add_argument("--latency", default="uniform:0.8:1.2")
+    parser.add_argument("--detail", choices=["flat", "gradient", "noise"], default="noise")
+    args = parser.parse_args()
+    args.error_rate = args.throttle_rate = 0.0
+    args.response_format = "b64_json"
+
+    mock, endpoint = start_mock(args)
+    os.environ["IMAGEGEN_AOAI_ENDPOINT"] = endpoint
+    os.environ.setdefault("IMAGEGEN_AOAI_API_KEY", "mock")
+
+    print(f"{'input':>22} {'mode':>6} {'requests':>9} {'upload':>9} {'API s':>7} {'wall s':>7} {'output':>11} {'kept':>6}")
+    try:
+        for label, image, mask in load_inputs():
+            width, height = image.size
+            for mode, run in (
+                ("whole", lambda: generate_image("a red ball", image, mask, args.size, use_cache=False)),
+                ("tiled", lambda: generate_tiled("a red ball", image, mask, args.size, use_cache=False)),
+            ):
+                result, uploaded, requests, api_seconds, wall = measure(run)
+                out_width, out_height = result.images[0].size
+                print(
+                    f"{label:>22} {mode:>6} {requests:>9} {uploaded / 1e6:>7.2f}MB {api_seconds:>7.2f} {wall:>7.2f} "
+                    f"{out_width:>5}x{out_height:<5} {out_width * out_height / (width * height):>6.0%}"
+                )
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark: pooled keep-alive transport vs. a fresh connection per request.
+
+Starts a local stub server (optionally TLS, using a throwaway self-signed
+certificate from the openssl CLI) and reports p50/p99 latency for sequential
+and concurrent request patterns. Usage:
+
+    python benchmarks/bench_transport.py [--requests N] [--concurrency C] [--tls]
+"""
+import argparse
+import os
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import urllib3
+
+from transport import Transport
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+RESPONSE_BODY = b'{"data": [{"url": "http://stub/image.png"}]}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections open between requests
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out as separate writes; avoid Nagle/delayed-ACK stalls
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(tls, workdir):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    scheme = "http"
+    if tls:
+        cert, key = os.path.join(workdir, "cert.pem"), os.path.join(workdir, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-subj", "/CN=127.0.0.1", "-keyout", key, "-out", cert],
+            check=True, capture_output=True,
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_port}/images/edits"
+
+
+def run(send, url, total, concurrency):
+    def one(_):
+        start = time.perf_counter()
+        response = send(url, data=b'{"prompt": "x"}', verify=False)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    if concurrency == 1:
+        return [one(i) for i in range(total)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(total)))
+
+
+def percentile(samples, pct):
+    return statistics.quantiles(samples, n=100)[pct - 1] if len(samples) > 1 else samples[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tls", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server, url = start_stub(args.tls, workdir)
+        print(f"stub: {url}")
+        print(f"{'pattern':>11} {'transport':>10} {'p50 ms':>8} {'p99 ms':>8} {'conns':>6}")
+        for pattern, concurrency in (("sequential", 1), ("concurrent", args.concurrency)):
+            for name in ("unpooled", "pooled"):
+                if name == "pooled":
+                    transport = Transport(pool_size=args.concurrency)
+                    send, connections = transport.post, lambda: transport.stats()["connections_opened"]
+                else:
+                    send, connections = requests.post, lambda: args.requests
+                samples = run(send, url, args.requests, concurrency)
+                print(
+                    f"{pattern:>11} {name:>10} {percentile(samples, 50) * 1000:>8.2f} "
+                    f"{percentile(samples, 99) * 1000:>8.2f} {connections():>6}"
+                )
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark: script time spent on uploads per Streamlit rerun, with and without the session upload cache.
+
+Replays a session that uploads an image and a mask, reruns a few times
+(e.g. preset clicks), then presses Transform with fanned-out variations.
+Without the cache every rerun re-reads the upload and reprocesses the
+mask, and every variation request fits the originals to the image size
+again. With it, the first rerun prepares everything once. Inputs are the
+same as bench_preflight.py. Usage:
+
+    python benchmarks/bench_upload_rerun.py [--reruns 10] [--n 4] [--size 1536x1024]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_preflight import load_inputs
+from generation import load_mask
+from image_input import ImageInput
+from preflight import preflight
+from upload_cache import UploadCache
+
+
+def uncached_session(name, image_bytes, mask_bytes, size, reruns, n):
+    """The per-rerun work the app did before the cache; returns (rerun seconds, transform seconds)"""
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        image = ImageInput(image_bytes, name)
+        image.size
+        # st.image(uploaded_file) hands the whole upload to the media manager
+        bytes(image.data)
+        mask = load_mask(mask_bytes, image.size)
+        mask.data.tobytes()
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(n):
+        preflight(image, mask, size)
+    return timings, time.perf_counter() - start
+
+
+def cached_session(name, image_bytes, mask_bytes, size, reruns, n):
+    cache = UploadCache()
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        image = cache.image("upload", image_bytes, name)
+        mask = cache.mask("mask", mask_bytes, image)
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    fitted, fitted_mask = cache.payload(image, mask, size)
+    for _ in range(n):
+        preflight(fitted, fitted_mask, size)
+    return timings, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--n", type=int, default=4, help="fanned-out variations per Transform")
+    parser.add_argument("--size", default="1536x1024")
+    args = parser.parse_args()
+
+    print(f"{'input':>20} {'cache':>6} {'first ms':>9} {'rerun p50 ms':>13} {'transform ms':>13}")
+    for label, image, mask_bytes in load_inputs():
+        image_bytes = bytes(image.data)
+        for mode, session in (("off", uncached_session), ("on", cached_session)):
+            timings, transform = session(image.name, image_bytes, mask_bytes, args.size, args.reruns, args.n)
+            print(
+                f"{label:>20} {mode:>6} {timings[0] * 1000:>9.1f} "
+                f"{statistics.median(timings[1:] or timings) * 1000:>13.1f} {transform * 1000:>13.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Load test: N concurrent simulated sessions driving the generation core against the mock API.
+
+Each session sends its requests one after another, rotating through text to
+image, image editing and in-painting. Editing uses the in-painting-example
+assets. By default mock_server.py is started in its own process with the
+given latency and failure injection, so its work does not compete with the
+client for the GIL. --endpoint points at one already running. Reports
+throughput, latency percentiles and how the retries went. Usage:
+
+    python benchmarks/load_test.py --sessions 16 --requests 10 --latency lognormal:0.0:0.5 --throttle-rate 0.05
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Results must come from the mock, not the cache
+os.environ["IMAGEGEN_CACHE_DIR"] = ""
+
+from generation import generate_variations, load_mask
+from image_input import ImageInput
+from metrics import _percentile, get_metrics
+
+MODES = ["Text to Image", "Image Editing", "Inpainting (Mask)"]
+
+
+def start_mock(args):
+    """Run mock_server.py on a free port; returns (process, endpoint)"""
+    command = [
+        sys.executable, os.path.join(ROOT, "mock_server.py"), "--port", "0",
+        "--latency", args.latency, "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+        "--format", args.response_format, "--detail", args.detail,
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    # The first line reads "Mock images API on http://host:port; ..."
+    endpoint = process.stdout.readline().split(" on ", 1)[1].split(";", 1)[0]
+    return process, endpoint
+
+
+def load_example():
+    with open(os.path.join(ROOT, "in-painting-example", "image1.jpg"), "rb") as f:
+        image = ImageInput(f.read(), "image1.jpg")
+    with open(os.path.join(ROOT, "in-painting-example", "mask.png"), "rb") as f:
+        mask = load_mask(f, image.size)
+    return image, mask
+
+
+def run_session(session, requests_per_session, args, image, mask, samples, lock):
+    for index in range(requests_per_session):
+        mode = MODES[(session + index) % len(MODES)]
+        kwargs = {
+            "prompt": f"session {session} request {index}",
+            "size": args.size, "n": args.n, "quality": "low",
+            "use_cache": False, "fan_out": args.fan_out,
+        }
+        if mode != "Text to Image":
+            kwargs["image"] = image
+        if mode == "Inpainting (Mask)":
+            kwargs["mask"] = mask
+        start = time.perf_counter()
+        try:
+            result = generate_variations(**kwargs)
+            outcome = ("ok", len(result.images))
+        except Exception as e:
+            outcome = (type(e).__name__, 0)
+        with lock:
+            samples.append((mode, time.perf_counter() - start) + outcome)
+
+
+def run_load(sessions, requests_per_session, args):
+    image, mask = load_example()
+    samples = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=run_session, args=(session, requests_per_session, args, image, mask, samples, lock))
+        for session in range(sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=5, help="requests per session")
+    parser.add_argument("--size", default="1024x1024")
+    parser.add_argument("--n", type=int, default=1)
+    parser.add_argument("--fan-out", action="store_true")
+    parser.add_argument("--endpoint", help="use a mock (or real) endpoint that is already running")
+    parser.add_argument("--latency", default="uniform:0.2:0.6")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--format", dest="response_format", choices=["b64_json", "url"], default="b64_json")
+    parser.add_argument("--detail", choices=["flat", "gradient", "noise"], default="noise")
+    args = parser.parse_args()
+
+    mock = None
+    if args.endpoint is None:
+        mock, args.endpoint = start_mock(args)
+    os.environ["IMAGEGEN_AOAI_ENDPOINT"] = args.endpoint
+    os.environ.setdefault("IMAGEGEN_AOAI_API_KEY", "mock")
+
+    samples, wall = run_load(args.sessions, args.requests, args)
+    if mock:
+        mock.terminate()
+        mock.wait()
+
+    ok = [latency for _, latency, outcome, _ in samples if outcome == "ok"]
+    images = sum(count for *_, count in samples)
+    failures = {}
+    for _, _, outcome, _ in samples:
+        if outcome != "ok":
+            failures[outcome] = failures.get(outcome, 0) + 1
+    ordered = sorted(ok) or [0.0]
+    print(f"endpoint: {args.endpoint}")
+    print(f"sessions: {args.sessions} x {args.requests} requests, wall {wall:.2f}s")
+    print(f"throughput: {len(samples) / wall:.2f} requests/s, {images / wall * 60:.1f} images/min")
+    print(f"errors: {len(samples) - len(ok)}/{len(samples)} {failures or ''}".rstrip())
+    print("latency ms: " + ", ".join(
+        f"p{pct} {_percentile(ordered, pct) * 1000:.0f}" for pct in (50, 90, 99)
+    ) + f", max {ordered[-1] * 1000:.0f}")
+    for mode in MODES:
+        mode_ok = sorted(latency for name, latency, outcome, _ in samples if name == mode and outcome == "ok")
+        if mode_ok:
+            print(f"  {mode:>18}: p50 {_percentile(mode_ok, 50) * 1000:.0f} ms, p90 {_percentile(mode_ok, 90) * 1000:.0f} ms")
+    counters = get_metrics().summary()["counters"]
+    print("retries:", {key: value for key, value in counters.items() if key.startswith(("retries", "throttled", "circuit"))})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from metrics import get_metrics
+
+# Share one upstream call between identical generations that are in flight at the same time
+COALESCE_ENABLED = os.getenv("IMAGEGEN_COALESCE", "true").lower() in ("1", "true", "yes")
+
+
+class _Flight:
+    def __init__(self):
+        self.future = Future()
+        self.waiters = 0
+        # Set when every waiter has left; the call checks it before each attempt
+        self.cancelled = threading.Event()
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and hands its outcome to every caller waiting on it.
+
+    The call runs on its own thread, so every caller is just a waiter and
+    can stop waiting. When the last waiter leaves before the call is done,
+    the flight is cancelled: fn's cancelled event is set and the key is
+    freed, so the next caller starts a new call. An exception from fn is
+    raised in every waiter.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "coalesced": 0, "cancelled": 0, "abandoned": 0}
+
+    def run(self, key, fn, timeout=None):
+        """Return fn(cancelled)'s result, joining the call already in flight for key if there is one.
+
+        Raises concurrent.futures.TimeoutError if the result is not ready
+        within timeout seconds; the caller has then left the flight.
+        """
+        metrics = get_metrics()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.counters["calls"] += 1
+            else:
+                self.counters["coalesced"] += 1
+            flight.waiters += 1
+        if leader:
+            threading.Thread(target=self._call, args=(key, flight, fn), name="imagegen-flight", daemon=True).start()
+        else:
+            metrics.inc("coalesced_requests_total")
+
+        try:
+            return flight.future.result(timeout)
+        except TimeoutError:
+            self._leave(key, flight)
+            raise
+        finally:
+            with self._lock:
+                flight.waiters = max(0, flight.waiters - 1)
+
+    def _call(self, key, flight, fn):
+        try:
+            flight.future.set_result(fn(flight.cancelled))
+        except BaseException as e:
+            flight.future.set_exception(e)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def _leave(self, key, flight):
+        with self._lock:
+            self.counters["abandoned"] += 1
+            if flight.waiters > 1 or flight.future.done():
+                return
+            # The last waiter is leaving: free the key and tell the call to stop
+            flight.cancelled.set()
+            self.counters["cancelled"] += 1
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        get_metrics().inc("coalesce_cancelled_total")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._flights))
+
+
+_flights = None
+_flights_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Return the process-wide single-flight group, creating it on first use"""
+    global _flights
+    if _flights is None:
+        with _flights_lock:
+            if _flights is None:
+                _flights = SingleFlight()
+    return _flights
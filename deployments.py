@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+import time
+
+from rate_limit import QUOTA_RPM, QUOTA_TPM, RETRYABLE_STATUS, CircuitOpenError, RequestCancelledError, RequestScheduler
+
+IMAGEGEN_API_VERSION = "2025-04-01-preview"
+
+# Weight of the newest sample in each backend's latency average
+LATENCY_EWMA_ALPHA = 0.3
+
+
+class Backend:
+    """One Azure OpenAI image deployment and the live signals used to route to it"""
+
+    def __init__(self, name, endpoint, deployment, api_key, rpm=QUOTA_RPM, tpm=QUOTA_TPM,
+                 api_version=IMAGEGEN_API_VERSION, scheduler=None):
+        self.name = name
+        self.endpoint = endpoint.rstrip("/")
+        self.deployment = deployment
+        self.api_key = api_key
+        self.api_version = api_version
+        self.scheduler = scheduler or RequestScheduler(name, rpm=rpm, tpm=tpm)
+        self.in_flight = 0
+        self.latency = None
+        self.headroom = 1.0
+        self._lock = threading.Lock()
+
+    def url(self, operation):
+        """URL of an images operation ("edits" or "generations") on this deployment"""
+        return f"{self.endpoint}/openai/deployments/{self.deployment}/images/{operation}?api-version={self.api_version}"
+
+    @property
+    def healthy(self):
+        return self.scheduler.breaker.available()
+
+    def score(self, default_latency):
+        """Lower is better: expected wait, scaled up as rate-limit headroom runs out"""
+        latency = self.latency if self.latency is not None else default_latency
+        return (self.in_flight + 1) * latency / max(self.headroom, 0.05)
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, elapsed=None, headers=None):
+        with self._lock:
+            self.in_flight -= 1
+            if elapsed is not None:
+                if self.latency is None:
+                    self.latency = elapsed
+                else:
+                    self.latency += LATENCY_EWMA_ALPHA * (elapsed - self.latency)
+            if headers is not None:
+                try:
+                    remaining = int(headers["x-ratelimit-remaining-requests"])
+                    limit = int(headers["x-ratelimit-limit-requests"])
+                    self.headroom = remaining / limit if limit else 1.0
+                except (KeyError, ValueError):
+                    pass
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "circuit": self.scheduler.breaker.state,
+            "in_flight": self.in_flight,
+            "latency_s": round(self.latency, 3) if self.latency is not None else None,
+            "headroom": round(self.headroom, 3),
+        }
+
+
+class DeploymentPool:
+    """Routes each request to the backend with the best score among the healthy ones.
+
+    The score combines in-flight requests, observed latency and the
+    remaining rate-limit headroom. Backends whose circuit breaker is open
+    drop out until their reset timeout passes and a trial call succeeds. A
+    request that still fails with 429/5xx on one backend, or that meets an
+    open circuit, fails over to the next backend not yet tried.
+    """
+
+    def __init__(self, backends):
+        if not backends:
+            raise ValueError("At least one image deployment must be configured")
+        self.backends = backends
+        self._lock = threading.Lock()
+
+    def choose(self, exclude=()):
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            healthy = [b for b in candidates if b.healthy]
+            if not healthy:
+                return None
+            known = [b.latency for b in healthy if b.latency is not None]
+            # Untried backends look faster than the best known one, so each gets probed
+            default_latency = min(known) / 2 if known else 1.0
+            backend = min(healthy, key=lambda b: b.score(default_latency))
+            backend.started()
+            return backend
+
+    def send(self, build_call, cost_tokens=0, cancelled=None):
+        """Send build_call(backend)() to the best backend, failing over; returns (response, backend).
+
+        Stops with RequestCancelledError once the cancelled event is set.
+        """
+        tried = []
+        last_error = None
+        response = None
+        while True:
+            backend = self.choose(exclude=tried)
+            if backend is None:
+                if response is not None:
+                    return response, tried[-1]
+                raise last_error or CircuitOpenError("No healthy image deployment is available.")
+            tried.append(backend)
+            start = time.perf_counter()
+            try:
+                response = backend.scheduler.send(build_call(backend), cost_tokens=cost_tokens, cancelled=cancelled)
+            except RequestCancelledError:
+                # Nobody wants the answer from any deployment
+                backend.finished()
+                raise
+            except Exception as e:
+                backend.finished()
+                last_error = e
+                continue
+            backend.finished(time.perf_counter() - start, response.headers)
+            if response.status_code not in RETRYABLE_STATUS or len(tried) == len(self.backends):
+                return response, backend
+            response.close()
+
+    def stats(self):
+        return [backend.stats() for backend in self.backends]
+
+
+def _backend_from_config(entry):
+    endpoint = entry.get("endpoint") or f"https://{entry['resource']}.openai.azure.com"
+    api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", ""), "")
+    return Backend(
+        name=entry.get("name") or entry.get("resource") or endpoint,
+        endpoint=endpoint,
+        deployment=entry.get("deployment", "gpt-image-1"),
+        api_key=api_key,
+        rpm=float(entry.get("rpm", QUOTA_RPM)),
+        tpm=float(entry.get("tpm", QUOTA_TPM)),
+        api_version=entry.get("api_version", IMAGEGEN_API_VERSION),
+    )
+
+
+def load_backends():
+    """Build backends from IMAGEGEN_DEPLOYMENTS(_FILE), falling back to the single IMAGEGEN_* deployment.
+
+    IMAGEGEN_DEPLOYMENTS holds a JSON list; IMAGEGEN_DEPLOYMENTS_FILE names a
+    JSON file with the same list. Each entry takes "resource" or "endpoint",
+    "deployment", "api_key" or "api_key_env", and optional "name", "rpm",
+    "tpm" and "api_version".
+    """
+    raw = os.getenv("IMAGEGEN_DEPLOYMENTS")
+    path = os.getenv("IMAGEGEN_DEPLOYMENTS_FILE")
+    if path and not raw:
+        with open(path) as f:
+            raw = f.read()
+    if raw:
+        return [_backend_from_config(entry) for entry in json.loads(raw)]
+
+    resource = os.getenv("IMAGEGEN_AOAI_RESOURCE", "eduar-ma108754-westus3")
+    return [_backend_from_config({
+        "name": resource,
+        "resource": resource,
+        "endpoint": os.getenv("IMAGEGEN_AOAI_ENDPOINT"),
+        "deployment": os.getenv("IMAGEGEN_DEPLOYMENT", "gpt-image-1"),
+        "api_key": os.getenv("IMAGEGEN_AOAI_API_KEY", ""),
+    })]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_deployment_pool():
+    """Return the process-wide deployment pool, creating it from the environment on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = DeploymentPool(load_backends())
+    return _pool
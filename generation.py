@@ -0,0 +1,334 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+from coalesce import COALESCE_ENABLED, get_single_flight
+from deployments import get_deployment_pool
+from image_input import ImageInput, MultipartBody
+from image_workers import ImageWorkersBusyError, get_image_executor
+from mask_processing import prepare_mask
+from metrics import Trace, get_metrics
+from preflight import preflight
+from rate_limit import CircuitOpenError, RequestCancelledError, estimate_tokens
+from responses import Base64DecodeError, GeneratedImage, elide_response, parse_stream
+from result_cache import cache_key, get_result_cache
+
+# Deployment name used in cache keys; deployments.py reads the endpoint settings
+IMAGEGEN_DEPLOYMENT = os.getenv("IMAGEGEN_DEPLOYMENT", "gpt-image-1")
+
+# Size of the pieces the API response body is read and decoded in
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+# Response headers recorded in each request trace
+RATE_LIMIT_HEADERS = (
+    "x-ratelimit-remaining-requests", "x-ratelimit-remaining-tokens",
+    "x-ratelimit-limit-requests", "x-ratelimit-limit-tokens", "retry-after",
+)
+# Headers giving the server's own processing time in milliseconds
+SERVER_TIME_HEADERS = ("openai-processing-ms", "x-envoy-upstream-service-time")
+
+# Maximum concurrent requests per fanned-out generation
+FANOUT_PARALLELISM = int(os.getenv("IMAGEGEN_FANOUT_PARALLELISM", "4"))
+# Seconds a generation waits for its (possibly shared) API call; an abandoned call stops retrying (0 = no limit)
+GENERATION_TIMEOUT = float(os.getenv("IMAGEGEN_GENERATION_TIMEOUT", "600"))
+
+
+class GenerationError(Exception):
+    """Raised when the image service returns an error or no usable images"""
+
+
+class APIError(GenerationError):
+    """A non-200 answer from the images API"""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"API Error: {status_code} - {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+class MaskError(GenerationError):
+    """A mask that could not be read or prepared"""
+
+
+class RequestCancelled(GenerationError):
+    """A request abandoned by every caller waiting for it before it was sent"""
+
+
+class GenerationResult:
+    """The images a generation produced, plus messages for items that failed.
+
+    cached is True when every image came from the result cache.
+    """
+
+    def __init__(self, images, item_errors=(), cached=False):
+        self.images = list(images)
+        self.item_errors = list(item_errors)
+        self.cached = cached
+
+
+def _api_error(response):
+    """Build an APIError from a non-200 API response"""
+    try:
+        error_detail = response.json().get("error", {})
+    except ValueError:
+        error_detail = {}
+    return APIError(response.status_code, error_detail.get("message", "No details provided"))
+
+
+def load_mask(source, target_dimensions):
+    """Binarize and resize a mask to target_dimensions; returns an ImageInput holding the PNG"""
+    if hasattr(source, "read"):
+        # Open files stay with the caller; the image worker gets their bytes
+        source = source.read()
+    try:
+        return ImageInput(get_image_executor().run(prepare_mask, source, tuple(target_dimensions)), "mask.png")
+    except ImageWorkersBusyError:
+        raise
+    except Exception as e:
+        raise MaskError(f"Error processing mask: {str(e)}")
+
+
+def _counted(chunks, trace):
+    """Pass body chunks through while adding up their size in trace.fields["response_bytes"]"""
+    trace.fields["response_bytes"] = 0
+    for chunk in chunks:
+        trace.fields["response_bytes"] += len(chunk)
+        yield chunk
+
+
+def _record_response(trace, backend, response):
+    """Copy the status, server time and rate-limit headers of a response into the trace and gauges"""
+    metrics = get_metrics()
+    headers = response.headers
+    trace.fields["deployment"] = backend.name
+    trace.fields["status"] = response.status_code
+    for name in SERVER_TIME_HEADERS:
+        if name in headers:
+            try:
+                server_seconds = float(headers[name]) / 1000
+            except ValueError:
+                continue
+            trace.stages["server"] = server_seconds
+            trace.stages["network"] = max(0.0, trace.stages["network"] - server_seconds)
+            break
+    for name in RATE_LIMIT_HEADERS:
+        if name in headers:
+            trace.fields[name] = headers[name]
+            try:
+                metrics.set(name.replace("-", "_"), float(headers[name]), deployment=backend.name)
+            except ValueError:
+                pass
+
+
+def request_images(prompt, image=None, mask=None, size="1024x1024", n=1, quality="high", cancelled=None):
+    """Generate or edit an image using Azure OpenAI's image generation service.
+
+    Returns (list of PNG bytes, list of per-item error messages). Raises
+    GenerationError on failure, and RequestCancelled if the cancelled event
+    is set before an attempt is sent. Every call leaves a Trace in the
+    metrics with encode, network, server and decode timings, payload
+    sizes, the status code and the rate-limit headers.
+    """
+    trace = Trace("edits" if image else "generations")
+    try:
+        return _request_images(trace, prompt, image, mask, size, n, quality, cancelled)
+    except Exception as e:
+        trace.fields["error"] = str(e)
+        raise
+    finally:
+        get_metrics().record_trace(trace)
+
+
+def _request_images(trace, prompt, image, mask, size, n, quality, cancelled):
+    # The HTTP stack is only loaded once a request is actually made
+    import requests
+    from transport import get_transport
+
+    transport = get_transport()
+    with trace.stage("encode"):
+        if image:
+            # Downscale to the requested size before encoding; the mask gets the same crop and scale
+            image, mask = preflight(image, mask, size)
+            trace.fields["upload_size"] = "{}x{}".format(*image.size)
+            # Prepare files and data for multipart/form-data
+            files = {"image": image.multipart_file()}
+            data = {
+                "prompt": prompt,
+                "model": "gpt-image-1",
+                "size": size,
+                "n": str(n),  # Convert to string for form-data
+                "quality": quality
+            }
+            if mask:
+                files["mask"] = mask.multipart_file()
+            body = MultipartBody(data, files)
+            content_type = body.content_type
+        else:
+            # Text-to-image generation
+            payload = {
+                "prompt": prompt,
+                "n": n,
+                "quality": quality,
+                "size": size,
+                "output_format": "png",
+            }
+            body = json.dumps(payload).encode()
+            content_type = "application/json"
+    trace.fields["request_bytes"] = len(body)
+
+    def build_call(backend):
+        def call():
+            return transport.post(
+                backend.url(trace.operation),
+                headers={"api-key": backend.api_key, "Content-Type": content_type},
+                data=body, stream=True
+            )
+        return call
+
+    # The pool picks a deployment and fails over; each deployment's scheduler applies backoff and quotas,
+    # and checks before every attempt whether the request was abandoned
+    try:
+        with trace.stage("network"):
+            response, backend = get_deployment_pool().send(
+                build_call, cost_tokens=estimate_tokens(size, quality, n), cancelled=cancelled
+            )
+    except RequestCancelledError as e:
+        raise RequestCancelled(str(e))
+    except CircuitOpenError as e:
+        raise GenerationError(str(e))
+    _record_response(trace, backend, response)
+
+    with response:
+        if response.status_code != 200:
+            raise _api_error(response)
+        # Decode b64_json fields chunk by chunk instead of holding the whole body
+        try:
+            with trace.stage("decode"):
+                response_json = parse_stream(_counted(response.iter_content(chunk_size=RESPONSE_CHUNK_SIZE), trace))
+        except ValueError as e:
+            raise GenerationError(f"Malformed API response: {str(e)}")
+    if not isinstance(response_json, dict):
+        raise GenerationError("Malformed API response: expected a JSON object")
+    # Small enough to keep: image data is elided and long strings are cut
+    trace.fields["response"] = elide_response(response_json)
+
+    images_data = response_json.get("data")
+    if not images_data:
+        raise GenerationError("No images returned by the API. 'data' field is empty or missing.")
+
+    image_list = []
+    item_errors = []
+    for idx, img in enumerate(images_data):
+        if "b64_json" in img:
+            # Base64 data was already decoded while the response streamed in
+            if isinstance(img["b64_json"], Base64DecodeError):
+                item_errors.append(f"Failed to decode base64 image data for item {idx}: {str(img['b64_json'])}")
+            else:
+                image_list.append(img["b64_json"])
+        elif "url" in img:
+            try:
+                with trace.stage("download"):
+                    img_response = transport.get(img["url"], timeout=(transport.timeout[0], 10))
+                    img_response.raise_for_status()
+                    image_list.append(img_response.content)
+            except requests.exceptions.RequestException as e:
+                item_errors.append(f"Failed to download image from URL {img['url']}: {str(e)}")
+        else:
+            item_errors.append(f"No 'b64_json' or 'url' found in API response data item {idx}.")
+
+    if not image_list:
+        raise GenerationError("No images were successfully processed. " + " ".join(item_errors))
+    return image_list, item_errors
+
+
+def generate_image(prompt, image=None, mask=None, size="1024x1024", n=1, quality="high", use_cache=True, variant=0):
+    """Generate or edit an image, serving repeated requests from the result cache.
+
+    Identical requests that miss the cache while one is already in flight
+    wait for that one instead of making their own upstream call. Bypassing
+    the cache also bypasses this sharing. A shared call is waited for at
+    most GENERATION_TIMEOUT seconds; once every caller has given up on it,
+    it is not retried any further.
+    """
+    cache = get_result_cache()
+    key = cache_key(
+        prompt,
+        image.data if image else None,
+        mask.data if mask else None,
+        size, quality, n, IMAGEGEN_DEPLOYMENT, variant
+    )
+    image_bytes = cache.get(key) if use_cache else None
+    if image_bytes is not None:
+        return GenerationResult([GeneratedImage(data) for data in image_bytes], cached=True)
+
+    def call(cancelled):
+        image_bytes, item_errors = request_images(prompt, image, mask, size, n, quality, cancelled)
+        # Only complete results are cached; a bypassed lookup still refreshes the entry
+        if len(image_bytes) == n:
+            cache.put(key, image_bytes)
+        return image_bytes, item_errors
+
+    if use_cache and COALESCE_ENABLED:
+        try:
+            image_bytes, item_errors = get_single_flight().run(key, call, timeout=GENERATION_TIMEOUT or None)
+        except TimeoutError:
+            raise GenerationError(f"The image service did not answer within {GENERATION_TIMEOUT:g} seconds.")
+    else:
+        image_bytes, item_errors = call(None)
+    # Results stay encoded; pixels are decoded only when something displays them
+    return GenerationResult([GeneratedImage(data) for data in image_bytes], item_errors)
+
+
+def generate_variations(prompt, image=None, mask=None, size="1024x1024", n=1, quality="high",
+                        use_cache=True, fan_out=False, parallelism=FANOUT_PARALLELISM, job=None):
+    """Generate n results, either in one request or fanned out into concurrent n=1 requests.
+
+    When fanned out, each image is appended to job.partial as soon as it
+    arrives and a failed variation does not discard the others. Records
+    time-to-first-image and total wall time per strategy in the metrics.
+    """
+    metrics = get_metrics()
+    strategy = "fan-out" if fan_out and n > 1 else "single"
+    start = time.perf_counter()
+
+    if strategy == "single":
+        result = generate_image(prompt, image, mask, size, n, quality, use_cache)
+        elapsed = time.perf_counter() - start
+        metrics.observe("time_to_first_image_seconds", elapsed, strategy=strategy)
+        metrics.observe("generation_wall_seconds", elapsed, strategy=strategy)
+        return result
+
+    results = [None] * n
+    item_errors = []
+    cached = True
+    first_image_at = None
+    with ThreadPoolExecutor(max_workers=min(parallelism, n), thread_name_prefix="imagegen-variation") as pool:
+        futures = {
+            pool.submit(generate_image, prompt, image, mask, size, 1, quality, use_cache, index): index
+            for index in range(n)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                variation = future.result()
+            except Exception as e:
+                item_errors.append(f"Variation {index + 1} failed: {str(e)}")
+                continue
+            item_errors.extend(variation.item_errors)
+            cached = cached and variation.cached
+            results[index] = variation.images[0]
+            if first_image_at is None:
+                first_image_at = time.perf_counter() - start
+            if job is not None:
+                job.partial.append(variation.images[0])
+
+    elapsed = time.perf_counter() - start
+    if first_image_at is not None:
+        metrics.observe("time_to_first_image_seconds", first_image_at, strategy=strategy)
+    metrics.observe("generation_wall_seconds", elapsed, strategy=strategy)
+
+    images = [img for img in results if img is not None]
+    if not images:
+        raise GenerationError("All variations failed. " + " ".join(item_errors))
+    return GenerationResult(images, item_errors, cached=cached and not item_errors)
@@ -0,0 +1,231 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from PIL import Image
+
+from image_workers import get_image_executor
+
+# Where generations are kept across restarts; an empty string turns the history off
+HISTORY_DIR = os.getenv("IMAGEGEN_HISTORY_DIR", ".image_history")
+# Longest side of the gallery thumbnails, in pixels
+THUMBNAIL_SIDE = 256
+THUMBNAIL_QUALITY = 80
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    prompt TEXT NOT NULL,
+    preset TEXT,
+    mode TEXT NOT NULL,
+    size TEXT,
+    quality TEXT,
+    n INTEGER,
+    cached INTEGER NOT NULL DEFAULT 0,
+    latency_seconds REAL,
+    item_errors TEXT
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    generation_id INTEGER NOT NULL REFERENCES generations(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    PRIMARY KEY (generation_id, position)
+);
+CREATE INDEX IF NOT EXISTS generations_created ON generations(created);
+CREATE INDEX IF NOT EXISTS generations_mode ON generations(mode, created);
+CREATE INDEX IF NOT EXISTS generations_prompt ON generations(prompt);
+CREATE INDEX IF NOT EXISTS outputs_digest ON outputs(digest);
+"""
+
+
+def _thumbnail(data, side=THUMBNAIL_SIDE):
+    with Image.open(io.BytesIO(data)) as img:
+        size = img.size
+        img.draft("RGB", (side, side))
+        img.thumbnail((side, side), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=THUMBNAIL_QUALITY)
+    return buf.getvalue(), size
+
+
+class HistoryStore:
+    """Generations kept on disk: metadata in SQLite, images and thumbnails in a content-addressed directory.
+
+    Each image is stored once under the SHA-256 of its bytes, next to a
+    small JPEG thumbnail made when it is recorded. Listing a page reads
+    only metadata, so the gallery never loads full images; callers fetch
+    a thumbnail or the image itself by digest.
+    """
+
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        self._lock = threading.Lock()
+        # One connection shared by the script and worker threads, serialized by the lock
+        self._db = sqlite3.connect(os.path.join(directory, "history.db"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+
+    def _blob_path(self, digest, suffix):
+        return os.path.join(self.directory, "blobs", digest[:2], f"{digest}{suffix}")
+
+    def _write_blob(self, digest, suffix, data):
+        path = self._blob_path(digest, suffix)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def record(self, prompt, images, mode, preset=None, size=None, quality=None,
+               cached=False, latency_seconds=None, item_errors=()):
+        """Store a generation's PNG bytes and metadata; returns its id"""
+        outputs = []
+        for data in images:
+            digest = hashlib.sha256(data).hexdigest()
+            if not os.path.exists(self._blob_path(digest, ".jpg")):
+                thumbnail, (width, height) = get_image_executor().run(_thumbnail, data)
+                self._write_blob(digest, ".png", data)
+                # The thumbnail is written last; its presence marks the blob complete
+                self._write_blob(digest, ".jpg", thumbnail)
+            else:
+                with Image.open(io.BytesIO(data)) as img:
+                    width, height = img.size
+            outputs.append((digest, len(data), width, height))
+
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO generations (created, prompt, preset, mode, size, quality, n, cached, latency_seconds, item_errors)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), prompt, preset, mode, size, quality, len(outputs), int(cached),
+                 latency_seconds, json.dumps(list(item_errors)) if item_errors else None),
+            )
+            generation_id = cursor.lastrowid
+            self._db.executemany(
+                "INSERT INTO outputs (generation_id, position, digest, bytes, width, height) VALUES (?, ?, ?, ?, ?, ?)",
+                [(generation_id, position) + output for position, output in enumerate(outputs)],
+            )
+        return generation_id
+
+    def _where(self, mode=None, search=None):
+        clauses, params = [], []
+        if mode:
+            clauses.append("mode = ?")
+            params.append(mode)
+        if search:
+            clauses.append("prompt LIKE ? ESCAPE '\\'")
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, mode=None, search=None):
+        where, params = self._where(mode, search)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM generations{where}", params).fetchone()[0]
+
+    def _with_outputs(self, rows):
+        # Caller holds the lock
+        entries = [dict(row) for row in rows]
+        by_id = {}
+        for entry in entries:
+            entry["outputs"] = []
+            entry["item_errors"] = json.loads(entry["item_errors"]) if entry["item_errors"] else []
+            by_id[entry["id"]] = entry
+        if entries:
+            marks = ",".join("?" * len(entries))
+            for output in self._db.execute(
+                f"SELECT * FROM outputs WHERE generation_id IN ({marks}) ORDER BY generation_id, position",
+                list(by_id),
+            ):
+                by_id[output["generation_id"]]["outputs"].append(dict(output))
+        return entries
+
+    def page(self, offset=0, limit=12, mode=None, search=None):
+        """Newest-first metadata of up to limit generations, each with its outputs' digests and sizes"""
+        where, params = self._where(mode, search)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM generations{where} ORDER BY created DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+            return self._with_outputs(rows)
+
+    def get(self, generation_id):
+        """Metadata of one generation, or None"""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM generations WHERE id = ?", (generation_id,)).fetchall()
+            entries = self._with_outputs(rows)
+        return entries[0] if entries else None
+
+    def thumbnail(self, digest):
+        """JPEG thumbnail bytes for an output digest"""
+        with open(self._blob_path(digest, ".jpg"), "rb") as f:
+            return f.read()
+
+    def image(self, digest):
+        """The full PNG bytes for an output digest"""
+        with open(self._blob_path(digest, ".png"), "rb") as f:
+            return f.read()
+
+    def stats(self):
+        with self._lock:
+            generations, outputs, blobs, stored = self._db.execute(
+                "SELECT (SELECT COUNT(*) FROM generations), COUNT(*), COUNT(DISTINCT digest),"
+                " (SELECT COALESCE(SUM(bytes), 0) FROM (SELECT DISTINCT digest, bytes FROM outputs)) FROM outputs"
+            ).fetchone()
+        return {"generations": generations, "outputs": outputs, "images": blobs, "image_bytes": stored}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def run_recorded(fn, mode, preset=None, job=None, **kwargs):
+    """Run a generation function and record its result in the history; returns the result.
+
+    Recording happens in the worker, so a result is kept even if its
+    session is gone before it collects it. result.history_id is set to
+    the new entry, or None when the history is off or could not be written.
+    """
+    if job is not None:
+        kwargs["job"] = job
+    start = time.perf_counter()
+    result = fn(**kwargs)
+    result.history_id = None
+    store = get_history_store()
+    if store is not None:
+        try:
+            result.history_id = store.record(
+                kwargs.get("prompt", ""), [image.data for image in result.images], mode, preset,
+                kwargs.get("size"), kwargs.get("quality"), result.cached,
+                round(time.perf_counter() - start, 3), result.item_errors,
+            )
+        except (OSError, sqlite3.Error):
+            # The history is best effort; the result itself is still returned
+            pass
+    return result
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Return the process-wide history store, or None when IMAGEGEN_HISTORY_DIR is empty"""
+    global _store
+    if _store is None and HISTORY_DIR:
+        with _store_lock:
+            if _store is None:
+                _store = HistoryStore()
+    return _store
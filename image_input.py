@@ -0,0 +1,141 @@
+import io
+import uuid
+from PIL import Image
+
+# Formats the edits endpoint receives as-is; anything else is re-encoded to PNG
+PASSTHROUGH_FORMATS = {"PNG"}
+
+# Largest piece of a file payload handed to the socket at once
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable read-only stream over a memoryview, so PIL can read without a copy"""
+
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+class ImageInput:
+    """An input image held in memory, from upload buffer to multipart body.
+
+    The original bytes are kept as a zero-copy view. Only the header is read
+    to learn the format and size; pixels are decoded at most once, and only
+    when the format has to be re-encoded for the API.
+    """
+
+    def __init__(self, data, name="image.png"):
+        self.data = memoryview(data)
+        self.name = name
+        self._header = None
+        self._payload = None
+
+    @classmethod
+    def from_upload(cls, uploaded_file):
+        """Wrap a Streamlit UploadedFile without copying its buffer"""
+        return cls(uploaded_file.getbuffer(), uploaded_file.name)
+
+    def open(self):
+        """Open the image with PIL; pixel data is loaded lazily"""
+        return Image.open(_BufferReader(self.data))
+
+    def _read_header(self):
+        if self._header is None:
+            with self.open() as img:
+                self._header = (img.format, img.size)
+        return self._header
+
+    @property
+    def format(self):
+        return self._read_header()[0]
+
+    @property
+    def size(self):
+        return self._read_header()[1]
+
+    def png_payload(self):
+        """Return PNG bytes for the API, re-encoding only when the format requires it"""
+        if self._payload is None:
+            if self.format in PASSTHROUGH_FORMATS:
+                self._payload = self.data
+            else:
+                with self.open() as img:
+                    img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+                    buf = io.BytesIO()
+                    img.save(buf, format="PNG")
+                self._payload = buf.getbuffer()
+        return self._payload
+
+    def multipart_file(self):
+        """Return a (filename, payload, content type) tuple for a multipart file field"""
+        stem = self.name.rsplit(".", 1)[0] if "." in self.name else self.name
+        return (f"{stem}.png", self.png_payload(), "image/png")
+
+
+class MultipartBody:
+    """A multipart/form-data body that streams file payloads instead of concatenating them.
+
+    Iterating yields the encoded parts with file contents passed through as
+    memoryviews; len() gives the exact Content-Length so no chunked encoding
+    is needed. The body can be iterated more than once, e.g. for retries.
+    """
+
+    def __init__(self, fields, files):
+        self.boundary = uuid.uuid4().hex
+        self._parts = []
+        for name, value in fields.items():
+            header = (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            ).encode()
+            self._parts.append((header, str(value).encode()))
+        for name, (filename, payload, content_type) in files.items():
+            header = (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f"Content-Type: {content_type}\r\n\r\n"
+            ).encode()
+            self._parts.append((header, memoryview(payload)))
+        self._closing = f"--{self.boundary}--\r\n".encode()
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __iter__(self):
+        for header, payload in self._parts:
+            yield header
+            # Slices keep each socket send short; one sendall of a large payload
+            # must finish within the socket timeout on a slow uplink
+            for start in range(0, len(payload), UPLOAD_CHUNK_SIZE):
+                yield payload[start:start + UPLOAD_CHUNK_SIZE]
+            yield b"\r\n"
+        yield self._closing
+
+    def __len__(self):
+        return sum(len(header) + len(payload) + 2 for header, payload in self._parts) + len(self._closing)
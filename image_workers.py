@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from metrics import get_metrics
+
+# Where CPU-bound image stages run: "inline" on the calling thread, "thread"
+# on a shared pool of threads, or "process" in worker processes that do not
+# hold this process's GIL
+IMAGE_EXECUTOR = os.getenv("IMAGEGEN_IMAGE_EXECUTOR", "thread")
+IMAGE_WORKERS = int(os.getenv("IMAGEGEN_IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Tasks that may wait for a free worker; beyond that, callers wait for room
+IMAGE_QUEUE_DEPTH = int(os.getenv("IMAGEGEN_IMAGE_QUEUE_DEPTH", "16"))
+# Seconds a caller waits for room before ImageWorkersBusyError is raised
+IMAGE_QUEUE_TIMEOUT = float(os.getenv("IMAGEGEN_IMAGE_QUEUE_TIMEOUT", "30"))
+# Buffers at least this large reach worker processes through shared memory instead of the pipe
+SHARED_MEMORY_MIN_BYTES = 256 * 1024
+
+EXECUTOR_KINDS = ("inline", "thread", "process")
+
+
+class ImageWorkersBusyError(Exception):
+    """Raised when the image workers stay too busy to take another task"""
+
+
+class _SharedBuffer:
+    """A picklable reference to a buffer copied into a shared memory block"""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+
+def _call_with_shared(fn, args):
+    """Run fn in a worker process, with shared buffers attached as memoryviews for the call's duration"""
+    blocks, views = [], []
+    resolved = []
+    try:
+        for arg in args:
+            if isinstance(arg, _SharedBuffer):
+                block = shared_memory.SharedMemory(name=arg.name)
+                blocks.append(block)
+                views.append(block.buf[:arg.size])
+                arg = views[-1]
+            resolved.append(arg)
+        return fn(*resolved)
+    finally:
+        # Task functions return fresh objects, so no view outlives the call
+        del resolved
+        for view in views:
+            view.release()
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                # A failed call's traceback still holds a view; the mapping goes when it is collected
+                pass
+
+
+class ImageExecutor:
+    """Runs CPU-bound image stages (decode, resize, encode) off the calling thread.
+
+    run() blocks until the task is done and returns its result, so callers
+    keep their straight-line code. At most workers tasks run at once and at
+    most queue_depth more wait behind them; further callers wait up to
+    timeout seconds for room and then get ImageWorkersBusyError. In process
+    mode fn must be a module-level function and its arguments picklable;
+    large bytes-like arguments travel through shared memory and arrive as
+    memoryviews.
+    """
+
+    def __init__(self, kind=IMAGE_EXECUTOR, workers=IMAGE_WORKERS,
+                 queue_depth=IMAGE_QUEUE_DEPTH, timeout=IMAGE_QUEUE_TIMEOUT):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown image executor {kind!r}; expected one of {', '.join(EXECUTOR_KINDS)}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.workers + queue_depth)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.counters = {"tasks": 0, "rejected": 0, "restarts": 0, "shared_bytes": 0}
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.kind == "thread":
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="imagegen-image")
+                else:
+                    # Spawned workers start clean instead of forking a process full of server threads
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def run(self, fn, *args):
+        """Return fn(*args), computed by a worker; raises whatever fn raises"""
+        metrics = get_metrics()
+        stage = fn.__name__
+        start = time.perf_counter()
+        if self.kind == "inline":
+            with self._lock:
+                self.counters["tasks"] += 1
+            try:
+                return fn(*args)
+            finally:
+                metrics.observe("image_task_seconds", time.perf_counter() - start, stage=stage)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.counters["rejected"] += 1
+            metrics.inc("image_tasks_rejected_total", stage=stage)
+            raise ImageWorkersBusyError("The server is busy preparing images; please try again in a moment.")
+        blocks = []
+        try:
+            with self._lock:
+                self.counters["tasks"] += 1
+                self._in_flight += 1
+            if self.kind == "process":
+                args = self._share(args, blocks)
+                future = self._get_pool().submit(_call_with_shared, fn, args)
+            else:
+                future = self._get_pool().submit(fn, *args)
+            return future.result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next task
+            with self._lock:
+                self.counters["restarts"] += 1
+                broken, self._pool = self._pool, None
+            if broken is not None:
+                broken.shutdown(wait=False)
+            raise
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+            metrics.observe("image_task_seconds", time.perf_counter() - start, stage=stage)
+
+    def _share(self, args, blocks):
+        """Copy large buffers in args into shared memory blocks, appended to blocks for cleanup"""
+        shared = []
+        for arg in args:
+            if isinstance(arg, (bytes, bytearray, memoryview)) and len(arg) >= SHARED_MEMORY_MIN_BYTES:
+                view = memoryview(arg).cast("B")
+                block = shared_memory.SharedMemory(create=True, size=len(view))
+                blocks.append(block)
+                block.buf[:len(view)] = view
+                with self._lock:
+                    self.counters["shared_bytes"] += len(view)
+                arg = _SharedBuffer(block.name, len(view))
+            elif isinstance(arg, memoryview):
+                # Small views go through the pipe, which needs bytes
+                arg = arg.tobytes()
+            shared.append(arg)
+        return tuple(shared)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, kind=self.kind, workers=self.workers, in_flight=self._in_flight)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_image_executor():
+    """Return the process-wide image executor, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ImageExecutor()
+    return _executor
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker and queue limits shared by every session in the process
+JOB_WORKERS = int(os.getenv("IMAGEGEN_JOB_WORKERS", "4"))
+JOB_QUEUE_DEPTH = int(os.getenv("IMAGEGEN_JOB_QUEUE_DEPTH", "16"))
+JOB_RETENTION_SECONDS = float(os.getenv("IMAGEGEN_JOB_RETENTION_SECONDS", "3600"))
+JOB_MAX_FINISHED = int(os.getenv("IMAGEGEN_JOB_MAX_FINISHED", "32"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class Job:
+    """A unit of background work and its status, result or error"""
+
+    def __init__(self, kind=""):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        # Results the job publishes while it is still running, in arrival order
+        self.partial = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    @property
+    def elapsed(self):
+        """Seconds spent running so far (or in total, once finished)"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobQueue:
+    """Runs jobs on a bounded worker pool and keeps their state independent of Streamlit reruns.
+
+    At most max_workers jobs run at once and at most max_queued more wait
+    behind them; submit() raises QueueFullError beyond that. Finished jobs are
+    kept until their result is collected with discard(), but for no longer than
+    retention seconds and never more than max_finished at a time.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_queued=JOB_QUEUE_DEPTH,
+                 retention=JOB_RETENTION_SECONDS, max_finished=JOB_MAX_FINISHED):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="imagegen-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, kind="", pass_job=False, **kwargs):
+        """Queue fn(*args, **kwargs) and return its Job; with pass_job, fn also gets job=<Job>"""
+        with self._lock:
+            self._prune()
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+            if pending >= self.max_workers + self.max_queued:
+                raise QueueFullError("The server is busy; please try again in a moment.")
+            job = Job(kind)
+            self._jobs[job.id] = job
+        if pass_job:
+            kwargs["job"] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._prune()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id):
+        """Forget a job once its result has been collected"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _prune(self):
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished and job.finished_at is not None),
+            key=lambda job: job.finished_at,
+        )
+        cutoff = time.time() - self.retention
+        excess = len(finished) - self.max_finished
+        for index, job in enumerate(finished):
+            if index < excess or job.finished_at < cutoff:
+                del self._jobs[job.id]
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts["max_workers"] = self.max_workers
+        counts["max_queued"] = self.max_queued
+        return counts
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue, creating it on first use"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
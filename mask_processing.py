@@ -0,0 +1,69 @@
+import io
+from PIL import Image, ImageChops
+
+# Pixels at or above this level count as "white" (area to change)
+BINARIZE_THRESHOLD = 128
+
+# Lookup tables used with Image.point so binarization runs in C over the whole band
+_WHITE_LUT = [0] * BINARIZE_THRESHOLD + [255] * (256 - BINARIZE_THRESHOLD)
+_TRANSPARENT_LUT = [255] * BINARIZE_THRESHOLD + [0] * (256 - BINARIZE_THRESHOLD)
+
+
+def _open(source):
+    """Open a mask from a path, file-like object or raw bytes"""
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
+
+def _has_alpha(mask):
+    """Return True if the mask carries transparency information"""
+    return mask.mode in ("RGBA", "LA", "PA") or "transparency" in mask.info
+
+
+def edit_region(mask):
+    """Return an "L" image that is 255 where the mask marks an area to change and 0 elsewhere.
+
+    White pixels and (for masks with an alpha channel) transparent pixels are both
+    treated as editable, matching what the upload help text promises.
+    """
+    if _has_alpha(mask):
+        if mask.mode not in ("RGBA", "LA"):
+            mask = mask.convert("RGBA")
+        region = mask.getchannel("A").point(_TRANSPARENT_LUT)
+        # Fully opaque masks still need the luminance test; skip it when
+        # every pixel is already transparent
+        if region.getextrema() != (255, 255):
+            region = ImageChops.lighter(region, mask.convert("L").point(_WHITE_LUT))
+        return region
+    return mask.convert("L").point(_WHITE_LUT)
+
+
+def prepare_mask_image(source, target_dimensions):
+    """Binarize, resize and convert a mask to the RGBA form the edits endpoint expects.
+
+    Areas to change become fully transparent, areas to preserve opaque black.
+    """
+    region = edit_region(_open(source))
+
+    # NEAREST keeps the mask strictly binary
+    if region.size != tuple(target_dimensions):
+        region = region.resize(tuple(target_dimensions), Image.Resampling.NEAREST)
+
+    mask_rgba = Image.new("RGBA", region.size, (0, 0, 0, 0))
+    mask_rgba.putalpha(ImageChops.invert(region))
+    return mask_rgba
+
+
+def encode_png(image):
+    """Encode an image as PNG and return the bytes"""
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def prepare_mask(source, target_dimensions):
+    """Prepare a mask and return it as PNG bytes, without touching the filesystem"""
+    return encode_png(prepare_mask_image(source, target_dimensions))
@@ -0,0 +1,198 @@
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+
+# Samples kept per series; older observations are dropped
+METRICS_WINDOW = 500
+# Recent API request traces kept for the diagnostics panel
+TRACE_HISTORY = int(os.getenv("IMAGEGEN_TRACE_HISTORY", "20"))
+# Port of the Prometheus text endpoint; 0 leaves it off
+METRICS_PORT = int(os.getenv("IMAGEGEN_METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("IMAGEGEN_METRICS_HOST", "127.0.0.1")
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    inner = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{inner}}}"
+
+
+def _with_label(key, label):
+    """Add one more label to a series key built by _series"""
+    if key.endswith("}"):
+        return f"{key[:-1]},{label}}}"
+    return f"{key}{{{label}}}"
+
+
+def _base_name(key):
+    return key.split("{", 1)[0]
+
+
+def _percentile(ordered, pct):
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Trace:
+    """Stage timings, payload sizes, status and rate-limit headers of one API request"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started_at = time.time()
+        self.stages = {}
+        self.fields = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed block; repeated stages add up"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            "time": time.strftime("%H:%M:%S", time.localtime(self.started_at)),
+            "operation": self.operation,
+            **{f"{name}_s": round(seconds, 4) for name, seconds in self.stages.items()},
+            **self.fields,
+        }
+
+
+class Metrics:
+    """Process-wide counters, gauges and timing samples, keyed by name and labels"""
+
+    def __init__(self, window=METRICS_WINDOW, trace_history=TRACE_HISTORY):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._samples = {}
+        self._traces = deque(maxlen=trace_history)
+
+    def inc(self, name, amount=1, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.window)
+            self._samples[key].append(value)
+
+    def record_trace(self, trace):
+        """Keep a finished request trace and fold its stages and sizes into the series"""
+        for stage, seconds in trace.stages.items():
+            self.observe("api_stage_seconds", seconds, operation=trace.operation, stage=stage)
+        for field in ("request_bytes", "response_bytes"):
+            if field in trace.fields:
+                self.observe(f"api_{field}", trace.fields[field], operation=trace.operation)
+        self.inc("api_responses_total", operation=trace.operation, status=trace.fields.get("status", "error"))
+        with self._lock:
+            self._traces.append(trace.as_dict())
+
+    def recent_traces(self):
+        """Recent request traces, newest first"""
+        with self._lock:
+            return list(reversed(self._traces))
+
+    def summary(self):
+        """Return counters, gauges and count/p50/p90/max for every sampled series"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+        summary = {"counters": counters, "gauges": gauges, "samples": {}}
+        for key, ordered in samples.items():
+            summary["samples"][key] = {
+                "count": len(ordered),
+                "p50": _percentile(ordered, 50),
+                "p90": _percentile(ordered, 90),
+                "max": ordered[-1],
+            }
+        return summary
+
+    def render_prometheus(self):
+        """Render every series in the Prometheus text exposition format"""
+        summary = self.summary()
+        lines = []
+        typed = set()
+
+        def declare(key, kind):
+            name = _base_name(key)
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for key, value in sorted(summary["counters"].items()):
+            declare(key, "counter")
+            lines.append(f"{key} {value}")
+        for key, value in sorted(summary["gauges"].items()):
+            declare(key, "gauge")
+            lines.append(f"{key} {value}")
+        for key, stats in sorted(summary["samples"].items()):
+            declare(key, "summary")
+            for quantile, field in (("0.5", "p50"), ("0.9", "p90"), ("1", "max")):
+                label = 'quantile="' + quantile + '"'
+                lines.append(f"{_with_label(key, label)} {stats[field]}")
+            name = _base_name(key)
+            lines.append(f"{name}_count{key[len(name):]} {stats['count']}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry, creating it on first use"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+    return _metrics
+
+
+_server = None
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics on a background thread, once per process; returns the server or None if disabled"""
+    global _server
+    if _server is not None or not port:
+        return _server
+    # Only loaded when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = get_metrics().render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _metrics_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="imagegen-metrics", daemon=True).start()
+    return _server
@@ -0,0 +1,300 @@
+"""Offline stand-in for the Azure OpenAI gpt-image-1 images API.
+
+Serves /openai/deployments/{deployment}/images/generations and /images/edits
+with deterministic PNGs. Each request's prompt, size and index pick the
+image, so the same request always gets the same bytes. Results come back
+as b64_json or as a url served by the mock itself. Latency, error and 429
+injection and the image payload size are configurable, so the app, the
+batch CLI and the load test can run without credentials:
+
+    python mock_server.py --port 8099 --latency lognormal:0.7:0.4 --throttle-rate 0.05
+    IMAGEGEN_AOAI_ENDPOINT=http://127.0.0.1:8099 streamlit run app.py
+"""
+import argparse
+import base64
+import functools
+import hashlib
+import io
+import json
+import random
+import re
+import socket
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+DEFAULT_SIZE = "1024x1024"
+# Distinct images rendered per size and detail; requests map onto them by seed,
+# so the mock's own CPU time does not skew load tests
+VARIANTS = 8
+_ROUTE = re.compile(r"^/openai/deployments/([^/]+)/images/(generations|edits)$")
+_FILE_ROUTE = re.compile(r"^/files/([0-9a-f]{16})-(\d+)x(\d+)-(flat|gradient|noise)\.png$")
+
+
+def parse_latency(spec):
+    """Turn a latency spec into a sampler taking a random.Random.
+
+    "0.5" is a fixed delay, "uniform:LOW:HIGH", "normal:MEAN:SD" and
+    "lognormal:MU:SIGMA" draw from that distribution (seconds, clamped at 0).
+    """
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        delay = float(kind)
+        return lambda rng: delay
+    a, b = (float(value) for value in params.split(":"))
+    if kind == "uniform":
+        return lambda rng: rng.uniform(a, b)
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(a, b))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(a, b)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+@functools.lru_cache(maxsize=64)
+def _render_variant(variant, width, height, detail):
+    rng = random.Random(variant)
+    color = tuple(rng.randrange(256) for _ in range(3))
+    if detail == "flat":
+        img = Image.new("RGB", (width, height), color)
+    else:
+        gradient = Image.linear_gradient("L").resize((width, height))
+        if detail == "noise":
+            # effect_noise is not seedable; one incompressible band gives a photo-sized PNG
+            texture = Image.frombytes("L", (width, height), rng.randbytes(width * height))
+        else:
+            texture = gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+        img = Image.merge("RGB", (gradient, texture, Image.new("L", (width, height), color[2])))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def render_png(seed, width, height, detail):
+    """Deterministic PNG for a hex seed; detail sets the payload size from a few KB (flat) to photo-like (noise)"""
+    return _render_variant(int(seed, 16) % VARIANTS, width, height, detail)
+
+
+@functools.lru_cache(maxsize=64)
+def _encoded_variant(variant, width, height, detail):
+    return base64.b64encode(_render_variant(variant, width, height, detail)).decode()
+
+
+def _image_seed(deployment, prompt, size, index):
+    return hashlib.sha256(f"{deployment}\0{prompt}\0{size}\0{index}".encode()).hexdigest()[:16]
+
+
+def _parse_size(size):
+    if not size or size == "auto":
+        size = DEFAULT_SIZE
+    width, height = size.lower().split("x")
+    return int(width), int(height)
+
+
+class MockImageService:
+    """A threaded HTTP server imitating the images API, with injectable latency and failures.
+
+    error_rate and throttle_rate are the chances that a request gets a 500
+    or a 429. The 429 carries retry-after-ms. The random draws come from
+    seed, so a run can be replayed.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency="0", error_rate=0.0, throttle_rate=0.0,
+                 retry_after=0.1, response_format="b64_json", detail="gradient", rate_limit=1000, seed=0):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.response_format = response_format
+        self.detail = detail
+        self.rate_limit = rate_limit
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-images", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def _draw(self):
+        """Pick this request's outcome and delay under the lock, so seeded runs repeat"""
+        with self._lock:
+            roll = self._rng.random()
+            delay = self.latency(self._rng)
+        if roll < self.throttle_rate:
+            return 429, delay
+        if roll < self.throttle_rate + self.error_rate:
+            return 500, delay
+        return 200, delay
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                match = _ROUTE.match(self.path.split("?", 1)[0])
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if match is None:
+                    return self._json(404, {"error": {"code": "404", "message": "Resource not found"}})
+                if not self.headers.get("api-key"):
+                    return self._json(401, {"error": {"code": "401", "message": "Missing api-key header"}})
+                deployment, operation = match.groups()
+                service._count(f"{operation}_requests")
+                try:
+                    params = self._params(operation, body)
+                except ValueError as e:
+                    service._count("rejected")
+                    return self._json(400, {"error": {"code": "invalid_request", "message": str(e)}})
+
+                status, delay = service._draw()
+                time.sleep(delay)
+                if status == 429:
+                    service._count("throttled")
+                    return self._json(429, {"error": {"code": "429", "message": "Rate limit exceeded"}}, {
+                        "retry-after-ms": str(int(service.retry_after * 1000)),
+                        "x-ratelimit-remaining-requests": "0",
+                    })
+                if status == 500:
+                    service._count("errors")
+                    return self._json(500, {"error": {"code": "500", "message": "Injected server error"}})
+                return self._json(200, service._result(deployment, params, self.headers.get("Host")), {
+                    "x-ratelimit-remaining-requests": str(service.rate_limit - 1),
+                    "x-ratelimit-limit-requests": str(service.rate_limit),
+                    "openai-processing-ms": str(int(delay * 1000)),
+                })
+
+            def do_GET(self):
+                match = _FILE_ROUTE.match(self.path)
+                if match is None:
+                    return self._json(404, {"error": {"code": "404", "message": "Resource not found"}})
+                seed, width, height, detail = match.groups()
+                data = render_png(seed, int(width), int(height), detail)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _params(self, operation, body):
+                if operation == "generations":
+                    try:
+                        params = json.loads(body)
+                    except ValueError:
+                        raise ValueError("Body is not valid JSON")
+                    if not params.get("prompt"):
+                        raise ValueError("'prompt' is required")
+                    return params
+                content_type = self.headers.get("Content-Type", "")
+                message = BytesParser(policy=HTTP).parsebytes(
+                    b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+                )
+                if not message.is_multipart():
+                    raise ValueError("Expected multipart/form-data")
+                params, files = {}, {}
+                for part in message.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    if part.get_filename() is not None:
+                        files[name] = part.get_payload(decode=True)
+                    else:
+                        params[name] = part.get_content().strip()
+                if not params.get("prompt"):
+                    raise ValueError("'prompt' is required")
+                if "image" not in files:
+                    raise ValueError("'image' is required")
+                try:
+                    with Image.open(io.BytesIO(files["image"])) as image:
+                        image_size = image.size
+                    if "mask" in files:
+                        with Image.open(io.BytesIO(files["mask"])) as mask:
+                            if "A" not in mask.getbands():
+                                raise ValueError("The mask must have an alpha channel")
+                            if mask.size != image_size:
+                                raise ValueError(f"Mask size {mask.size} does not match image size {image_size}")
+                except OSError:
+                    raise ValueError("Uploaded file is not a valid image")
+                return params
+
+            def _json(self, status, document, headers=None):
+                payload = json.dumps(document).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                service._count(f"status_{status}")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _result(self, deployment, params, host):
+        size = params.get("size") or DEFAULT_SIZE
+        width, height = _parse_size(size)
+        items = []
+        for index in range(int(params.get("n", 1))):
+            seed = _image_seed(deployment, params["prompt"], size, index)
+            if self.response_format == "url":
+                items.append({"url": f"http://{host}/files/{seed}-{width}x{height}-{self.detail}.png"})
+            else:
+                items.append({"b64_json": _encoded_variant(int(seed, 16) % VARIANTS, width, height, self.detail)})
+            items[-1]["revised_prompt"] = params["prompt"]
+        return {"created": int(time.time()), "data": items}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", default="0", help='e.g. "2", "uniform:1:3", "lognormal:0.7:0.4"')
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="seconds asked for in 429 answers")
+    parser.add_argument("--format", dest="response_format", choices=["b64_json", "url"], default="b64_json")
+    parser.add_argument("--detail", choices=["flat", "gradient", "noise"], default="gradient",
+                        help="image content; sets payload size from a few KB to photo-like")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    service = MockImageService(
+        args.host, args.port, args.latency, args.error_rate, args.throttle_rate,
+        args.retry_after, args.response_format, args.detail, seed=args.seed,
+    )
+    print(f"Mock images API on {service.endpoint}; set IMAGEGEN_AOAI_ENDPOINT={service.endpoint}", flush=True)
+    try:
+        service.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+def get_preset_prompts():
+    """Return a list of preset prompts for common image manipulations"""
+    return {
+        "Inpainting Changes": [
+            {"name": "Replace with Tree", "prompt": "Replace the masked region with a detailed tree, blending naturally with the scene"},
+            {"name": "Change to Blue Shirt", "prompt": "Change the masked region to a blue shirt, matching the lighting and style"},
+            {"name": "Add Flower", "prompt": "Add a vibrant flower in the masked region, blending with the surroundings"},
+            {"name": "Replace with Sky", "prompt": "Replace the masked region with a clear blue sky with fluffy clouds"},
+            {"name": "Remove Object", "prompt": "Remove the masked region and fill it with a seamless background matching the surroundings"}
+        ],
+        "Style Transfers": [
+            {"name": "Oil Painting", "prompt": "Transform the image into an oil painting style with rich textures and vibrant colors"},
+            {"name": "Watercolor", "prompt": "Convert the image to a delicate watercolor painting with soft edges and translucent hues"},
+            {"name": "Anime Style", "prompt": "Redraw the image in a Japanese anime style with bold outlines and expressive colors"},
+            {"name": "Cyberpunk", "prompt": "Apply a cyberpunk aesthetic with neon colors and futuristic elements"},
+            {"name": "Vintage Photo", "prompt": "Make the image look like a vintage photograph with sepia tones and grainy texture"}
+        ],
+        "Lighting Changes": [
+            {"name": "Sunset Glow", "prompt": "Apply warm sunset lighting with golden hues and soft shadows"},
+            {"name": "Moonlit Night", "prompt": "Change the lighting to a cool, moonlit night with blue tones and subtle glow"},
+            {"name": "Studio Lighting", "prompt": "Use professional studio lighting with even illumination and minimal shadows"},
+            {"name": "Dramatic Spotlight", "prompt": "Add a dramatic spotlight effect focusing on the main subject"},
+            {"name": "Foggy Morning", "prompt": "Apply soft, diffused lighting like a foggy morning with muted colors"}
+        ],
+        "Composition Changes": [
+            {"name": "Add Beach Ball", "prompt": "Add a colorful beach ball in the center of the image, blending naturally with the scene"},
+            {"name": "Expand Background", "prompt": "Extend the background to include a wider landscape, matching the original style"},
+            {"name": "Add People", "prompt": "Include a group of people in the background, interacting naturally with the environment"},
+            {"name": "Remove Objects", "prompt": "Remove any distracting objects from the background, keeping the main subject intact"},
+            {"name": "Change Setting", "prompt": "Place the main subject in a new setting, such as a bustling city street"}
+        ],
+        "Background Changes": [
+            {"name": "White Background", "prompt": "Place the main subject on a clean white background"},
+            {"name": "Nature Scene", "prompt": "Replace the background with a lush forest scene and soft natural light"},
+            {"name": "Urban Skyline", "prompt": "Set the background to a modern city skyline at dusk"},
+            {"name": "Abstract Gradient", "prompt": "Use a smooth blue-to-purple gradient background"},
+            {"name": "Transparent", "prompt": "Isolate the main subject on a transparent background"}
+        ]
+    }
+
+
+def find_preset(name):
+    """Return the prompt text of the preset called name, ignoring case"""
+    for presets in get_preset_prompts().values():
+        for preset in presets:
+            if preset["name"].lower() == name.lower():
+                return preset["prompt"]
+    raise ValueError(f"Unknown preset: {name}")
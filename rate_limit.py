@@ -0,0 +1,306 @@
+import email.utils
+import os
+import random
+import re
+import threading
+import time
+
+from metrics import get_metrics
+
+# Retry and quota settings; a quota of 0 disables that bucket
+RETRY_MAX_ATTEMPTS = int(os.getenv("IMAGEGEN_RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("IMAGEGEN_RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("IMAGEGEN_RETRY_MAX_DELAY", "60"))
+QUOTA_RPM = float(os.getenv("IMAGEGEN_RPM", "0"))
+QUOTA_TPM = float(os.getenv("IMAGEGEN_TPM", "0"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("IMAGEGEN_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("IMAGEGEN_BREAKER_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Approximate gpt-image-1 output tokens per image, by quality and size
+IMAGE_TOKENS = {
+    "low": {"1024x1024": 272, "1024x1536": 408, "1536x1024": 400},
+    "medium": {"1024x1024": 1056, "1024x1536": 1584, "1536x1024": 1568},
+    "high": {"1024x1024": 4160, "1024x1536": 6240, "1536x1024": 6208},
+}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a deployment whose circuit breaker is open"""
+
+
+class RequestCancelledError(Exception):
+    """Raised instead of sending an attempt that nobody is waiting for any more"""
+
+
+def estimate_tokens(size, quality, n=1):
+    """Rough token cost of a request, used against the TPM bucket"""
+    return IMAGE_TOKENS.get(quality, IMAGE_TOKENS["high"]).get(size, 6240) * n
+
+
+def parse_duration(value):
+    """Parse header durations such as "20", "1.5", "250ms" or "1m30s" into seconds"""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts:
+        return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+    # Retry-After may also be an HTTP date
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def server_delay(headers):
+    """Return the wait the server asked for, in seconds, or None"""
+    if "retry-after-ms" in headers:
+        delay = parse_duration(headers["retry-after-ms"])
+        if delay is not None:
+            return delay / 1000
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        delay = parse_duration(headers.get(name))
+        if delay is not None:
+            return delay
+    return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that defers to server-provided delays"""
+
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, headers=None):
+        """Seconds to wait before retry number attempt (starting at 1)"""
+        requested = server_delay(headers) if headers is not None else None
+        if requested is not None:
+            return min(requested, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute.
+
+    A rate of 0 disables the bucket. update() lets response headers lower
+    the available tokens, and pause() blocks all takers until a deadline, so
+    throttling seen by one request slows down every request in the process.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, cost=1, timeout=None):
+        """Block until cost tokens are available; returns False on timeout.
+
+        A pause is honoured even when the bucket has no configured rate.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    if self.rate <= 0:
+                        return True
+                    self._refill(now)
+                    cost = min(cost, self.capacity)
+                    if self._tokens >= cost:
+                        self._tokens -= cost
+                        return True
+                    wait = (cost - self._tokens) / self.rate
+                else:
+                    wait = self._paused_until - now
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait = min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def update(self, remaining):
+        """Clamp available tokens to what the server says is left"""
+        if self.rate <= 0 or remaining is None:
+            return
+        with self._cond:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, remaining)
+
+    def pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures and half-opens after reset_timeout.
+
+    While open, allow() refuses calls. Once reset_timeout has passed, one
+    trial call is let through; its outcome closes or re-opens the breaker.
+    A trial that ends without an outcome must be given back with release().
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def available(self):
+        """True if allow() would let a call through, without changing state"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at >= self.reset_timeout
+            return self.state == self.CLOSED
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return self.state == self.CLOSED
+
+    def release(self):
+        """Give back a half-open trial that ended without a success or failure, so another call can try"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    get_metrics().inc("circuit_opened_total")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """Paces, retries and guards the requests sent to one deployment.
+
+    Every call first takes from the shared request and token buckets. A
+    throttled or failed call is retried with backoff. A 429 pauses the
+    buckets for every caller until the server's Retry-After has passed.
+    Sustained 5xx or network errors open the circuit breaker.
+    """
+
+    def __init__(self, name, rpm=QUOTA_RPM, tpm=QUOTA_TPM, policy=None, breaker=None, sleep=time.sleep):
+        self.name = name
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+
+    def send(self, call, cost_tokens=0, cancelled=None):
+        """Run call() -> requests.Response under the schedule and return the final response.
+
+        If the cancelled event is set before an attempt, RequestCancelledError
+        is raised instead of sending it.
+        """
+        # Imported here so the generation core loads without the HTTP stack
+        import requests
+
+        metrics = get_metrics()
+        attempt = 0
+        while True:
+            attempt += 1
+            # Checked before the breaker, so a cancelled request never takes its half-open trial
+            if cancelled is not None and cancelled.is_set():
+                raise RequestCancelledError("Request cancelled: nobody is waiting for it any more.")
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Deployment '{self.name}' is failing; requests are paused for a while.")
+            self.requests_bucket.acquire(1)
+            self.tokens_bucket.acquire(cost_tokens)
+
+            try:
+                response = call()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.breaker.record_failure()
+                if attempt >= self.policy.max_attempts:
+                    raise
+                metrics.inc("retries_total", deployment=self.name, reason="network")
+                self._sleep(self.policy.delay(attempt))
+                continue
+            except BaseException:
+                # Neither the deployment's success nor its failure; don't leave a trial hanging
+                self.breaker.release()
+                raise
+
+            headers = response.headers
+            self.requests_bucket.update(_header_int(headers, "x-ratelimit-remaining-requests"))
+            self.tokens_bucket.update(_header_int(headers, "x-ratelimit-remaining-tokens"))
+
+            if response.status_code not in RETRYABLE_STATUS:
+                self.breaker.record_success()
+                return response
+
+            if response.status_code == 429:
+                metrics.inc("throttled_total", deployment=self.name)
+                # Throttling is the server working as intended, not a failure
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+            if attempt >= self.policy.max_attempts:
+                return response
+            delay = self.policy.delay(attempt, headers)
+            if response.status_code == 429:
+                self.requests_bucket.pause(delay)
+                self.tokens_bucket.pause(delay)
+            response.close()
+            metrics.inc("retries_total", deployment=self.name, reason=str(response.status_code))
+            self._sleep(delay)
+
+    def stats(self):
+        return {"deployment": self.name, "circuit": self.breaker.state}
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name):
+    """Return the process-wide scheduler for a deployment, creating it on first use"""
+    with _schedulers_lock:
+        if name not in _schedulers:
+            _schedulers[name] = RequestScheduler(name)
+        return _schedulers[name]
@@ -0,0 +1,265 @@
+import binascii
+import io
+import json
+import re
+from PIL import Image
+
+from image_workers import get_image_executor
+
+# Keys whose string values are base64 image data, decoded while streaming
+BASE64_KEYS = {"b64_json"}
+
+# Results column previews: longest side in pixels and JPEG quality
+PREVIEW_MAX_SIDE = 1024
+PREVIEW_QUALITY = 85
+
+# Longest string shown by elide_response, e.g. for a URL or revised prompt
+DEBUG_TEXT_LIMIT = 200
+
+_STRING_SPECIAL = re.compile(rb'["\\]')
+_DELIMITERS = b",:{}[] \t\r\n"
+
+
+class Base64DecodeError(Exception):
+    """A b64_json field that could not be decoded; stands in for the item's bytes"""
+
+
+class _Base64Sink:
+    """Decodes base64 text fed in arbitrary pieces into a byte buffer, 4 characters at a time"""
+
+    def __init__(self):
+        self._out = io.BytesIO()
+        self._pending = b""
+        self.error = None
+
+    def write(self, text):
+        if self.error:
+            return
+        text = self._pending + text.replace(b"\\/", b"/")
+        usable = len(text) - len(text) % 4
+        self._pending = text[usable:]
+        try:
+            self._out.write(binascii.a2b_base64(text[:usable], strict_mode=True))
+        except binascii.Error as e:
+            self.error = Base64DecodeError(str(e))
+
+    def close(self):
+        if not self.error and self._pending:
+            self.error = Base64DecodeError("Incomplete base64 data")
+        return self.error or self._out.getvalue()
+
+
+class _TextSink:
+    """Collects the raw bytes of an ordinary JSON string and unescapes it at the end"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, text):
+        self._parts.append(text)
+
+    def close(self):
+        return json.loads(b'"' + b"".join(self._parts) + b'"')
+
+
+class StreamingResponseParser:
+    """Incremental JSON parser for image API responses.
+
+    Feed the body in chunks as it arrives. Ordinary values are built as usual,
+    but base64 image fields are decoded as they stream in, so the encoded text
+    is never held in full. Each such field ends up as bytes, or as a
+    Base64DecodeError if it was malformed.
+    """
+
+    def __init__(self):
+        self._stack = []  # [container, expecting_key, pending_key]
+        self._root = None
+        self._done = False
+        self._sink = None
+        self._escape = False
+        self._string_is_key = False
+        self._scalar = b""
+
+    def feed(self, chunk):
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if self._sink is not None:
+                pos = self._feed_string(chunk, pos)
+                continue
+            byte = chunk[pos:pos + 1]
+            if self._scalar and byte in _DELIMITERS:
+                self._finish_scalar()
+            if byte in b" \t\r\n":
+                pos += 1
+            elif byte == b'"':
+                self._start_string()
+                pos += 1
+            elif byte == b"{":
+                self._push({}, True)
+                pos += 1
+            elif byte == b"[":
+                self._push([], False)
+                pos += 1
+            elif byte in b"}]":
+                if not self._stack or isinstance(self._stack[-1][0], dict) != (byte == b"}"):
+                    raise ValueError(f"Unexpected {byte.decode()!r} in JSON response")
+                container = self._stack.pop()[0]
+                self._emit(container)
+                pos += 1
+            elif byte == b":":
+                if not self._stack or not isinstance(self._stack[-1][0], dict):
+                    raise ValueError("Unexpected ':' in JSON response")
+                self._stack[-1][1] = False
+                pos += 1
+            elif byte == b",":
+                if not self._stack:
+                    raise ValueError("Unexpected ',' in JSON response")
+                if isinstance(self._stack[-1][0], dict):
+                    self._stack[-1][1] = True
+                pos += 1
+            else:
+                self._scalar += byte
+                pos += 1
+
+    def _feed_string(self, chunk, pos):
+        if self._escape:
+            # An escape sequence was split across chunks
+            self._sink.write(b"\\" + chunk[pos:pos + 1])
+            self._escape = False
+            return pos + 1
+        while True:
+            match = _STRING_SPECIAL.search(chunk, pos)
+            if match is None:
+                self._sink.write(chunk[pos:])
+                return len(chunk)
+            index = match.start()
+            if chunk[index:index + 1] == b'"':
+                self._sink.write(chunk[pos:index])
+                self._end_string()
+                return index + 1
+            # Backslash: pass the escape pair through untouched
+            if index + 1 >= len(chunk):
+                self._sink.write(chunk[pos:index])
+                self._escape = True
+                return len(chunk)
+            self._sink.write(chunk[pos:index + 2])
+            pos = index + 2
+
+    def _start_string(self):
+        top = self._stack[-1] if self._stack else None
+        self._string_is_key = top is not None and isinstance(top[0], dict) and top[1]
+        if not self._string_is_key and top is not None and top[2] in BASE64_KEYS:
+            self._sink = _Base64Sink()
+        else:
+            self._sink = _TextSink()
+
+    def _end_string(self):
+        value = self._sink.close()
+        self._sink = None
+        if self._string_is_key:
+            self._stack[-1][2] = value
+        else:
+            self._emit(value)
+
+    def _finish_scalar(self):
+        value = json.loads(self._scalar)
+        self._scalar = b""
+        self._emit(value)
+
+    def _push(self, container, expecting_key):
+        self._stack.append([container, expecting_key, None])
+
+    def _emit(self, value):
+        if not self._stack:
+            if self._done:
+                raise ValueError("Extra data after the JSON response")
+            self._root = value
+            self._done = True
+            return
+        top = self._stack[-1]
+        if isinstance(top[0], dict):
+            top[0][top[2]] = value
+            top[2] = None
+        else:
+            top[0].append(value)
+
+    def close(self):
+        """Finish parsing and return the decoded document"""
+        if self._scalar:
+            self._finish_scalar()
+        if not self._done or self._stack or self._sink is not None:
+            raise ValueError("Incomplete JSON response")
+        return self._root
+
+
+def parse_stream(chunks):
+    """Parse an iterable of byte chunks into a response document"""
+    parser = StreamingResponseParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def elide_response(value, max_text=DEBUG_TEXT_LIMIT):
+    """Copy of a parsed response that is safe to display: image data elided, long strings cut"""
+    if isinstance(value, dict):
+        return {key: elide_response(item, max_text) for key, item in value.items()}
+    if isinstance(value, list):
+        return [elide_response(item, max_text) for item in value]
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes of image data elided>"
+    if isinstance(value, Base64DecodeError):
+        return f"<undecodable base64: {value}>"
+    if isinstance(value, str) and len(value) > max_text:
+        return value[:max_text] + f"... <{len(value) - max_text} more characters>"
+    return value
+
+
+def encode_preview(data, max_side=PREVIEW_MAX_SIDE):
+    """Downscaled display bytes for an encoded image.
+
+    Opaque images become JPEG; images with transparency stay PNG so the
+    preview shows what the download contains.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format == "JPEG":
+            # Let the JPEG decoder downscale by up to 8x in the DCT domain first
+            img.draft("RGB", (max_side, max_side))
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        if "A" in img.getbands() or "transparency" in img.info:
+            img.convert("RGBA").save(buf, format="PNG")
+        else:
+            img.convert("RGB").save(buf, format="JPEG", quality=PREVIEW_QUALITY)
+    return buf.getvalue()
+
+
+class GeneratedImage:
+    """A generated image kept as its encoded PNG bytes; pixels are decoded only on demand.
+
+    Downloads should use .data as-is. Display should use preview(), which is
+    encoded once per result instead of on every Streamlit rerun.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._image = None
+        self._preview = None
+
+    def preview(self, max_side=PREVIEW_MAX_SIDE):
+        """Downscaled display bytes from encode_preview(), created on first call and reused afterwards"""
+        if self._preview is None:
+            self._preview = get_image_executor().run(encode_preview, self.data, max_side)
+        return self._preview
+
+    @property
+    def image(self):
+        """The decoded PIL image, created on first access"""
+        if self._image is None:
+            self._image = Image.open(io.BytesIO(self.data))
+        return self._image
+
+    @property
+    def size(self):
+        return self.image.size
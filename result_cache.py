@@ -0,0 +1,192 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Cache settings; set IMAGEGEN_CACHE_DIR to an empty string to disable the disk tier
+CACHE_DIR = os.getenv("IMAGEGEN_CACHE_DIR", ".image_cache")
+CACHE_MAX_ENTRIES = int(os.getenv("IMAGEGEN_CACHE_MAX_ENTRIES", "32"))
+CACHE_MAX_MEMORY_BYTES = int(os.getenv("IMAGEGEN_CACHE_MAX_MEMORY_MB", "128")) * 2**20
+CACHE_MAX_DISK_BYTES = int(os.getenv("IMAGEGEN_CACHE_MAX_DISK_MB", "512")) * 2**20
+CACHE_TTL_SECONDS = float(os.getenv("IMAGEGEN_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+
+def cache_key(prompt, image=None, mask=None, size="", quality="", n=1, deployment="", variant=0):
+    """Content hash identifying one generation request.
+
+    variant tells apart the single-image requests a fanned-out batch is split
+    into, which would otherwise share a key.
+    """
+    digest = hashlib.sha256()
+    for part in (prompt, size, quality, str(n), deployment, str(variant)):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    for data in (image, mask):
+        if data is not None:
+            digest.update(hashlib.sha256(data).digest())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache of generated PNG bytes: a bounded in-process LRU and a size-capped directory.
+
+    Entries are lists of encoded images exactly as returned by the API, so a
+    hit never re-encodes anything. The memory tier is bounded both by entry
+    count and by total bytes. Entries older than the TTL, measured from when
+    they were first stored, count as misses.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES,
+                 max_memory_bytes=CACHE_MAX_MEMORY_BYTES,
+                 max_disk_bytes=CACHE_MAX_DISK_BYTES, ttl=CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _entry_paths(self, key):
+        folder = os.path.join(self.directory, key[:2])
+        return folder, os.path.join(folder, key)
+
+    def get(self, key):
+        """Return the cached list of PNG bytes for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, images = entry
+                if now - stored_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return images
+                self._forget(key)
+
+        entry = self._read_disk(key, now)
+        if entry is None:
+            self._count("misses")
+            return None
+        stored_at, images = entry
+        self._count("disk_hits")
+        # Keep the original storage time so promotion does not extend the TTL
+        self._remember(key, images, stored_at)
+        return images
+
+    def put(self, key, images):
+        now = time.time()
+        self._remember(key, images, now)
+        if self.directory:
+            self._write_disk(key, images)
+
+    def _forget(self, key):
+        # Caller holds the lock
+        _, images = self._memory.pop(key)
+        self._memory_bytes -= sum(len(data) for data in images)
+
+    def _remember(self, key, images, stored_at):
+        size = sum(len(data) for data in images)
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._forget(key)
+            self._memory[key] = (stored_at, images)
+            self._memory_bytes += size
+            while len(self._memory) > self.max_entries or self._memory_bytes > self.max_memory_bytes:
+                self._forget(next(iter(self._memory)))
+                self.counters["evictions"] += 1
+
+    def _read_disk(self, key, now):
+        if not self.directory:
+            return None
+        _, base = self._entry_paths(key)
+        first = f"{base}.0.png"
+        try:
+            stored_at = os.path.getmtime(first)
+        except OSError:
+            return None
+        if now - stored_at > self.ttl:
+            return None
+        images = []
+        index = 0
+        while True:
+            try:
+                with open(f"{base}.{index}.png", "rb") as f:
+                    images.append(f.read())
+            except FileNotFoundError:
+                break
+            index += 1
+        return stored_at, images
+
+    def _write_disk(self, key, images):
+        try:
+            folder, base = self._entry_paths(key)
+            os.makedirs(folder, exist_ok=True)
+            # Write index 0 last: its presence marks the entry as complete
+            for index in reversed(range(len(images))):
+                tmp_path = f"{base}.{index}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(images[index])
+                os.replace(tmp_path, f"{base}.{index}.png")
+            self._enforce_disk_cap()
+        except OSError:
+            # The disk tier is best effort; the memory tier still holds the entry
+            pass
+
+    def _enforce_disk_cap(self):
+        # Group files per entry so eviction never leaves a partial result behind
+        entries = {}
+        total = 0
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for item in os.scandir(folder.path):
+                stat = item.stat()
+                base = os.path.join(folder.path, item.name.split(".", 1)[0])
+                mtime, size, paths = entries.get(base, (stat.st_mtime, 0, []))
+                entries[base] = (min(mtime, stat.st_mtime), size + stat.st_size, paths + [item.path])
+                total += stat.st_size
+        if total <= self.max_disk_bytes:
+            return
+        for _, size, paths in sorted(entries.values()):
+            if total <= self.max_disk_bytes:
+                break
+            # Removing index 0 first invalidates the entry for concurrent readers
+            for path in sorted(paths):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            self._count("disk_evictions")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide result cache, creating it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
@@ -0,0 +1,65 @@
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+# Make the top-level app modules importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import coalesce
+import deployments
+import result_cache
+from coalesce import SingleFlight
+from deployments import Backend, DeploymentPool
+from mock_server import MockImageService
+from rate_limit import RequestScheduler, RetryPolicy
+
+
+def encoded(image, format="PNG", **params):
+    """The image saved in the given format, as bytes"""
+    buf = io.BytesIO()
+    image.save(buf, format=format, **params)
+    return buf.getvalue()
+
+
+def png(color=0, size=(8, 8), mode="RGB"):
+    """A PNG filled with one colour"""
+    return encoded(Image.new(mode, size, color))
+
+
+@pytest.fixture
+def start_mock(tmp_path, monkeypatch):
+    """Start a mock API with the given MockImageService options and send every generation to it.
+
+    The result cache and in-flight calls start empty. attempts sets the
+    scheduler's retry policy, one attempt by default.
+    """
+    services = []
+
+    def start(attempts=1, **kwargs):
+        service = MockImageService(**kwargs).start()
+        services.append(service)
+        scheduler = RequestScheduler("mock", policy=RetryPolicy(max_attempts=attempts, base_delay=0.01))
+        backend = Backend("mock", service.endpoint, "gpt-image-1", "key", scheduler=scheduler)
+        monkeypatch.setattr(deployments, "_pool", DeploymentPool([backend]))
+        return service
+
+    monkeypatch.setattr(result_cache, "_cache", result_cache.ResultCache(directory=str(tmp_path)))
+    monkeypatch.setattr(coalesce, "_flights", SingleFlight())
+    yield start
+    for service in services:
+        service.stop()
+
+
+@pytest.fixture
+def mock_latency():
+    """The mock fixture's latency spec; override it in a module that needs slower calls"""
+    return "0"
+
+
+@pytest.fixture
+def mock(start_mock, mock_latency):
+    """A mock API answering with small flat images, one attempt per call"""
+    return start_mock(latency=mock_latency, detail="flat")
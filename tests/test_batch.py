@@ -0,0 +1,146 @@
+import base64
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import batch
+import deployments
+import result_cache
+from conftest import png
+from deployments import Backend, DeploymentPool
+from rate_limit import RequestScheduler, RetryPolicy
+
+
+class StubImageAPI:
+    """Local images API answering edits and generations with a small PNG; prompts containing "fail" get a 400"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.fail = True
+        self.calls = []
+        lock = threading.Lock()
+        stub = self
+        result = json.dumps({"data": [{"b64_json": base64.b64encode(png("red")).decode()}]}).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with lock:
+                    stub.calls.append(self.path.split("?")[0].rsplit("/", 1)[-1])
+                time.sleep(stub.latency)
+                if stub.fail and b"fail" in body:
+                    status, payload = 400, b'{"error": {"message": "rejected"}}'
+                else:
+                    status, payload = 200, result
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}"
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    stub = StubImageAPI()
+    scheduler = RequestScheduler("stub", policy=RetryPolicy(max_attempts=1))
+    pool = DeploymentPool([Backend("stub", stub.endpoint, "gpt-image-1", "key", scheduler=scheduler)])
+    monkeypatch.setattr(deployments, "_pool", pool)
+    monkeypatch.setattr(result_cache, "_cache", result_cache.ResultCache(directory=str(tmp_path / "cache")))
+    yield stub
+    stub.server.shutdown()
+
+
+def read_results(output_dir):
+    with open(output_dir / batch.RESULTS_NAME) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_manifest_run_writes_outputs_and_resumes(tmp_path, api):
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "a.png").write_bytes(png("blue"))
+    (tmp_path / "in" / "b.jpg").write_bytes(png("green"))
+    (tmp_path / "in" / "mask.png").write_bytes(png("white"))
+    manifest = tmp_path / "in" / "rows.jsonl"
+    manifest.write_text("\n".join(json.dumps(row) for row in [
+        {"image": "a.png", "prompt": "white background"},
+        {"image": "b.jpg", "mask": "mask.png", "prompt": "add a tree", "quality": "low"},
+        {"id": "poster", "prompt": "a poster"},
+        {"id": "bad", "prompt": "please fail"},
+    ]) + "\n")
+    output_dir = tmp_path / "out"
+
+    summary = batch.run_batch(batch.load_rows(str(manifest)), str(output_dir), concurrency=2)
+
+    assert summary["done"] == 3 and summary["failed"] == 1
+    assert summary["error_rate"] == 0.25
+    assert summary["images_per_minute"] > 0
+    assert summary["latency_p50"] is not None
+    assert sorted(api.calls) == ["edits", "edits", "generations", "generations"]
+    assert sorted(p.name for p in output_dir.glob("*.png")) == ["a.png.png", "b.jpg.png", "poster.png"]
+    records = {record["id"]: record for record in read_results(output_dir)}
+    assert records["bad"]["status"] == "failed" and "rejected" in records["bad"]["error"]
+    assert records["b.jpg"]["quality"] == "low"
+    assert all("latency_seconds" in record for record in records.values())
+
+    # A crash mid-write leaves a truncated line; the rerun skips done rows and retries the failure
+    with open(output_dir / batch.RESULTS_NAME, "a") as f:
+        f.write('{"id": "a.png", "sta')
+    api.fail = False
+    api.calls.clear()
+    summary = batch.run_batch(batch.load_rows(str(manifest)), str(output_dir), concurrency=2)
+
+    assert summary["skipped"] == 3 and summary["done"] == 1 and summary["failed"] == 0
+    assert api.calls == ["generations"]
+    assert (output_dir / "bad.png").exists()
+    # The torn line was cut off, so the retried row's record is readable and a third run has nothing to do
+    assert batch.completed_ids(str(output_dir / batch.RESULTS_NAME)) == {"a.png", "b.jpg", "poster", "bad"}
+
+
+def test_output_names_do_not_collide():
+    ids = ["x.jpg", "x.png", "a/b.jpg", "a_b.jpg", "a b.jpg"]
+    names = [batch.output_names(row_id, 1)[0] for row_id in ids]
+
+    assert names[:2] == ["x.jpg.png", "x.png.png"]
+    assert names[3] == "a_b.jpg.png"
+    assert len(set(names)) == len(ids)
+    assert batch.output_names("x.jpg", 2) == ["x.jpg-1.png", "x.jpg-2.png"]
+
+
+def test_directory_run_uses_preset_and_bounded_concurrency(tmp_path, api, capsys):
+    api.latency = 0.1
+    source = tmp_path / "photos"
+    (source / "shirts").mkdir(parents=True)
+    for index in range(6):
+        (source / "shirts" / f"{index}.png").write_bytes(png((index * 40, 0, 0)))
+    (source / "notes.txt").write_text("not an image")
+
+    start = time.perf_counter()
+    status = batch.main([str(source), "--output-dir", str(tmp_path / "out"),
+                         "--preset", "White Background", "--concurrency", "3"])
+    elapsed = time.perf_counter() - start
+
+    summary = json.loads(capsys.readouterr().out)
+    assert status == 0
+    assert summary["done"] == 6 and summary["images"] == 6
+    assert api.calls == ["edits"] * 6
+    # Six 100 ms calls, three at a time
+    assert elapsed < 0.5
+    records = read_results(tmp_path / "out")
+    assert {record["prompt"] for record in records} == {batch.find_preset("white background")}
+    assert (tmp_path / "out" / batch.output_names("shirts/0.png", 1)[0]).exists()
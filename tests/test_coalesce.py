@@ -0,0 +1,136 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import pytest
+
+import coalesce
+import generation
+from coalesce import SingleFlight
+from generation import GenerationError, RequestCancelled, generate_image, request_images
+
+
+@pytest.fixture
+def mock_latency():
+    # Slow enough that concurrent callers overlap
+    return "0.3"
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn(cancelled):
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        futures = [pool.submit(flights.run, "key", fn) for _ in range(6)]
+        while flights.stats()["coalesced"] < 5:
+            time.sleep(0.001)
+        release.set()
+        assert [future.result() for future in futures] == ["result"] * 6
+
+    assert len(calls) == 1
+    assert flights.stats() == {"calls": 1, "coalesced": 5, "cancelled": 0, "abandoned": 0, "in_flight": 0}
+
+
+def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fn(cancelled):
+        release.wait(5)
+        raise ValueError("upstream failed")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(flights.run, "key", fn) for _ in range(3)]
+        while flights.stats()["coalesced"] < 2:
+            time.sleep(0.001)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError, match="upstream failed"):
+                future.result()
+    # A failed call is not remembered; the next caller tries again
+    assert flights.run("key", lambda cancelled: "ok") == "ok"
+
+
+def test_call_is_cancelled_once_every_waiter_leaves():
+    flights = SingleFlight()
+    seen = []
+
+    def fn(cancelled):
+        seen.append(cancelled)
+        cancelled.wait(5)
+        return "late"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(flights.run, "key", fn, 0.2) for _ in range(2)]
+        for future in futures:
+            with pytest.raises(TimeoutError):
+                future.result()
+
+    assert seen[0].is_set()
+    stats = flights.stats()
+    assert (stats["abandoned"], stats["cancelled"], stats["in_flight"]) == (2, 1, 0)
+
+
+def test_call_keeps_going_while_someone_still_waits():
+    flights = SingleFlight()
+    release = threading.Event()
+    seen = []
+
+    def fn(cancelled):
+        seen.append(cancelled)
+        release.wait(5)
+        return "done"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        patient = pool.submit(flights.run, "key", fn)
+        while not seen:
+            time.sleep(0.001)
+        with pytest.raises(TimeoutError):
+            flights.run("key", fn, timeout=0.05)
+        release.set()
+        assert patient.result() == "done"
+    assert not seen[0].is_set()
+    assert flights.stats()["cancelled"] == 0
+
+
+def test_identical_generations_make_one_upstream_call(mock):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: generate_image("Oil Painting", size="1024x1024"), range(8)))
+
+    assert mock.counters["generations_requests"] == 1
+    assert len({result.images[0].data for result in results}) == 1
+    assert coalesce.get_single_flight().stats()["coalesced"] == 7
+
+
+def test_bypassing_the_cache_also_bypasses_coalescing(mock):
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda _: generate_image("Oil Painting", use_cache=False), range(4)))
+
+    assert mock.counters["generations_requests"] == 4
+
+
+def test_cancelled_request_is_not_sent(mock):
+    cancelled = threading.Event()
+    cancelled.set()
+
+    with pytest.raises(RequestCancelled):
+        request_images("never sent", cancelled=cancelled)
+    assert mock.counters.get("generations_requests", 0) == 0
+
+
+def test_callers_give_up_after_the_timeout_and_the_call_stops_retrying(start_mock, monkeypatch):
+    service = start_mock(attempts=3, latency="0.3", error_rate=1.0)
+    monkeypatch.setattr(generation, "GENERATION_TIMEOUT", 0.1)
+
+    with pytest.raises(GenerationError, match="did not answer within 0.1 seconds"):
+        generate_image("Oil Painting")
+    # The failed first attempt would be retried, but nobody is waiting for it any more
+    time.sleep(0.5)
+    assert service.counters["generations_requests"] == 1
+    assert coalesce.get_single_flight().stats()["cancelled"] == 1
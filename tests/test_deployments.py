@@ -0,0 +1,202 @@
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from deployments import Backend, DeploymentPool, load_backends
+from rate_limit import CircuitBreaker, CircuitOpenError, RequestCancelledError, RequestScheduler, RetryPolicy
+from transport import Transport
+
+
+class StubDeployment:
+    """Local deployment with a fixed latency, a switchable status and optional rate-limit headers"""
+
+    def __init__(self, latency=0.0, status=200, headers=None):
+        self.latency = latency
+        self.status = status
+        self.headers = headers or {}
+        self.hits = 0
+        lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with lock:
+                    stub.hits += 1
+                time.sleep(stub.latency)
+                body = b'{"data": []}'
+                self.send_response(stub.status)
+                for name, value in stub.headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}"
+
+    def close(self):
+        self.server.shutdown()
+
+
+@pytest.fixture
+def stubs():
+    created = []
+
+    def make(**kwargs):
+        stub = StubDeployment(**kwargs)
+        created.append(stub)
+        return stub
+
+    yield make
+    for stub in created:
+        stub.close()
+
+
+def backend_for(stub, name, failures=5, reset=30.0):
+    scheduler = RequestScheduler(
+        name,
+        policy=RetryPolicy(max_attempts=1, base_delay=0),
+        breaker=CircuitBreaker(failure_threshold=failures, reset_timeout=reset),
+    )
+    return Backend(name, stub.endpoint, "gpt-image-1", "key", scheduler=scheduler)
+
+
+def send(pool, transport):
+    response, backend = pool.send(lambda b: lambda: transport.post(b.url("generations"), json={}))
+    response.close()
+    return response.status_code, backend.name
+
+
+def test_latency_steers_traffic_to_the_fast_deployment(stubs):
+    fast, slow = stubs(latency=0.01), stubs(latency=0.15)
+    pool = DeploymentPool([backend_for(slow, "slow"), backend_for(fast, "fast")])
+    transport = Transport(pool_size=4)
+
+    for _ in range(20):
+        assert send(pool, transport)[0] == 200
+
+    # Each backend is tried, after which the slow one is avoided
+    assert slow.hits >= 1
+    assert fast.hits >= 18
+
+
+def test_concurrent_requests_spread_by_in_flight_count(stubs):
+    a, b, c = stubs(latency=0.1), stubs(latency=0.1), stubs(latency=0.1)
+    pool = DeploymentPool([backend_for(a, "a"), backend_for(b, "b"), backend_for(c, "c")])
+    transport = Transport(pool_size=16)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=9) as executor:
+        results = list(executor.map(lambda _: send(pool, transport), range(9)))
+    elapsed = time.perf_counter() - start
+
+    assert all(status == 200 for status, _ in results)
+    assert a.hits >= 2 and b.hits >= 2 and c.hits >= 2
+    assert elapsed < 0.9
+    assert all(stats["in_flight"] == 0 for stats in pool.stats())
+
+
+def test_low_rate_limit_headroom_is_avoided(stubs):
+    tight = stubs(headers={"x-ratelimit-remaining-requests": "1", "x-ratelimit-limit-requests": "100"})
+    roomy = stubs(headers={"x-ratelimit-remaining-requests": "90", "x-ratelimit-limit-requests": "100"})
+    pool = DeploymentPool([backend_for(tight, "tight"), backend_for(roomy, "roomy")])
+    transport = Transport(pool_size=4)
+
+    for _ in range(20):
+        send(pool, transport)
+
+    assert roomy.hits > tight.hits * 3
+
+
+def test_unhealthy_deployment_fails_over_then_recovers(stubs):
+    flaky, healthy = stubs(status=500), stubs(latency=0.05)
+    pool = DeploymentPool([backend_for(flaky, "flaky", failures=1, reset=0.3), backend_for(healthy, "healthy")])
+    transport = Transport(pool_size=4)
+
+    # The flaky backend is untried and looks fastest; its 500 fails over to the healthy one
+    assert send(pool, transport) == (200, "healthy")
+    assert flaky.hits == 1
+    # While its circuit is open, the flaky backend gets no traffic
+    for _ in range(3):
+        assert send(pool, transport) == (200, "healthy")
+    assert flaky.hits == 1
+
+    flaky.status = 200
+    time.sleep(0.35)
+    # The first request after the reset timeout is its trial call, which closes the circuit
+    assert send(pool, transport) == (200, "flaky")
+    assert pool.backends[0].stats()["circuit"] == "closed"
+
+
+def test_last_error_is_returned_when_every_deployment_fails(stubs):
+    one, two = stubs(status=503), stubs(status=503)
+    pool = DeploymentPool([backend_for(one, "one", failures=1), backend_for(two, "two", failures=1)])
+    transport = Transport(pool_size=4)
+
+    assert send(pool, transport)[0] == 503
+    assert one.hits == 1 and two.hits == 1
+    with pytest.raises(CircuitOpenError):
+        send(pool, transport)
+
+
+def test_cancelled_request_does_not_fail_over(stubs):
+    flaky, healthy = stubs(status=500), stubs()
+    flaky_backend = backend_for(flaky, "flaky")
+    flaky_backend.scheduler.policy = RetryPolicy(max_attempts=2, base_delay=0)
+    pool = DeploymentPool([flaky_backend, backend_for(healthy, "healthy")])
+    transport = Transport(pool_size=4)
+    cancelled = threading.Event()
+
+    def build_call(backend):
+        def call():
+            # The last waiter leaves while the first attempt is out
+            cancelled.set()
+            return transport.post(backend.url("generations"), json={})
+        return call
+
+    with pytest.raises(RequestCancelledError):
+        pool.send(build_call, cancelled=cancelled)
+    assert (flaky.hits, healthy.hits) == (1, 0)
+    assert all(stats["in_flight"] == 0 and stats["circuit"] == "closed" for stats in pool.stats())
+
+
+def test_backends_load_from_env_and_file(tmp_path, monkeypatch):
+    entries = [
+        {"name": "east", "resource": "res-east", "deployment": "img-east", "api_key_env": "EAST_KEY", "rpm": 6},
+        {"endpoint": "http://localhost:9000/", "deployment": "img-local", "api_key": "local"},
+    ]
+    monkeypatch.setenv("EAST_KEY", "secret")
+    monkeypatch.setenv("IMAGEGEN_DEPLOYMENTS", json.dumps(entries))
+    east, local = load_backends()
+    assert east.name == "east"
+    assert east.api_key == "secret"
+    assert east.url("edits").startswith("https://res-east.openai.azure.com/openai/deployments/img-east/images/edits?")
+    assert east.scheduler.requests_bucket.rate == pytest.approx(0.1)
+    assert local.url("generations").startswith("http://localhost:9000/openai/deployments/img-local/")
+
+    config = tmp_path / "deployments.json"
+    config.write_text(json.dumps(entries[1:]))
+    monkeypatch.delenv("IMAGEGEN_DEPLOYMENTS")
+    monkeypatch.setenv("IMAGEGEN_DEPLOYMENTS_FILE", str(config))
+    assert [b.deployment for b in load_backends()] == ["img-local"]
+
+    monkeypatch.delenv("IMAGEGEN_DEPLOYMENTS_FILE")
+    monkeypatch.setenv("IMAGEGEN_AOAI_RESOURCE", "solo")
+    (backend,) = load_backends()
+    assert backend.endpoint == "https://solo.openai.azure.com"
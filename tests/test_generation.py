@@ -0,0 +1,127 @@
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import deployments
+import generation
+import metrics as metrics_module
+import result_cache
+from conftest import png
+from deployments import Backend, DeploymentPool
+from generation import APIError, GenerationResult, MaskError, generate_image, generate_variations, load_mask
+from metrics import Metrics
+from rate_limit import RequestScheduler, RetryPolicy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Local generations endpoint; the status, headers and body to answer with are set through the returned dict"""
+    state = {"status": 200, "calls": 0, "headers": {}, "body": None}
+    payload = json.dumps({"data": [{"b64_json": base64.b64encode(png("red")).decode()}]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            state["calls"] += 1
+            body = payload if state["status"] == 200 else b'{"error": {"message": "content policy"}}'
+            body = state["body"] or body
+            self.send_response(state["status"])
+            for name, value in state["headers"].items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheduler = RequestScheduler("stub", policy=RetryPolicy(max_attempts=1))
+    backend = Backend("stub", f"http://127.0.0.1:{server.server_port}", "gpt-image-1", "key", scheduler=scheduler)
+    monkeypatch.setattr(deployments, "_pool", DeploymentPool([backend]))
+    monkeypatch.setattr(result_cache, "_cache", result_cache.ResultCache(directory=str(tmp_path)))
+    yield state
+    server.shutdown()
+
+
+@pytest.mark.parametrize("module", ["generation", "batch"])
+def test_core_imports_without_streamlit_or_http_stack(module):
+    code = f"import sys, {module}; print(sorted(m for m in ('streamlit', 'requests', 'urllib3') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_generate_image_returns_a_typed_result_and_caches_it(api):
+    first = generate_image("a red square")
+    second = generate_image("a red square")
+
+    assert isinstance(first, GenerationResult)
+    assert first.images[0].size == (8, 8)
+    assert first.item_errors == [] and not first.cached
+    assert second.cached and second.images[0].data == first.images[0].data
+    assert api["calls"] == 1
+
+
+def test_api_errors_carry_the_status_code(api):
+    api["status"] = 400
+    with pytest.raises(APIError) as error:
+        generate_image("blocked", use_cache=False)
+
+    assert error.value.status_code == 400
+    assert error.value.message == "content policy"
+    assert isinstance(error.value, generation.GenerationError)
+
+
+@pytest.mark.parametrize("body", [b"}", b'{"data": []]', b"[1, 2]", b'"data"'])
+def test_malformed_responses_raise_generation_errors(api, body):
+    api["body"] = body
+    with pytest.raises(generation.GenerationError, match="Malformed API response"):
+        generate_image("odd body", use_cache=False)
+
+
+def test_fanned_out_variations_merge_into_one_result(api):
+    result = generate_variations("three squares", n=3, fan_out=True, parallelism=3)
+
+    assert len(result.images) == 3
+    assert api["calls"] == 3
+
+
+def test_load_mask_resizes_and_rejects_bad_input():
+    mask = load_mask(io.BytesIO(png("white", (4, 4))), (16, 8))
+    assert mask.size == (16, 8)
+    assert mask.format == "PNG"
+
+    with pytest.raises(MaskError):
+        load_mask(io.BytesIO(b"not an image"), (16, 8))
+
+
+def test_each_request_leaves_a_trace(api, monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(metrics_module, "_metrics", metrics)
+    api["headers"] = {"x-ratelimit-remaining-requests": "41", "openai-processing-ms": "5"}
+    generate_image("traced", use_cache=False)
+    api["status"] = 429
+    with pytest.raises(APIError):
+        generate_image("throttled", use_cache=False)
+
+    failed, ok = metrics.recent_traces()
+    assert ok["operation"] == "generations" and ok["status"] == 200 and ok["deployment"] == "stub"
+    assert ok["x-ratelimit-remaining-requests"] == "41"
+    assert ok["server_s"] == 0.005
+    assert {"encode_s", "network_s", "decode_s"} <= ok.keys()
+    assert ok["request_bytes"] > 0 and ok["response_bytes"] > 100
+    assert ok["response"]["data"][0]["b64_json"].endswith("elided>")
+    assert failed["status"] == 429 and "API Error: 429" in failed["error"]
+    assert metrics.summary()["gauges"]['x_ratelimit_remaining_requests{deployment="stub"}'] == 41
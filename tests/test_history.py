@@ -0,0 +1,95 @@
+import io
+import threading
+
+from PIL import Image
+
+import history
+from conftest import png
+from generation import GenerationResult
+from history import HistoryStore, run_recorded
+from responses import GeneratedImage
+
+# Larger than a thumbnail
+PHOTO = (600, 400)
+
+
+def test_generations_survive_a_restart(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    generation_id = store.record("a red square", [png("red", PHOTO), png("blue", PHOTO)], "Text to Image",
+                                 size="1536x1024", quality="low", latency_seconds=1.5)
+    store.close()
+
+    reopened = HistoryStore(str(tmp_path))
+    entry = reopened.get(generation_id)
+    assert entry["prompt"] == "a red square"
+    assert entry["n"] == 2
+    assert [(output["width"], output["height"]) for output in entry["outputs"]] == [(600, 400), (600, 400)]
+    assert reopened.image(entry["outputs"][1]["digest"]) == png("blue", PHOTO)
+    with Image.open(io.BytesIO(reopened.thumbnail(entry["outputs"][0]["digest"]))) as thumbnail:
+        assert thumbnail.format == "JPEG"
+        assert max(thumbnail.size) == history.THUMBNAIL_SIDE
+
+
+def test_identical_images_are_stored_once(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.record("first", [png("red")], "Text to Image")
+    store.record("again", [png("red")], "Text to Image")
+
+    stats = store.stats()
+    assert stats["generations"] == 2
+    assert stats["images"] == 1
+    assert stats["image_bytes"] == len(png("red"))
+
+
+def test_pages_are_newest_first_and_filtered(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    for index in range(25):
+        mode = "Image Editing" if index % 5 == 0 else "Text to Image"
+        store.record(f"prompt {index} 100%", [png((index, 0, 0), (32, 32))], mode)
+
+    first = store.page(0, 10)
+    assert [entry["prompt"] for entry in first[:2]] == ["prompt 24 100%", "prompt 23 100%"]
+    assert len(store.page(20, 10)) == 5
+    assert store.count(mode="Image Editing") == 5
+    assert [entry["prompt"] for entry in store.page(0, 2, mode="Image Editing")] == ["prompt 20 100%", "prompt 15 100%"]
+    assert store.count(search="prompt 1") == 11
+    # LIKE wildcards in the search are taken literally
+    assert store.count(search="0%") == 25
+    assert store.count(search="_") == 0
+
+
+def test_recording_from_many_threads(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    threads = [
+        threading.Thread(target=store.record, args=(f"thread {index}", [png((index, index, 0), (16, 16))], "Text to Image"))
+        for index in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.count() == 8
+
+
+def test_run_recorded_keeps_the_result_and_its_metadata(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "_store", HistoryStore(str(tmp_path)))
+
+    def fake_generation(prompt, size, quality, n):
+        return GenerationResult([GeneratedImage(png("green")) for _ in range(n)], ["item 2 failed"])
+
+    result = run_recorded(fake_generation, "Text to Image", "Oil Painting", prompt="oil", size="1024x1024", quality="high", n=2)
+
+    entry = history.get_history_store().get(result.history_id)
+    assert (entry["prompt"], entry["preset"], entry["mode"], entry["n"]) == ("oil", "Oil Painting", "Text to Image", 2)
+    assert entry["item_errors"] == ["item 2 failed"]
+    assert entry["latency_seconds"] is not None
+
+
+def test_history_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_DIR", "")
+    monkeypatch.setattr(history, "_store", None)
+
+    result = run_recorded(lambda prompt: GenerationResult([GeneratedImage(png("red"))]), "Text to Image", prompt="x")
+
+    assert history.get_history_store() is None
+    assert result.history_id is None
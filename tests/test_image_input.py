@@ -0,0 +1,104 @@
+import io
+import os
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from PIL import Image
+
+from image_input import UPLOAD_CHUNK_SIZE, ImageInput, MultipartBody
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "in-painting-example")
+
+
+class FakeUpload(io.BytesIO):
+    """Stand-in for Streamlit's UploadedFile, which is a named BytesIO"""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+@pytest.fixture
+def stub_server():
+    received = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received["transfer_encoding"] = self.headers.get("Transfer-Encoding")
+            message = BytesParser(policy=HTTP).parsebytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body
+            )
+            received["parts"] = {
+                part.get_param("name", header="content-disposition"): (part.get_filename(), part.get_payload(decode=True))
+                for part in message.iter_parts()
+            }
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/images/edits", received
+    server.shutdown()
+
+
+def read_example(name):
+    with open(os.path.join(EXAMPLE_DIR, name), "rb") as f:
+        return f.read()
+
+
+def test_upload_to_multipart_writes_no_files(tmp_path, monkeypatch, stub_server):
+    url, received = stub_server
+    monkeypatch.chdir(tmp_path)
+    image_bytes = read_example("image1.jpg")
+    mask_bytes = read_example("mask.png")
+
+    image = ImageInput.from_upload(FakeUpload(image_bytes, "image1.jpg"))
+    mask = ImageInput.from_upload(FakeUpload(mask_bytes, "mask.png"))
+    body = MultipartBody(
+        {"prompt": "Replace with a tree", "n": "1"},
+        {"image": image.multipart_file(), "mask": mask.multipart_file()},
+    )
+    response = requests.post(url, data=body, headers={"Content-Type": body.content_type})
+
+    assert response.status_code == 200
+    assert os.listdir(tmp_path) == []
+    assert received["transfer_encoding"] is None
+    assert received["parts"]["prompt"] == (None, b"Replace with a tree")
+
+    # The JPEG is re-encoded to PNG once; the PNG mask goes through untouched
+    image_name, image_payload = received["parts"]["image"]
+    assert image_name == "image1.png"
+    assert Image.open(io.BytesIO(image_payload)).format == "PNG"
+    assert received["parts"]["mask"] == ("mask.png", mask_bytes)
+
+
+def test_png_payload_is_a_view_of_the_upload():
+    upload = FakeUpload(read_example("mask.png"), "mask.png")
+    mask = ImageInput.from_upload(upload)
+
+    assert mask.format == "PNG"
+    assert mask.png_payload() is mask.data
+
+
+def test_multipart_body_length_matches_content():
+    body = MultipartBody({"prompt": "x"}, {"image": ("a.png", b"\x89PNG data", "image/png")})
+
+    assert len(body) == len(b"".join(bytes(chunk) for chunk in body))
+
+
+def test_large_payloads_are_sent_in_bounded_slices():
+    payload = bytes(range(256)) * (UPLOAD_CHUNK_SIZE // 100)
+    body = MultipartBody({}, {"image": ("a.png", payload, "image/png")})
+
+    chunks = list(body)
+    assert max(len(chunk) for chunk in chunks) <= UPLOAD_CHUNK_SIZE
+    assert payload in b"".join(bytes(chunk) for chunk in chunks)
@@ -0,0 +1,99 @@
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+import image_workers
+from conftest import encoded
+from image_input import ImageInput
+from image_workers import ImageExecutor, ImageWorkersBusyError
+from mask_processing import prepare_mask
+from preflight import fit_buffers, preflight
+
+
+def noise_png(size):
+    # Incompressible, so the encoded PNG is well over the shared memory threshold
+    return encoded(Image.frombytes("L", size, os.urandom(size[0] * size[1])))
+
+
+def shared_blocks():
+    # SharedMemory names its blocks psm_*; the pool's own semaphores are left out
+    if not os.path.isdir("/dev/shm"):
+        return set()
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+@pytest.fixture
+def process_executor():
+    executor = ImageExecutor("process", workers=1)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("kind", ["inline", "thread"])
+def test_tasks_run_and_raise_like_direct_calls(kind):
+    executor = ImageExecutor(kind, workers=2)
+    source = noise_png((64, 48))
+
+    assert executor.run(prepare_mask, source, (32, 24)) == prepare_mask(source, (32, 24))
+    with pytest.raises(OSError):
+        executor.run(prepare_mask, b"not an image", (32, 24))
+    assert executor.stats()["tasks"] == 2
+    executor.shutdown()
+
+
+def test_process_workers_get_large_buffers_through_shared_memory(process_executor):
+    source = noise_png((800, 600))
+    assert len(source) >= image_workers.SHARED_MEMORY_MIN_BYTES
+    before = shared_blocks()
+
+    result = process_executor.run(prepare_mask, memoryview(source), (400, 300))
+
+    assert result == prepare_mask(source, (400, 300))
+    assert process_executor.stats()["shared_bytes"] == len(source)
+    # Blocks are unlinked once the task is done, whether it succeeded or not
+    with pytest.raises(OSError):
+        process_executor.run(prepare_mask, b"x" * image_workers.SHARED_MEMORY_MIN_BYTES, (8, 8))
+    assert shared_blocks() == before
+
+
+def test_process_workers_fit_uploads_like_the_caller(process_executor, monkeypatch):
+    upload = ImageInput(encoded(Image.linear_gradient("L").resize((3000, 2000)).convert("RGB"), "JPEG"), "photo.jpg")
+    expected = fit_buffers(upload.data, upload.name, None, "1536x1024", "contain")
+    monkeypatch.setattr(image_workers, "_executor", process_executor)
+
+    image, _ = preflight(upload, size="1536x1024")
+
+    assert bytes(image.data) == expected[0]
+    assert (image.size, image.name) == ((1536, 1024), "photo.png")
+    # An input that is already fitted comes back as the same object
+    assert preflight(image, size="1536x1024")[0] is image
+
+
+def test_callers_beyond_the_queue_are_turned_away():
+    executor = ImageExecutor("thread", workers=1, queue_depth=0, timeout=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def busy():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    holder = threading.Thread(target=executor.run, args=(busy,))
+    holder.start()
+    started.wait(5)
+    with pytest.raises(ImageWorkersBusyError):
+        executor.run(len, b"waiting")
+    release.set()
+    holder.join()
+
+    # Room frees up once the running task is done
+    assert executor.run(len, b"next") == 4
+    assert executor.stats()["rejected"] == 1
+    executor.shutdown()
+
+
+def test_unknown_executor_kind_is_rejected():
+    with pytest.raises(ValueError, match="inline, thread, process"):
+        ImageExecutor("gpu")
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from jobs import DONE, FAILED, JobQueue, QueueFullError
+
+
+def wait_for(job, timeout=2):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_lifecycle_done_and_failed():
+    queue = JobQueue(max_workers=2, max_queued=2)
+
+    ok = wait_for(queue.submit(lambda x: x * 2, 21))
+    bad = wait_for(queue.submit(lambda: 1 / 0))
+
+    assert (ok.status, ok.result) == (DONE, 42)
+    assert bad.status == FAILED
+    assert "division by zero" in bad.error
+
+
+def test_submit_rejects_beyond_queue_depth():
+    release = threading.Event()
+    queue = JobQueue(max_workers=1, max_queued=1)
+    queue.submit(release.wait)
+    queue.submit(release.wait)
+
+    with pytest.raises(QueueFullError):
+        queue.submit(release.wait)
+    release.set()
+
+
+def test_pass_job_lets_the_function_publish_partial_results():
+    def work(count, job):
+        for index in range(count):
+            job.partial.append(index)
+        return count
+
+    queue = JobQueue(max_workers=1, max_queued=1)
+    job = wait_for(queue.submit(work, 3, pass_job=True))
+
+    assert job.partial == [0, 1, 2]
+    assert job.result == 3
+
+
+def test_finished_jobs_are_discarded_and_capped():
+    queue = JobQueue(max_workers=1, max_queued=8, max_finished=2)
+    jobs = [wait_for(queue.submit(lambda: None)) for _ in range(4)]
+
+    assert [queue.get(job.id) for job in jobs[:2]] == [None, None]
+    queue.discard(jobs[3].id)
+    assert queue.get(jobs[3].id) is None
+    assert queue.get(jobs[2].id) is jobs[2]
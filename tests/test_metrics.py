@@ -0,0 +1,73 @@
+import socket
+import urllib.request
+
+import metrics as metrics_module
+from metrics import Metrics, Trace, start_metrics_server
+
+
+def test_counters_and_samples_are_keyed_by_labels():
+    metrics = Metrics(window=10)
+    metrics.inc("requests_total", strategy="single")
+    metrics.inc("requests_total", strategy="single")
+    for value in range(1, 21):
+        metrics.observe("wall_seconds", value, strategy="fan-out")
+
+    summary = metrics.summary()
+    assert summary["counters"] == {'requests_total{strategy="single"}': 2}
+    series = summary["samples"]['wall_seconds{strategy="fan-out"}']
+    # Only the last `window` samples are kept
+    assert series["count"] == 10
+    assert series["max"] == 20
+    assert 14 <= series["p50"] <= 16
+
+
+def test_traces_feed_series_and_are_kept_newest_first():
+    metrics = Metrics(trace_history=2)
+    for status in (200, 429, 200):
+        trace = Trace("edits")
+        with trace.stage("encode"):
+            pass
+        trace.stages["network"] = 0.5
+        trace.fields.update(status=status, request_bytes=1000, response_bytes=2000)
+        metrics.record_trace(trace)
+
+    traces = metrics.recent_traces()
+    assert [trace["status"] for trace in traces] == [200, 429]
+    assert traces[0]["network_s"] == 0.5
+    summary = metrics.summary()
+    assert summary["counters"]['api_responses_total{operation="edits",status="200"}'] == 2
+    assert summary["samples"]['api_stage_seconds{operation="edits",stage="network"}']["count"] == 3
+    assert summary["samples"]['api_request_bytes{operation="edits"}']["max"] == 1000
+
+
+def test_prometheus_text_and_endpoint(monkeypatch):
+    metrics = Metrics()
+    metrics.inc("retries_total", deployment="west", reason="429")
+    metrics.set("x_ratelimit_remaining_requests", 7, deployment="west")
+    metrics.observe("rerun_seconds", 0.25)
+    text = metrics.render_prometheus()
+
+    assert "# TYPE retries_total counter" in text
+    assert 'retries_total{deployment="west",reason="429"} 1' in text
+    assert 'x_ratelimit_remaining_requests{deployment="west"} 7' in text
+    assert 'rerun_seconds{quantile="0.5"} 0.25' in text
+    assert "rerun_seconds_count 1" in text
+
+    monkeypatch.setattr(metrics_module, "_metrics", metrics)
+    monkeypatch.setattr(metrics_module, "_server", None)
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = start_metrics_server(port)
+    try:
+        assert start_metrics_server(port) is server
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.read().decode() == text
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_metrics_server_is_off_without_a_port(monkeypatch):
+    monkeypatch.setattr(metrics_module, "_server", None)
+    assert start_metrics_server(0) is None
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+import requests
+
+from conftest import png
+from generation import APIError, generate_image, load_mask
+from image_input import ImageInput, MultipartBody
+from mock_server import parse_latency
+
+
+def test_latency_specs():
+    rng = random.Random(1)
+    assert parse_latency("0.25")(rng) == 0.25
+    assert all(1 <= parse_latency("uniform:1:2")(rng) <= 2 for _ in range(50))
+    assert all(parse_latency("normal:0:1")(rng) >= 0 for _ in range(50))
+    assert parse_latency("lognormal:0:0.5")(rng) > 0
+    with pytest.raises(ValueError):
+        parse_latency("pareto:1:2")
+
+
+@pytest.mark.parametrize("response_format", ["b64_json", "url"])
+def test_generations_are_deterministic_in_both_formats(start_mock, response_format):
+    start_mock(attempts=3, response_format=response_format)
+
+    first = generate_image("a lighthouse", size="1024x1536", n=2, use_cache=False)
+    again = generate_image("a lighthouse", size="1024x1536", n=2, use_cache=False)
+
+    assert [img.size for img in first.images] == [(1024, 1536), (1024, 1536)]
+    assert [img.data for img in first.images] == [img.data for img in again.images]
+
+
+def test_edits_check_the_multipart_upload(start_mock):
+    service = start_mock(attempts=3, detail="flat")
+    image = ImageInput(png(size=(600, 400)), "photo.png")
+    mask = load_mask(png(size=(600, 400), mode="L"), image.size)
+
+    result = generate_image("paint it", image, mask, size="1536x1024", use_cache=False)
+    assert result.images[0].size == (1536, 1024)
+
+    # A mask that does not line up with the image is rejected like the real service would
+    body = MultipartBody({"prompt": "paint it"}, {
+        "image": ("photo.png", png(size=(600, 400)), "image/png"),
+        "mask": ("mask.png", png(size=(300, 200), mode="RGBA"), "image/png"),
+    })
+    response = requests.post(
+        f"{service.endpoint}/openai/deployments/gpt-image-1/images/edits",
+        data=b"".join(bytes(chunk) for chunk in body),
+        headers={"api-key": "key", "Content-Type": body.content_type},
+    )
+    assert response.status_code == 400
+    assert "does not match" in response.json()["error"]["message"]
+    assert service.counters["rejected"] == 1
+
+
+def test_injected_throttling_is_retried(start_mock):
+    service = start_mock(attempts=3, throttle_rate=0.5, retry_after=0.01, seed=3)
+
+    for index in range(6):
+        generate_image(f"prompt {index}", use_cache=False)
+
+    assert service.counters["throttled"] >= 1
+    assert service.counters["status_200"] == 6
+
+
+def test_injected_errors_surface_as_api_errors(start_mock):
+    start_mock(attempts=3, error_rate=1.0)
+    with pytest.raises(APIError) as error:
+        generate_image("always fails", use_cache=False)
+    assert error.value.status_code == 500
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+from conftest import encoded
+from generation import load_mask
+from image_input import ImageInput
+from preflight import plan_fit, preflight
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "in-painting-example")
+
+
+def photo(size, format="JPEG"):
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    return ImageInput(encoded(img, format), f"photo.{format.lower()}")
+
+
+def test_plan_fit_contains_or_covers_without_upscaling():
+    assert plan_fit((6000, 4000), (1536, 1024), "contain") == (None, (1536, 1024))
+    assert plan_fit((4000, 4000), (1536, 1024), "contain") == (None, (1024, 1024))
+    assert plan_fit((800, 600), (1536, 1024), "contain") == (None, (800, 600))
+    assert plan_fit((4000, 4000), (1536, 1024), "cover") == ((0, 666, 4000, 3333), (1536, 1024))
+    # Too small to fill the target: cropped to its aspect but kept at native resolution
+    assert plan_fit((600, 600), (1536, 1024), "cover") == ((0, 100, 600, 500), (600, 400))
+
+
+def test_large_jpeg_becomes_a_target_sized_png():
+    image, _ = preflight(photo((6000, 4000)), size="1536x1024")
+
+    assert image.size == (1536, 1024)
+    assert image.format == "PNG"
+    assert image.multipart_file()[0] == "photo.png"
+
+
+def test_png_that_already_fits_is_sent_untouched():
+    original = photo((800, 600), format="PNG")
+    image, _ = preflight(original, size="1024x1024")
+    assert image is original
+
+
+@pytest.mark.parametrize("fit", ["contain", "cover"])
+def test_mask_stays_aligned_with_the_image(fit):
+    # A square image with a red block in its top-right quadrant, and a mask marking that block
+    base = Image.new("RGB", (2000, 2000), "black")
+    ImageDraw.Draw(base).rectangle((1200, 600, 1599, 999), fill="red")
+    region = Image.new("L", (2000, 2000), 0)
+    ImageDraw.Draw(region).rectangle((1200, 600, 1599, 999), fill=255)
+    image = ImageInput(encoded(base), "base.png")
+    mask = load_mask(encoded(region), image.size)
+
+    image, mask = preflight(image, mask, size="1536x1024", fit=fit)
+
+    assert image.size == mask.size
+    with mask.open() as opened:
+        assert opened.mode == "LA"
+        alpha = opened.getchannel("A")
+    assert {value for _, value in alpha.getcolors()} <= {0, 255}
+    # Transparent (editable) pixels sit exactly where the red block landed
+    with image.open() as opened:
+        red = opened.convert("RGB").point(lambda v: 255 if v > 128 else 0).getchannel("R")
+    red_box, hole_box = red.getbbox(), alpha.point(lambda v: 255 - v).getbbox()
+    assert all(abs(a - b) <= 2 for a, b in zip(red_box, hole_box))
+
+
+def test_inpainting_example_shrinks_on_the_wire():
+    with open(os.path.join(EXAMPLE_DIR, "image1.jpg"), "rb") as f:
+        original = ImageInput(f.read(), "image1.jpg")
+    with open(os.path.join(EXAMPLE_DIR, "mask.png"), "rb") as f:
+        original_mask = load_mask(f, original.size)
+
+    image, mask = preflight(original, original_mask, size="1536x1024")
+
+    assert image.size == mask.size == (1536, 960)
+    assert len(image.png_payload()) < len(original.png_payload()) * 0.8
+    assert len(mask.png_payload()) < len(original_mask.png_payload())
+
+
+def test_fit_off_leaves_inputs_alone():
+    original = photo((3000, 2000))
+    assert preflight(original, size="1024x1024", fit="off")[0] is original
@@ -0,0 +1,183 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from rate_limit import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RequestCancelledError,
+    RequestScheduler,
+    RetryPolicy,
+    TokenBucket,
+    parse_duration,
+    server_delay,
+)
+from transport import Transport
+
+
+class FakeEndpoint:
+    """Local endpoint that answers with a scripted sequence of statuses, then 200s"""
+
+    def __init__(self, script, latency=0.0, headers=None):
+        self.script = list(script)
+        self.hits = 0
+        lock = threading.Lock()
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with lock:
+                    endpoint.hits += 1
+                    status = endpoint.script.pop(0) if endpoint.script else 200
+                time.sleep(latency)
+                body = b'{"data": []}'
+                self.send_response(status)
+                for name, value in (headers or {}).get(status, {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/images/generations"
+
+    def close(self):
+        self.server.shutdown()
+
+
+@pytest.fixture
+def transport():
+    return Transport(pool_size=4)
+
+
+def test_parse_duration_formats():
+    assert parse_duration("20") == 20
+    assert parse_duration("250ms") == pytest.approx(0.25)
+    assert parse_duration("1m30s") == 90
+    assert parse_duration("soon") is None
+    assert server_delay({"retry-after-ms": "150", "retry-after": "9"}) == pytest.approx(0.15)
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=1, max_delay=3)
+    delays = [policy.delay(attempt) for attempt in range(1, 8) for _ in range(20)]
+    assert all(0 <= delay <= 3 for delay in delays)
+    assert policy.delay(1, {"retry-after": "2"}) == 2
+    assert policy.delay(1, {"retry-after": "120"}) == 3
+
+
+def test_429s_are_retried_after_the_server_delay(transport):
+    endpoint = FakeEndpoint([429, 429], headers={429: {"retry-after-ms": "50"}})
+    scheduler = RequestScheduler("test", policy=RetryPolicy(max_attempts=4))
+    try:
+        start = time.perf_counter()
+        response = scheduler.send(lambda: transport.post(endpoint.url, json={}))
+        elapsed = time.perf_counter() - start
+    finally:
+        endpoint.close()
+
+    assert response.status_code == 200
+    assert endpoint.hits == 3
+    assert elapsed >= 0.1
+
+
+def test_gives_up_after_max_attempts(transport):
+    endpoint = FakeEndpoint([503] * 5)
+    scheduler = RequestScheduler("test", policy=RetryPolicy(max_attempts=3, base_delay=0.01))
+    try:
+        response = scheduler.send(lambda: transport.post(endpoint.url, json={}))
+    finally:
+        endpoint.close()
+
+    assert response.status_code == 503
+    assert endpoint.hits == 3
+
+
+def test_429_pause_holds_back_concurrent_callers(transport):
+    endpoint = FakeEndpoint([429], latency=0.01, headers={429: {"retry-after-ms": "200"}})
+    scheduler = RequestScheduler("test", policy=RetryPolicy(max_attempts=3))
+    finished = []
+
+    def call():
+        scheduler.send(lambda: transport.post(endpoint.url, json={}))
+        finished.append(time.perf_counter())
+
+    try:
+        start = time.perf_counter()
+        first = threading.Thread(target=call)
+        first.start()
+        time.sleep(0.1)  # the first request has been throttled by now
+        second = threading.Thread(target=call)
+        second.start()
+        first.join()
+        second.join()
+    finally:
+        endpoint.close()
+
+    assert all(at - start >= 0.2 for at in finished)
+
+
+def test_circuit_breaker_opens_on_sustained_5xx_and_recovers(transport):
+    endpoint = FakeEndpoint([500] * 4)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    scheduler = RequestScheduler("test", policy=RetryPolicy(max_attempts=2, base_delay=0.01), breaker=breaker)
+    try:
+        assert scheduler.send(lambda: transport.post(endpoint.url, json={})).status_code == 500
+        with pytest.raises(CircuitOpenError):
+            scheduler.send(lambda: transport.post(endpoint.url, json={}))
+        time.sleep(0.15)
+        # Half-open trial fails and re-opens, then the next trial succeeds
+        scheduler.policy = RetryPolicy(max_attempts=1)
+        assert scheduler.send(lambda: transport.post(endpoint.url, json={})).status_code == 500
+        assert breaker.state == CircuitBreaker.OPEN
+        time.sleep(0.15)
+        endpoint.script = []
+        assert scheduler.send(lambda: transport.post(endpoint.url, json={})).status_code == 200
+        assert breaker.state == CircuitBreaker.CLOSED
+    finally:
+        endpoint.close()
+
+
+def test_half_open_trial_is_given_back_without_an_outcome():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    scheduler = RequestScheduler("test", policy=RetryPolicy(max_attempts=1), breaker=breaker)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    def broken():
+        raise ValueError("not a network error")
+
+    with pytest.raises(ValueError):
+        scheduler.send(broken)
+    # The trial slot is free again instead of stuck half-open
+    assert breaker.state == CircuitBreaker.OPEN and breaker.available()
+
+    # A cancelled request does not take the trial at all
+    cancelled = threading.Event()
+    cancelled.set()
+    with pytest.raises(RequestCancelledError):
+        scheduler.send(broken, cancelled=cancelled)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.available()
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate_per_minute=600, capacity=1)  # 10 per second
+    start = time.perf_counter()
+    for _ in range(4):
+        bucket.acquire()
+    assert time.perf_counter() - start >= 0.25
+
+
+def test_token_bucket_follows_remaining_header():
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    bucket.update(0)
+    assert bucket.acquire(timeout=0.05) is False
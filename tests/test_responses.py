@@ -0,0 +1,108 @@
+import base64
+import io
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from conftest import png
+from responses import Base64DecodeError, GeneratedImage, StreamingResponseParser, elide_response, parse_stream
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def sample_body(images):
+    return json.dumps({
+        "created": 1745000000,
+        "data": [{"b64_json": base64.b64encode(data).decode(), "revised_prompt": "a \"red\" square é"} for data in images],
+        "usage": {"total_tokens": 42, "ratio": 0.5, "flags": [True, False, None]},
+    }).encode()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64, 1 << 20])
+def test_streamed_parse_matches_json_loads(chunk_size):
+    images = [png("red", (16, 8)), os.urandom(1001)]
+    body = sample_body(images)
+
+    parsed = parse_stream(chunked(body, chunk_size))
+    expected = json.loads(body)
+
+    assert [item["b64_json"] for item in parsed["data"]] == images
+    for item, reference in zip(parsed["data"], expected["data"]):
+        assert item["revised_prompt"] == reference["revised_prompt"]
+    assert parsed["usage"] == expected["usage"]
+    assert parsed["created"] == expected["created"]
+
+
+def test_escaped_slashes_in_base64_are_decoded():
+    data = bytes(range(256)) * 4
+    encoded = base64.b64encode(data).decode().replace("/", "\\/")
+    body = ('{"data": [{"b64_json": "' + encoded + '"}]}').encode()
+
+    for size in (1, 3, 10):
+        assert parse_stream(chunked(body, size))["data"][0]["b64_json"] == data
+
+
+def test_malformed_base64_becomes_an_error_value():
+    parsed = parse_stream([b'{"data": [{"b64_json": "not*base64!"}, {"url": "http://x/y.png"}]}'])
+
+    assert isinstance(parsed["data"][0]["b64_json"], Base64DecodeError)
+    assert parsed["data"][1] == {"url": "http://x/y.png"}
+
+
+def test_truncated_body_is_rejected():
+    parser = StreamingResponseParser()
+    parser.feed(b'{"data": [{"b64_json": "AAAA')
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+@pytest.mark.parametrize("body", [b"}", b"]", b":", b",", b'{"a": 1]', b"[1}", b'["a": 1]', b"{} {}"])
+def test_unbalanced_tokens_are_rejected(body):
+    with pytest.raises(ValueError):
+        parse_stream([body])
+
+
+def test_elided_response_hides_image_data():
+    document = parse_stream([json.dumps({
+        "created": 1,
+        "data": [{"b64_json": base64.b64encode(b"x" * 300).decode(), "revised_prompt": "p" * 500}, {"b64_json": "!!"}],
+    }).encode()])
+
+    elided = elide_response(document, max_text=10)
+    assert elided["created"] == 1
+    assert elided["data"][0]["b64_json"] == "<300 bytes of image data elided>"
+    assert elided["data"][0]["revised_prompt"] == "pppppppppp... <490 more characters>"
+    assert elided["data"][1]["b64_json"].startswith("<undecodable base64")
+    assert len(json.dumps(elided)) < 300
+
+
+def test_generated_image_decodes_lazily():
+    data = png("red", (32, 16))
+    result = GeneratedImage(data)
+
+    assert result._image is None
+    assert result.size == (32, 16)
+    assert result.data is data
+
+
+def test_preview_is_downscaled_and_cached():
+    result = GeneratedImage(png("red", (1536, 1024)))
+
+    preview = result.preview(max_side=512)
+    assert result.preview(max_side=512) is preview
+    with Image.open(io.BytesIO(preview)) as img:
+        assert img.format == "JPEG"
+        assert img.size == (512, 341)
+
+
+def test_preview_keeps_transparency():
+    buf = io.BytesIO()
+    Image.new("RGBA", (64, 64), (0, 0, 0, 0)).save(buf, format="PNG")
+
+    with Image.open(io.BytesIO(GeneratedImage(buf.getvalue()).preview())) as img:
+        assert img.format == "PNG"
+        assert img.mode == "RGBA"
@@ -0,0 +1,89 @@
+import os
+import time
+
+from result_cache import ResultCache, cache_key
+
+
+def make_cache(tmp_path, **kwargs):
+    kwargs.setdefault("max_entries", 8)
+    kwargs.setdefault("max_memory_bytes", 10_000)
+    kwargs.setdefault("max_disk_bytes", 10_000)
+    kwargs.setdefault("ttl", 60)
+    return ResultCache(directory=str(tmp_path), **kwargs)
+
+
+def test_cache_key_depends_on_every_input():
+    base = cache_key("prompt", b"image", b"mask", "1024x1024", "high", 1, "gpt-image-1")
+    assert base == cache_key("prompt", memoryview(b"image"), b"mask", "1024x1024", "high", 1, "gpt-image-1")
+    assert base != cache_key("prompt", b"image", None, "1024x1024", "high", 1, "gpt-image-1")
+    assert base != cache_key("prompt", b"image", b"mask", "1024x1024", "high", 2, "gpt-image-1")
+    assert base != cache_key("other", b"image", b"mask", "1024x1024", "high", 1, "gpt-image-1")
+
+
+def test_put_then_get_hits_memory(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("k", [b"one", b"two"])
+
+    assert cache.get("k") == [b"one", b"two"]
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_disk_tier_survives_a_new_process(tmp_path):
+    make_cache(tmp_path).put("k", [b"one", b"two"])
+    cache = make_cache(tmp_path)
+
+    assert cache.get("k") == [b"one", b"two"]
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get("k") == [b"one", b"two"]
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = make_cache(tmp_path, ttl=0.05)
+    cache.put("k", [b"data"])
+    time.sleep(0.1)
+
+    assert cache.get("k") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_promotion_keeps_original_age(tmp_path):
+    make_cache(tmp_path).put("k", [b"data"])
+    old = time.time() - 50
+    for folder in os.scandir(tmp_path):
+        for entry in os.scandir(folder.path):
+            os.utime(entry.path, (old, old))
+
+    cache = make_cache(tmp_path, ttl=60)
+    assert cache.get("k") == [b"data"]
+    stored_at, _ = cache._memory["k"]
+    assert abs(stored_at - old) < 1
+
+
+def test_memory_tier_evicts_by_count_and_bytes(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2, max_memory_bytes=250)
+    cache.directory = ""  # memory only
+    cache.put("a", [b"x" * 100])
+    cache.put("b", [b"x" * 100])
+    cache.put("c", [b"x" * 100])  # over the entry cap
+    assert cache.get("a") is None
+
+    cache.put("d", [b"x" * 200])  # over the byte cap
+    stats = cache.stats()
+    assert stats["memory_bytes"] <= 250
+    assert stats["evictions"] == 3
+    assert cache.get("d") == [b"x" * 200]
+
+
+def test_disk_tier_evicts_whole_entries(tmp_path):
+    cache = make_cache(tmp_path, max_disk_bytes=2500)
+    for key in ("k1", "k2", "k3"):
+        cache.put(key, [b"x" * 500, b"y" * 500])
+        time.sleep(0.01)
+
+    files = [entry.name for folder in os.scandir(tmp_path) for entry in os.scandir(folder.path)]
+    assert sorted(files) == ["k2.0.png", "k2.1.png", "k3.0.png", "k3.1.png"]
+    assert cache.stats()["disk_evictions"] == 1
@@ -0,0 +1,129 @@
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+import tiling
+from conftest import encoded
+from generation import GenerationError, GenerationResult, load_mask
+from image_input import ImageInput
+from responses import GeneratedImage
+from tiling import generate_tiled, plan_tiles, stitch
+
+
+def test_tiles_cover_the_whole_image_with_overlap():
+    boxes = plan_tiles((3000, 2000), (1024, 1024), overlap=128)
+
+    assert all((right - left, bottom - top) == (1024, 1024) for left, top, right, bottom in boxes)
+    covered = Image.new("L", (3000, 2000), 0)
+    for box in boxes:
+        covered.paste(255, box)
+    assert covered.getextrema() == (255, 255)
+    xs = sorted({box[0] for box in boxes})
+    assert all(a + 1024 - b >= 128 for a, b in zip(xs, xs[1:]))
+
+
+def test_small_region_needs_one_tile_around_it():
+    boxes = plan_tiles((6000, 4000), (1536, 1024), region=(5500, 3800, 5900, 3950))
+
+    assert len(boxes) == 1
+    left, top, right, bottom = boxes[0]
+    assert (right - left, bottom - top) == (1536, 1024)
+    assert left <= 5500 and right >= 5900 and top <= 3800 and bottom == 4000
+
+
+def test_images_smaller_than_the_tile_are_sent_whole():
+    assert plan_tiles((800, 600), (1024, 1024)) == [(0, 0, 800, 600)]
+
+
+def test_overlapping_tiles_cross_fade():
+    base = Image.new("RGB", (200, 100), "black")
+    patches = [((0, 0, 120, 100), Image.new("RGB", (120, 100), (200, 0, 0))),
+               ((80, 0, 200, 100), Image.new("RGB", (120, 100), (0, 0, 200)))]
+
+    out = stitch(base, patches)
+
+    assert out.getpixel((10, 50)) == (200, 0, 0)
+    assert out.getpixel((190, 50)) == (0, 0, 200)
+    red, _, blue = out.getpixel((100, 50))
+    assert 80 < red < 120 and 80 < blue < 120
+
+
+def test_masked_edit_sends_one_crop_and_keeps_full_resolution(mock):
+    photo = Image.linear_gradient("L").resize((3000, 2000)).convert("RGB")
+    image = ImageInput(encoded(photo, "JPEG"), "photo.jpg")
+    region = Image.new("L", (3000, 2000), 0)
+    ImageDraw.Draw(region).rectangle((2500, 1500, 2699, 1699), fill=255)
+    mask = load_mask(encoded(region), image.size)
+
+    result = generate_tiled("a red ball", image, mask, size="1024x1024")
+
+    assert mock.counters["edits_requests"] == 1
+    assert result.images[0].size == (3000, 2000)
+    out = result.images[0].image.convert("RGB")
+    with image.open() as original:
+        original = original.convert("RGB")
+        # Far from the mask the original pixels are kept exactly
+        assert out.getpixel((100, 100)) == original.getpixel((100, 100))
+        assert out.getpixel((2600, 1600)) != original.getpixel((2600, 1600))
+
+
+def test_unmasked_edit_tiles_the_whole_image(mock):
+    photo = Image.linear_gradient("L").resize((2000, 1500)).convert("RGB")
+    image = ImageInput(encoded(photo), "photo.png")
+
+    result = generate_tiled("oil painting", image, size="1024x1024", n=2, use_cache=False)
+
+    # Two tiles across would overlap by less than the minimum, so it takes three by two
+    assert mock.counters["edits_requests"] == len(plan_tiles((2000, 1500), (1024, 1024))) == 6
+    assert [img.size for img in result.images] == [(2000, 1500), (2000, 1500)]
+
+
+def test_short_images_are_padded_not_stretched(monkeypatch):
+    sent = []
+
+    def echo(prompt, image, mask, size, n, quality, use_cache):
+        # Like the API, returns the input as an edit at the requested size
+        sent.append((image.size, mask))
+        with image.open() as img:
+            return GenerationResult([GeneratedImage(encoded(img.resize(tiling.parse_size(size))))])
+
+    monkeypatch.setattr(tiling, "generate_image", echo)
+    photo = Image.linear_gradient("L").resize((1920, 800)).convert("RGB")
+    ImageDraw.Draw(photo).line((0, 400, 1919, 400), fill=(255, 0, 0), width=4)
+
+    result = generate_tiled("no change", ImageInput(encoded(photo), "photo.png"), size="1024x1024")
+
+    assert [size for size, _ in sent] == [(1024, 1024), (1024, 1024)]
+    out = result.images[0].image.convert("RGB")
+    assert out.size == (1920, 800)
+    assert max(high for _, high in ImageChops.difference(out, photo).getextrema()) <= 2
+
+
+def test_padding_is_kept_out_of_the_mask(monkeypatch):
+    masks = []
+
+    def capture(prompt, image, mask, size, n, quality, use_cache):
+        with mask.open() as img:
+            masks.append(img.getchannel("A"))
+        with image.open() as img:
+            return GenerationResult([GeneratedImage(encoded(img))])
+
+    monkeypatch.setattr(tiling, "generate_image", capture)
+    photo = Image.new("RGB", (1920, 800), "gray")
+    region = Image.new("L", photo.size, 0)
+    ImageDraw.Draw(region).rectangle((100, 100, 199, 199), fill=255)
+    image = ImageInput(encoded(photo), "photo.png")
+
+    generate_tiled("a red ball", image, load_mask(encoded(region), image.size), size="1024x1024")
+
+    assert len(masks) == 1 and masks[0].size == (1024, 1024)
+    # Only the masked square is transparent; the padding below the photo stays opaque
+    assert masks[0].getpixel((150, 150)) == 0
+    assert masks[0].crop((0, 800, 1024, 1024)).getextrema() == (255, 255)
+
+
+def test_images_that_fit_in_one_tile_are_not_tiled():
+    image = ImageInput(encoded(Image.new("RGB", (1000, 800))), "small.png")
+
+    with pytest.raises(GenerationError, match="fits in one 1024x1024 tile"):
+        generate_tiled("oil painting", image, size="1024x1024")
+    assert tiling.needs_tiles((1920, 800), "1024x1024")
@@ -0,0 +1,56 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from transport import Transport
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_sequential_requests_reuse_one_connection(stub_url):
+    transport = Transport(pool_size=2)
+    for _ in range(5):
+        assert transport.get(stub_url).status_code == 200
+
+    stats = transport.stats()
+    assert stats["requests"] == 5
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 4
+
+
+def test_failed_requests_are_not_counted_as_reuse():
+    transport = Transport(pool_size=2, connect_timeout=1)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.get(f"http://127.0.0.1:{unused_port()}/")
+
+    stats = transport.stats()
+    assert stats["requests_failed"] == 1
+    assert stats["connections_reused"] == 0
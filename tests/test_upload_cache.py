@@ -0,0 +1,95 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from conftest import encoded
+from preflight import preflight
+from upload_cache import UploadCache
+
+
+def photo(size=(3000, 2000), color=0):
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    ImageDraw.Draw(img).rectangle((0, 0, 50, 50), fill=(color, 0, 0))
+    return encoded(img, "JPEG")
+
+
+def region(size=(3000, 2000)):
+    img = Image.new("L", size, 0)
+    ImageDraw.Draw(img).rectangle((1000, 500, 1999, 1499), fill=255)
+    return encoded(img)
+
+
+def test_rerun_with_the_same_upload_reuses_the_prepared_entry():
+    cache = UploadCache()
+    data = photo()
+
+    first = cache.image("file-1", data, "photo.jpg")
+    second = cache.image("file-1", memoryview(data), "photo.jpg")
+
+    assert second is first
+    assert first.size == (3000, 2000)
+    # Large uploads are previewed downscaled, not sent to the browser at full size
+    with Image.open(io.BytesIO(first.preview)) as preview:
+        assert max(preview.size) == 1024
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_new_contents_under_the_same_file_id_are_prepared_again():
+    cache = UploadCache()
+    first = cache.image("file-1", photo(color=0), "photo.jpg")
+    second = cache.image("file-1", photo(color=255), "photo.jpg")
+
+    assert second is not first
+    assert cache.stats()["misses"] == 2
+
+
+def test_mask_is_prepared_once_and_rejections_are_remembered():
+    cache = UploadCache()
+    image = cache.image("file-1", photo(), "photo.jpg")
+
+    mask = cache.mask("mask-1", region(), image)
+    assert cache.mask("mask-1", region(), image) is mask
+    assert mask.size == image.size
+
+    bad = cache.mask("mask-2", b"not an image", image)
+    assert bad.error.startswith("Error processing mask")
+    assert cache.mask("mask-2", b"not an image", image) is bad
+    assert cache.stats()["misses"] == 3
+
+
+def test_payload_is_fitted_once_and_passes_pre_flight_unchanged():
+    cache = UploadCache()
+    image = cache.image("file-1", photo(), "photo.jpg")
+    mask = cache.mask("mask-1", region(), image)
+
+    fitted, fitted_mask = cache.payload(image, mask, "1536x1024")
+    assert cache.payload(image, mask, "1536x1024")[0] is fitted
+    assert fitted.size == fitted_mask.size == (1536, 1024)
+
+    # The request path runs pre-flight again; a prepared payload comes back as-is
+    again, again_mask = preflight(fitted, fitted_mask, "1536x1024")
+    assert again is fitted
+    assert again_mask is fitted_mask
+
+
+def test_memory_stays_within_the_session_budget():
+    data = photo()
+    cache = UploadCache(max_bytes=3 * len(data))
+
+    for index in range(6):
+        cache.image(f"file-{index}", photo(color=index), "photo.jpg")
+
+    stats = cache.stats()
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] >= 3
+    # Least recently used entries go first
+    cache.image("file-5", photo(color=5), "photo.jpg")
+    assert cache.stats()["hits"] == 1
+
+
+def test_zero_budget_disables_caching():
+    cache = UploadCache(max_bytes=0)
+    data = photo()
+    assert cache.image("file-1", data, "photo.jpg") is not cache.image("file-1", data, "photo.jpg")
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,228 @@
+import io
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageChops, ImageFilter
+
+from generation import FANOUT_PARALLELISM, GenerationError, GenerationResult, generate_image
+from image_input import ImageInput
+from metrics import get_metrics
+from preflight import MASK_COMPRESS_LEVEL, PNG_COMPRESS_LEVEL, parse_size
+from responses import GeneratedImage
+
+# Pixels shared by neighbouring tiles; their results are cross-faded across it
+TILE_OVERLAP = int(os.getenv("IMAGEGEN_TILE_OVERLAP", "128"))
+# Unmasked pixels kept around the mask's bounding box so the model sees the surroundings
+TILE_CONTEXT = int(os.getenv("IMAGEGEN_TILE_CONTEXT", "64"))
+# Blur radius with which an edited region fades into the original pixels at the mask's edge
+TILE_FEATHER = int(os.getenv("IMAGEGEN_TILE_FEATHER", "8"))
+
+
+def _offsets(start, end, length, tile, overlap):
+    """Offsets of tiles of the given length covering [start, end) inside [0, length), overlapping by at least overlap"""
+    # Grow the span to at least one tile around its centre, then keep it inside the image
+    span = min(length, max(end - start, tile))
+    start = min(max(0, (start + end - span) // 2), length - span)
+    if span <= tile:
+        return [start]
+    count = math.ceil((span - overlap) / (tile - overlap))
+    step = (span - tile) / (count - 1)
+    return [start + round(index * step) for index in range(count)]
+
+
+def plan_tiles(image_size, tile_size, region=None, overlap=TILE_OVERLAP):
+    """Boxes of tile_size (smaller only where the image is) covering region, or the whole image, row by row"""
+    width, height = image_size
+    left, top, right, bottom = region or (0, 0, width, height)
+    tile_width, tile_height = min(tile_size[0], width), min(tile_size[1], height)
+    xs = _offsets(left, right, width, tile_width, overlap)
+    ys = _offsets(top, bottom, height, tile_height, overlap)
+    return [(x, y, x + tile_width, y + tile_height) for y in ys for x in xs]
+
+
+def needs_tiles(image_size, size):
+    """Whether an image is larger than one tile of the given Image Size in either dimension"""
+    tile_width, tile_height = parse_size(size)
+    return image_size[0] > tile_width or image_size[1] > tile_height
+
+
+def _pad(image, size, fill=None):
+    """image in the top-left corner of an image of size, its last column and row stretched over the rest.
+
+    With fill, the rest is filled with that colour instead.
+    """
+    if image.size == tuple(size):
+        return image
+    width, height = image.size
+    padded = Image.new(image.mode, size, 0 if fill is None else fill)
+    padded.paste(image, (0, 0))
+    if fill is None:
+        if size[0] > width:
+            padded.paste(image.crop((width - 1, 0, width, height)).resize((size[0] - width, height)), (width, 0))
+        if size[1] > height:
+            padded.paste(padded.crop((0, height - 1, size[0], height)).resize((size[0], size[1] - height)), (0, height))
+    return padded
+
+
+def _unpad(image, content_size, size):
+    """The part of a result for a tile padded from content_size to size that covers the tile itself"""
+    if tuple(content_size) == tuple(size):
+        return image
+    scale_x, scale_y = image.width / size[0], image.height / size[1]
+    return image.crop((0, 0, round(content_size[0] * scale_x), round(content_size[1] * scale_y)))
+
+
+def edit_region(mask, size):
+    """An "L" image of the given size that is 255 where a processed mask marks pixels to change"""
+    with mask.open() as img:
+        alpha = img.convert("RGBA").getchannel("A")
+    if alpha.size != tuple(size):
+        alpha = alpha.resize(size, Image.Resampling.NEAREST)
+    return ImageChops.invert(alpha)
+
+
+def _seam_weights(box, earlier):
+    """Paste mask for a tile: ramps from 0 to 255 across its overlap with tiles pasted before it.
+
+    The earlier tile stays fully opaque under the overlap, so pasting in
+    order gives a linear cross-fade between the two.
+    """
+    left, top, right, bottom = box
+    weights = Image.new("L", (right - left, bottom - top), 255)
+    overlap_x = max((b[2] - left for b in earlier if b[1] == top and b[0] < left < b[2]), default=0)
+    overlap_y = max((b[3] - top for b in earlier if b[0] == left and b[1] < top < b[3]), default=0)
+    if overlap_x:
+        ramp = Image.linear_gradient("L").transpose(Image.Transpose.ROTATE_90)
+        weights.paste(ramp.resize((overlap_x, weights.height)), (0, 0))
+    if overlap_y:
+        ramp = Image.new("L", weights.size, 255)
+        ramp.paste(Image.linear_gradient("L").resize((weights.width, overlap_y)), (0, 0))
+        weights = ImageChops.multiply(weights, ramp)
+    return weights
+
+
+def _encode(image, name, **params):
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", **params)
+    return ImageInput(buf.getvalue(), name)
+
+
+def stitch(base, patches, region=None, feather=TILE_FEATHER):
+    """Paste (box, image) patches over a copy of base with cross-faded seams.
+
+    With region (an "L" edit mask of base's size) the result keeps base's
+    pixels outside it, fading in over feather pixels at its edge.
+    """
+    result = base.copy()
+    if not patches:
+        return result
+    # Only pixels under the patches can change, so the blending works on that window alone
+    window = (
+        min(box[0] for box, _ in patches), min(box[1] for box, _ in patches),
+        max(box[2] for box, _ in patches), max(box[3] for box, _ in patches),
+    )
+    canvas = base.crop(window)
+    pasted = []
+    for box, patch in patches:
+        if patch.size != (box[2] - box[0], box[3] - box[1]):
+            patch = patch.resize((box[2] - box[0], box[3] - box[1]), Image.Resampling.LANCZOS)
+        canvas.paste(patch.convert(base.mode), (box[0] - window[0], box[1] - window[1]), _seam_weights(box, pasted))
+        pasted.append(box)
+    weights = None
+    if region is not None:
+        weights = region.crop(window)
+        if feather:
+            weights = weights.filter(ImageFilter.GaussianBlur(feather))
+    result.paste(canvas, window[:2], weights)
+    return result
+
+
+def generate_tiled(prompt, image, mask=None, size="1024x1024", n=1, quality="high", use_cache=True,
+                   overlap=TILE_OVERLAP, parallelism=FANOUT_PARALLELISM):
+    """Edit an image at its full resolution by sending model-sized crops and blending them back.
+
+    With a mask, only tiles around the mask's bounding box are sent, and
+    pixels outside the mask are kept from the original. Without one the
+    whole image is tiled. Crops are sent at their native resolution, in
+    parallel, through generate_image, so they are cached and traced like
+    any edit. Where the image is narrower or shorter than size, crops are
+    padded to size and the padding is cut off the results, so they are not
+    stretched. A tile that fails keeps the original pixels and is reported
+    in item_errors. Returns n full-resolution results.
+    """
+    metrics = get_metrics()
+    start = time.perf_counter()
+    if not needs_tiles(image.size, size):
+        raise GenerationError(f"The image fits in one {size} tile, so there is no extra resolution to keep; "
+                              "edit it without tiles.")
+    tile_size = parse_size(size)
+    with image.open() as img:
+        base = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    region = bbox = None
+    if mask is not None:
+        region = edit_region(mask, base.size)
+        bbox = region.getbbox()
+        if bbox is None:
+            raise GenerationError("The mask does not mark any area to change.")
+        bbox = (
+            max(0, bbox[0] - TILE_CONTEXT), max(0, bbox[1] - TILE_CONTEXT),
+            min(base.width, bbox[2] + TILE_CONTEXT), min(base.height, bbox[3] + TILE_CONTEXT),
+        )
+
+    # Tiles whose crop of the mask marks nothing to change are not sent
+    stem = image.name.rsplit(".", 1)[0] if "." in image.name else image.name
+    tiles = []
+    for box in plan_tiles(base.size, tile_size, bbox, overlap):
+        tile_mask = None
+        if region is not None:
+            alpha = ImageChops.invert(region.crop(box))
+            if alpha.getextrema() == (255, 255):
+                continue
+            # Padding is opaque in the mask, so the model leaves it alone
+            alpha = _pad(alpha, tile_size, fill=255)
+            tile_mask = _encode(Image.merge("LA", (Image.new("L", alpha.size, 0), alpha)), "mask.png",
+                                compress_level=MASK_COMPRESS_LEVEL)
+        tile = _encode(_pad(base.crop(box), tile_size), f"{stem}-{box[0]}-{box[1]}.png",
+                       compress_level=PNG_COMPRESS_LEVEL)
+        tiles.append((box, tile, tile_mask))
+
+    item_errors = []
+    tile_results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(tiles))),
+                            thread_name_prefix="imagegen-tile") as pool:
+        futures = [
+            (box, pool.submit(generate_image, prompt, tile, tile_mask, size, n, quality, use_cache))
+            for box, tile, tile_mask in tiles
+        ]
+        for box, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                item_errors.append(f"Tile at {box[:2]} failed: {str(e)}")
+                continue
+            item_errors.extend(result.item_errors)
+            tile_results[box] = result
+    if not tile_results:
+        raise GenerationError("All tiles failed. " + " ".join(item_errors))
+
+    images = []
+    for index in range(n):
+        patches = []
+        for box, result in tile_results.items():
+            if index < len(result.images):
+                content_size = (box[2] - box[0], box[3] - box[1])
+                patches.append((box, _unpad(result.images[index].image, content_size, tile_size)))
+            else:
+                item_errors.append(f"Tile at {box[:2]} returned no image for result {index + 1}")
+        # A tile that returned fewer results than asked for keeps the original pixels there
+        stitched = stitch(base, patches, region)
+        buf = io.BytesIO()
+        stitched.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+        images.append(GeneratedImage(buf.getvalue()))
+
+    metrics.inc("tiled_edits_total")
+    metrics.observe("tiles_per_edit", len(tiles))
+    metrics.observe("tiled_edit_wall_seconds", time.perf_counter() - start)
+    cached = all(result.cached for result in tile_results.values())
+    return GenerationResult(images, item_errors, cached=cached and not item_errors)
@@ -0,0 +1,123 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Connection pool and timeout settings, tunable per deployment
+HTTP_POOL_SIZE = int(os.getenv("IMAGEGEN_HTTP_POOL_SIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("IMAGEGEN_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("IMAGEGEN_HTTP_READ_TIMEOUT", "300"))
+
+
+class _ConnectionCounters:
+    """Thread-safe tally of connection checkouts from the pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def checkout(self, already_connected):
+        with self._lock:
+            if already_connected:
+                self.reused += 1
+            else:
+                self.opened += 1
+
+
+def _counting_pool(base, counters):
+    """Subclass a urllib3 pool so every connection checkout is recorded as new or reused"""
+
+    class CountingPool(base):
+        # _get_conn is private to urllib3, but it is the one place every checkout passes
+        # through; it has kept this signature in both 1.26 and 2.x
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout=timeout)
+            # Idle pooled connections are still open; new or reset ones connect on first use.
+            # urllib3 1.26 connections have no is_connected, only a socket once connected.
+            counters.checkout(getattr(conn, "is_connected", conn.sock is not None))
+            return conn
+
+    return CountingPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, counters, **kwargs):
+        self._counters = counters
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self._counters),
+            "https": _counting_pool(HTTPSConnectionPool, self._counters),
+        }
+
+
+class Transport:
+    """A pooled, keep-alive HTTP session shared by every request the app makes.
+
+    All API calls and result downloads go through one requests.Session so TLS
+    connections to the Azure endpoint are reused instead of being set up per
+    call. stats() reports how many connection checkouts opened a new
+    connection and how many reused an idle keep-alive one.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self._connections = _ConnectionCounters()
+        self._adapter = _CountingAdapter(self._connections, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self._lock = threading.Lock()
+        self._requests_sent = 0
+        self._requests_failed = 0
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self._requests_sent += 1
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._requests_failed += 1
+            raise
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """Return request and connection counters for the pool"""
+        with self._lock:
+            sent, failed = self._requests_sent, self._requests_failed
+        return {
+            "requests": sent,
+            "requests_failed": failed,
+            "connections_opened": self._connections.opened,
+            "connections_reused": self._connections.reused,
+            "pool_size": self.pool_size,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Return the process-wide shared transport, creating it on first use"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = Transport()
+    return _transport
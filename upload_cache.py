@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from generation import MaskError, load_mask
+from image_input import ImageInput
+from image_workers import get_image_executor
+from preflight import preflight
+from responses import PREVIEW_MAX_SIDE, encode_preview
+
+# Memory each session may hold in prepared uploads, previews and payloads;
+# 0 disables the cache so every rerun prepares its inputs again
+UPLOAD_CACHE_MAX_BYTES = int(float(os.getenv("IMAGEGEN_UPLOAD_CACHE_MB", "64")) * 1024 * 1024)
+
+
+def upload_key(file_id, data):
+    """Identify an upload by its uploader file id and a hash of its contents"""
+    return file_id, hashlib.sha256(data).hexdigest()
+
+
+class PreparedUpload:
+    """An uploaded image read once: its ImageInput with the header parsed, and display bytes"""
+
+    def __init__(self, key, image, preview):
+        self.key = key
+        self.image = image
+        self.preview = preview
+
+    @property
+    def size(self):
+        return self.image.size
+
+    def nbytes(self):
+        return len(self.image.data) + len(self.preview)
+
+
+class PreparedMask:
+    """A mask validated against its image once: the processed ImageInput, or why it was rejected"""
+
+    def __init__(self, key, mask=None, error=None):
+        self.key = key
+        self.mask = mask
+        self.error = error
+        # The mask preview is the processed PNG itself, kept as bytes for st.image
+        self.preview = bytes(mask.data) if mask is not None else b""
+
+    @property
+    def size(self):
+        return self.mask.size
+
+    def nbytes(self):
+        return len(self.preview) + (len(self.mask.data) if self.mask is not None else 0)
+
+
+def _preview(image, max_side=PREVIEW_MAX_SIDE):
+    """Downscaled display bytes for an upload; small PNGs and JPEGs are shown as they are"""
+    width, height = image.size
+    if max(width, height) <= max_side and image.format in ("PNG", "JPEG"):
+        return bytes(image.data)
+    return get_image_executor().run(encode_preview, image.data, max_side)
+
+
+class UploadCache:
+    """Per-session LRU of prepared uploads, bounded by the bytes its entries hold.
+
+    Keeps what a rerun would otherwise redo: the parsed upload and its
+    preview, the processed mask, and the payload fitted to each image size.
+    One instance lives in each session's state, so sessions never share or
+    evict each other's entries.
+    """
+
+    def __init__(self, max_bytes=UPLOAD_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_or_build(self, key, build, nbytes):
+        """Return the entry for key, calling build() on a miss; nbytes(value) gives its memory cost"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return self._entries[key][0]
+            self.counters["misses"] += 1
+        value = build()
+        size = nbytes(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.counters["evictions"] += 1
+        return value
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+
+    def image(self, file_id, data, name):
+        """The PreparedUpload for an uploaded image"""
+        key = upload_key(file_id, data)
+
+        def build():
+            image = ImageInput(data, name)
+            return PreparedUpload(key, image, _preview(image))
+
+        return self.get_or_build(("image",) + key, build, PreparedUpload.nbytes)
+
+    def mask(self, file_id, data, image):
+        """The PreparedMask for an uploaded mask, binarized and resized to the PreparedUpload image"""
+        # A mask is prepared against one image, so a new image means a new entry
+        key = upload_key(file_id, data) + image.key
+
+        def build():
+            try:
+                return PreparedMask(key, load_mask(memoryview(data), image.size))
+            except MaskError as e:
+                return PreparedMask(key, error=str(e))
+
+        return self.get_or_build(("mask",) + key, build, PreparedMask.nbytes)
+
+    def payload(self, image, mask, size):
+        """(image, mask) ImageInputs fitted to size, ready for the edits endpoint.
+
+        mask is a PreparedMask or None; the result passes through pre-flight
+        again unchanged, so fan-out variations and repeated Transform clicks
+        do not resample the upload each time.
+        """
+        def build():
+            return preflight(image.image, mask.mask if mask is not None else None, size)
+
+        def nbytes(value):
+            fitted, fitted_mask = value
+            # An upload that needed no fitting is the same buffer the image entry already counts
+            own = len(fitted.data) if fitted is not image.image else 0
+            return own + (len(fitted_mask.data) if fitted_mask is not None else 0)
+
+        key = ("payload", size) + image.key + (mask.key if mask is not None else ())
+        return self.get_or_build(key, build, nbytes)